@@ -0,0 +1,230 @@
+# -- coding: utf-8 --
+"""
+clara.py — sampling-based k-medoids on WMFD without the n×n matrix
+
+CLARA (Kaufman & Rousseeuw, 1990): PAM on a random sample of s trees
+(s × s WMFD only), then every tree is assigned to the nearest of the k
+sample medoids (n × k WMFD rows, computed on demand). The medoid set with
+the lowest total cost over all n trees wins. As in FastCLARA (Schubert &
+Rousseeuw), every new sample contains the current best medoids, so PAM
+on it can keep them when nothing better is found, and the default sample
+is 80 + 4k trees (instead of the original 40 + 2k).
+
+Optional CLARANS-style refinement on the full set (Ng & Han, 2002):
+random (medoid, non-medoid) swaps, each costing one WMFD column (n values),
+are scored from the nearest / second nearest medoid caches (as in
+FastPAM1) and applied when they lower the cost; the search stops after
+`n_local` consecutive failures.
+
+Memory is O(s² + n·k) and the number of WMFD evaluations about
+n_samples · s² + (#distinct medoids + n_local) · n, instead of n²/2 for the
+dense path (step1c_clustering_kmedoids / pam_engine).
+
+clara(dist, n, k, ...) only needs a callable dist(rows, cols) -> array,
+so it runs on WMFD (WMFDRows, packed features) as well as on a dense
+matrix (dense_rows(D)) for comparisons with pam_engine.fastpam.
+
+CLI
+---
+    python clara.py --in_csv trees.csv --k 5 [--samples 5] [--sample_size 100]
+        [--local 200] [--seed 0] [--labels labels.csv] [--out_dir DIR]
+"""
+
+import os
+import argparse
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+import pam_engine
+import wmfd_kernel
+
+_TOL = 1e-12
+
+
+@dataclass
+class CLARAResult:
+    medoids: np.ndarray          # (k,) tree indices
+    labels: np.ndarray           # (n,) 0..k-1, index into medoids
+    loss: float                  # Σ distance to the nearest medoid (all n trees)
+    dist: np.ndarray             # (n, k) distance of every tree to each medoid
+    n_samples: int               # CLARA samples drawn
+    n_swaps: int                 # CLARANS swaps applied
+    n_evals: int                 # distance evaluations
+
+
+# ---- distance providers ----
+
+class WMFDRows:
+    """dist(rows, cols) on packed WMFD features (features packed once)."""
+
+    def __init__(self, feats, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+                 use_weight: bool = True, normalize: bool = True):
+        if normalize:
+            L1, L2, L3, L4, L5 = wmfd_kernel.normalize_lambdas(L1, L2, L3, L4, L5)
+        self.lambdas = (L1, L2, L3, L4, L5)
+        self.use_weight = use_weight
+        self.fm = feats if isinstance(feats, wmfd_kernel.FeatureMatrices) \
+            else wmfd_kernel.pack_features(list(feats))
+        self.n = self.fm.n_trees
+
+    def __call__(self, rows, cols) -> np.ndarray:
+        return wmfd_kernel.wmfd_cross(self.fm, rows, cols, *self.lambdas, use_weight=self.use_weight)
+
+
+def dense_rows(D) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+    """dist(rows, cols) reading a precomputed matrix."""
+    D = np.asarray(D, dtype=float)
+    return lambda rows, cols: D[np.ix_(rows, cols)]
+
+
+# ---- CLARA ----
+
+def _columns(dist, n: int, medoids: np.ndarray, cache: Dict[int, np.ndarray]) -> np.ndarray:
+    """(n, k) distances to the medoids; columns already seen come from cache."""
+    new = [int(m) for m in medoids if int(m) not in cache]
+    if new:
+        C = dist(np.arange(n), np.asarray(new, dtype=np.intp))
+        for j, m in enumerate(new):
+            cache[m] = C[:, j]
+    return np.column_stack([cache[int(m)] for m in medoids])
+
+
+def _sample(rng, n: int, size: int, keep: Optional[np.ndarray]) -> np.ndarray:
+    if keep is None:
+        return np.sort(rng.choice(n, size=size, replace=False))
+    rest = np.setdiff1d(np.arange(n), keep)
+    extra = rng.choice(rest, size=size - keep.size, replace=False)
+    return np.sort(np.concatenate([keep, extra])).astype(np.intp)
+
+
+def _clarans(dist, n: int, medoids: np.ndarray, Dm: np.ndarray, n_local: int, rng):
+    """Randomized swaps on the full set; returns (medoids, Dm, n_swaps)."""
+    k = medoids.size
+    is_med = np.zeros(n, dtype=bool)
+    is_med[medoids] = True
+    swaps = fails = 0
+    near, d1, d2 = pam_engine._nearest_two(Dm, np.arange(k))
+    while fails < n_local and k < n:
+        i = int(rng.integers(k))
+        x = int(rng.choice(np.flatnonzero(~is_med)))
+        dx = dist(np.arange(n), np.asarray([x]))[:, 0]
+        # loss after swapping medoid i for x, from the nearest / second nearest caches
+        own = near == i
+        closer = dx < d1
+        new = np.where(closer, dx, np.where(own, np.minimum(dx, d2), d1))
+        delta = float(new.sum() - d1.sum())
+        if delta < -_TOL:
+            is_med[medoids[i]] = False
+            medoids[i] = x
+            is_med[x] = True
+            Dm[:, i] = dx
+            near, d1, d2 = pam_engine._nearest_two(Dm, np.arange(k))
+            swaps += 1
+            fails = 0
+        else:
+            fails += 1
+    return medoids, Dm, swaps
+
+
+def clara(dist, n: int, k: int, n_samples: int = 5, sample_size: Optional[int] = None,
+          seed: Optional[int] = 0, max_iter: int = 100, method: str = "fastpam1",
+          n_local: int = 0) -> CLARAResult:
+    """
+    k-medoids from n_samples PAM runs on samples of sample_size trees
+    (default 80 + 4k), each scored on all n trees; n_local > 0 adds the
+    CLARANS refinement. dist(rows, cols) returns the distance block.
+    """
+    if not (1 <= k <= n):
+        raise ValueError(f"k must be in [1, {n}], got {k}")
+    s = min(n, max(k, sample_size or 80 + 4 * k))
+    rng = np.random.default_rng(seed)
+    evals = [0]
+
+    def counted(rows, cols):
+        out = np.asarray(dist(rows, cols), dtype=float)
+        evals[0] += out.size
+        return out
+
+    cache: Dict[int, np.ndarray] = {}
+
+    best_meds, best_Dm, best_loss = None, None, float("inf")
+    n_samples = max(1, n_samples) if s < n else 1
+    for _ in range(n_samples):
+        idx = _sample(rng, n, s, best_meds)
+        Ds = counted(idx, idx)
+        Ds = 0.5 * (Ds + Ds.T)
+        np.fill_diagonal(Ds, 0.0)
+        res = pam_engine.fastpam(Ds, k, init="build", max_iter=max_iter, method=method)
+        meds = idx[np.asarray(res.medoids, dtype=np.intp)]
+        Dm = _columns(counted, n, meds, cache)
+        loss = float(Dm.min(axis=1).sum())
+        if loss < best_loss - _TOL:
+            best_meds, best_Dm, best_loss = meds.copy(), Dm, loss
+
+    swaps = 0
+    if n_local > 0:
+        best_meds, best_Dm, swaps = _clarans(counted, n, best_meds, best_Dm.copy(), n_local, rng)
+
+    labels = np.argmin(best_Dm, axis=1).astype(int)
+    labels[best_meds] = np.arange(k)  # a medoid always sits in its own cluster
+    loss = float(best_Dm[np.arange(n), labels].sum())
+    return CLARAResult(best_meds.astype(int), labels, loss, best_Dm, n_samples, swaps, evals[0])
+
+
+def clara_wmfd(feats, k: int, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+               use_weight: bool = True, normalize: bool = True, **kwargs) -> CLARAResult:
+    """clara on precomputed WMFD feature tuples (lambdas as in step1b)."""
+    rows = WMFDRows(feats, L1, L2, L3, L4, L5, use_weight=use_weight, normalize=normalize)
+    return clara(rows, rows.n, k, **kwargs)
+
+
+# ---- CLI ----
+
+def main():
+    ap = argparse.ArgumentParser(description="CLARA / CLARANS k-medoids on WMFD (no n×n matrix)")
+    ap.add_argument("--in_csv", required=True, help="trees.csv (or any .txt/.csv, optionally gzipped)")
+    ap.add_argument("--k", type=int, required=True)
+    ap.add_argument("--samples", type=int, default=5, help="échantillons CLARA")
+    ap.add_argument("--sample_size", type=int, default=None, help="taille d'échantillon (défaut 80+4k)")
+    ap.add_argument("--local", type=int, default=0, help="CLARANS: échecs consécutifs avant arrêt (0 = off)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--labels", default=None, help="labels.csv (id,true_cluster) pour l'ARI")
+    ap.add_argument("--out_dir", default=None, help="dossier de sortie (défaut: à côté de --in_csv)")
+    args = ap.parse_args()
+
+    import newick_io
+    import feature_cache
+    import step1b_metric_wmfd as s1b
+    import step1c_clustering_kmedoids as s1c
+
+    ids, newicks = [], []
+    for tid, nw in newick_io.iter_newick_records(args.in_csv):
+        ids.append(tid)
+        newicks.append(nw)
+    print(f"[LOAD] {len(ids)} trees from {args.in_csv}")
+    feats = feature_cache.cached_features(newicks, s1b.precompute_features, "step1b", labels=ids)
+
+    res = clara_wmfd(feats, args.k, n_samples=args.samples, sample_size=args.sample_size,
+                     seed=args.seed, n_local=args.local)
+    n = len(ids)
+    print(f"[CLARA] k={args.k} loss={res.loss:.6f} swaps={res.n_swaps} "
+          f"WMFD evaluations={res.n_evals} ({res.n_evals / max(n * (n - 1) / 2, 1):.1%} of the pairs)")
+
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.in_csv))
+    os.makedirs(out_dir, exist_ok=True)
+    pred = (res.labels + 1).tolist()
+    s1c.write_clusters(os.path.join(out_dir, "clusters_pred.csv"), ids, pred)
+    s1c.write_medoids(os.path.join(out_dir, "medoids.csv"), res.medoids.tolist(), ids)
+    ari = None
+    if args.labels:
+        ari = s1c.adjusted_rand_index(s1c.read_true_labels(args.labels, ids), pred)
+        print(f"[ARI] {ari:.4f}")
+    s1c.write_metrics(os.path.join(out_dir, "metrics.csv"), args.k, res.loss,
+                      res.n_swaps, res.n_samples, args.seed, ari)
+    print(f"[OK] {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
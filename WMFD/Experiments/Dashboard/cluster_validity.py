@@ -0,0 +1,107 @@
+# -- coding: utf-8 --
+"""
+cluster_validity.py — Calinski–Harabasz / Davies–Bouldin on a distance matrix
+
+Medoid adaptation of both indices, read straight from the precomputed WMFD
+matrix in O(n) per labelling (plus O(n²) once for the global medoid), so k
+selection no longer needs a Euclidean embedding:
+
+    within  = Σ_i D[i, medoid(label_i)]²
+    total   = Σ_i D[i, g]²                  g = medoid of the whole set
+    CH      = ((total - within) / (k - 1)) / (within / (n - k))
+
+    S_c     = mean_{i in c} D[i, medoid_c]
+    DB      = mean_c max_{c'≠c} (S_c + S_c') / D[medoid_c, medoid_c']
+
+Same definitions as step1c_all_runs (which now delegates here), labels are
+0..k-1 and medoids[c] is the medoid of cluster c.
+
+landmark_mds(D) is a cheap replacement for sklearn MDS when coordinates are
+really needed: classical MDS on m max-min landmarks, the other points placed
+by distance triangulation (de Silva & Tenenbaum), O(n·m) instead of SMACOF.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+def global_medoid(D: np.ndarray) -> int:
+    """Index with the smallest distance sum (compute once per matrix)."""
+    return int(np.argmin(np.asarray(D, dtype=float).sum(axis=1)))
+
+
+def _sizes_ok(labels: np.ndarray, k: int) -> bool:
+    return k >= 2 and np.all(np.bincount(labels, minlength=k) > 0)
+
+
+def ch_medoids(D: np.ndarray, labels: Sequence[int], medoids: Sequence[int],
+               center: Optional[int] = None) -> float:
+    D = np.asarray(D, dtype=float)
+    labs = np.asarray(labels, dtype=np.intp)
+    meds = np.asarray(medoids, dtype=np.intp)
+    n = D.shape[0]
+    k = len(np.unique(labs))
+    if k < 2 or n <= k or not _sizes_ok(labs, k):
+        return float("nan")
+    within = float(np.sum(D[np.arange(n), meds[labs]] ** 2))
+    g = global_medoid(D) if center is None else int(center)
+    total = float(np.sum(D[:, g] ** 2))
+    between = max(total - within, 0.0)
+    return (between / (k - 1)) / (within / (n - k)) if within > 0 else float("inf")
+
+
+def db_medoids(D: np.ndarray, labels: Sequence[int], medoids: Sequence[int]) -> float:
+    D = np.asarray(D, dtype=float)
+    labs = np.asarray(labels, dtype=np.intp)
+    meds = np.asarray(medoids, dtype=np.intp)
+    k = len(np.unique(labs))
+    if k < 2 or not _sizes_ok(labs, k):
+        return float("nan")
+    counts = np.bincount(labs, minlength=k)
+    S = np.bincount(labs, weights=D[np.arange(D.shape[0]), meds[labs]], minlength=k) / counts
+    M = D[np.ix_(meds[:k], meds[:k])]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        R = np.where(M > 0, (S[:, None] + S[None, :]) / M, np.inf)
+    np.fill_diagonal(R, 0.0)
+    return float(np.mean(R.max(axis=1)))
+
+
+# ---- landmark MDS ----
+
+def maxmin_landmarks(D: np.ndarray, m: int, seed: Optional[int] = 0) -> np.ndarray:
+    """m landmarks: a random start, then repeatedly the point farthest from the set."""
+    n = D.shape[0]
+    m = min(max(m, 1), n)
+    first = int(np.random.default_rng(seed).integers(n))
+    idx = [first]
+    dmin = D[first].astype(float).copy()
+    for _ in range(m - 1):
+        j = int(np.argmax(dmin))
+        idx.append(j)
+        np.minimum(dmin, D[j], out=dmin)
+    return np.asarray(idx, dtype=np.intp)
+
+
+def landmark_mds(D: np.ndarray, n_components: int = 4, n_landmarks: Optional[int] = None,
+                 seed: Optional[int] = 0) -> np.ndarray:
+    """(n, n_components) coordinates; only the n × m landmark columns of D are read."""
+    D = np.asarray(D, dtype=float)
+    n = D.shape[0]
+    m = n_landmarks or min(n, max(10 * n_components, 100))
+    L = maxmin_landmarks(D, m, seed)
+    m = L.size
+    delta = D[np.ix_(L, L)] ** 2
+    J = np.eye(m) - 1.0 / m
+    B = -0.5 * J @ delta @ J
+    w, V = np.linalg.eigh(B)
+    order = np.argsort(w)[::-1][:n_components]
+    w, V = w[order], V[:, order]
+    keep = w > 1e-12
+    w, V = w[keep], V[:, keep]
+    pinv = V / np.sqrt(w)                      # (m, d)
+    mean_delta = delta.mean(axis=1)            # (m,)
+    X = -0.5 * ((D[:, L] ** 2) - mean_delta[None, :]) @ pinv
+    if X.shape[1] < n_components:
+        X = np.hstack([X, np.zeros((n, n_components - X.shape[1]))])
+    return X
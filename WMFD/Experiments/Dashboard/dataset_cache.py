@@ -0,0 +1,98 @@
+# -- coding: utf-8 --
+"""
+dataset_cache.py — on-disk cache of generated tree sets
+
+gptree_cluster_refined.generate_clusters is a rejection sampler: each
+accepted tree may cost up to max_tries_per_tree simulated candidates. Its
+output only depends on the generator parameters and the seed, so grid
+cells that share them (other metric, other --wmfd_weights, other noise
+level — see seeding.py) get the stored dataset instead of regenerating it.
+
+Keys are content hashes of
+
+    GENERATOR_VERSION + sorted (name, value) generator parameters
+
+and values compact records (cluster, tree_id, newick per line, zlib
+compressed), kept in the same SQLite key -> blob store with an LRU size
+limit as feature_cache.FeatureCache, in a separate file.
+
+Settings (environment)
+----------------------
+    WMFD_DATASET_CACHE      path of the SQLite file, or "off" to disable
+                            (default: ~/.cache/wmfd/datasets.sqlite)
+    WMFD_DATASET_CACHE_MB   size limit in MB (default: 1024)
+"""
+
+import os
+import zlib
+import sqlite3
+import hashlib
+from typing import Callable, List, Optional, Tuple
+
+from feature_cache import FeatureCache
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "wmfd", "datasets.sqlite")
+DEFAULT_MAX_MB = 1024
+
+Row = Tuple[int, int, str]
+
+
+# ----------------------------- keys / records -----------------------------
+
+def dataset_key(version, **params) -> str:
+    h = hashlib.sha1()
+    h.update(f"gen\x00{version}".encode("utf-8"))
+    for name in sorted(params):
+        h.update(f"\x00{name}={params[name]!r}".encode("utf-8"))
+    return h.hexdigest()
+
+def encode_rows(rows: List[Row]) -> bytes:
+    text = "\n".join(f"{int(c)}\t{int(t)}\t{nw}" for c, t, nw in rows)
+    return zlib.compress(text.encode("utf-8"), 6)
+
+def decode_rows(b: bytes) -> List[Row]:
+    out: List[Row] = []
+    for line in zlib.decompress(b).decode("utf-8").split("\n"):
+        if line:
+            c, t, nw = line.split("\t", 2)
+            out.append((int(c), int(t), nw))
+    return out
+
+
+# ----------------------------- cache -----------------------------
+
+def open_default() -> Optional[FeatureCache]:
+    """Store configured by WMFD_DATASET_CACHE / WMFD_DATASET_CACHE_MB (None if off)."""
+    path = os.environ.get("WMFD_DATASET_CACHE", DEFAULT_PATH)
+    if path.strip().lower() in ("", "0", "off", "none"):
+        return None
+    mb = float(os.environ.get("WMFD_DATASET_CACHE_MB", DEFAULT_MAX_MB))
+    try:
+        return FeatureCache(path, int(mb * (1 << 20)))
+    except (OSError, sqlite3.Error) as e:
+        print(f"[WARN] dataset cache disabled ({path}): {e}")
+        return None
+
+def cached_dataset(generate: Callable[..., List[Row]], version, cache: Optional[FeatureCache] = None,
+                   **params) -> Tuple[List[Row], bool]:
+    """
+    (generate(**params), hit): the stored rows when this (version, params)
+    was generated before, else a fresh run that is written back.
+    With cache=None the default store (open_default) is used for this call.
+    """
+    own = cache is None
+    if own:
+        cache = open_default()
+    try:
+        if cache is None:
+            return generate(**params), False
+        key = dataset_key(version, **params)
+        blob = cache.get_many([key]).get(key)
+        if blob is not None:
+            return decode_rows(blob), True
+        rows = generate(**params)
+        cache.put_many({key: encode_rows(rows)})
+        return rows, False
+    finally:
+        if own and cache is not None:
+            cache.close()
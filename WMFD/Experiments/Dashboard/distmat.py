@@ -0,0 +1,247 @@
+# -- coding: utf-8 --
+"""
+distmat.py — binary condensed distance matrix (.dmat)
+
+Container written by the metric stage (step1b) and memory-mapped by the
+clustering stages (step1c_*), instead of the n×n "%.8f" matrix.csv plus
+pairs.csv text files.
+
+Layout
+------
+    8 bytes   magic  b"WMFDDM01"
+    4 bytes   uint32 little-endian: length of the JSON header
+    ...       JSON header (utf-8): {"n", "dtype", "ids", "meta"}
+    ...       zero padding up to a 64-byte boundary
+    ...       condensed upper triangle, row-major (i<j), n*(n-1)/2 values,
+              little-endian float32 or float64
+
+The condensed order is the one of scipy.spatial.distance.squareform:
+entry (i, j), i<j, sits at  n*i - i*(i+1)/2 + (j - i - 1).
+
+CLI
+---
+    python distmat.py to-bin  trees_wmfd_matrix.csv trees_wmfd.dmat [--float32]
+    python distmat.py to-csv  trees_wmfd.dmat trees_wmfd_matrix.csv [--pairs trees_wmfd_pairs.csv]
+"""
+
+import os
+import csv
+import json
+import struct
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"WMFDDM01"
+EXT = ".dmat"
+_ALIGN = 64
+_DTYPES = {"float32": "<f4", "float64": "<f8"}
+
+
+# ----------------------------- helpers -----------------------------
+
+def condensed_index(n: int, i: int, j: int) -> int:
+    """Position of (i, j), i != j, in the condensed vector."""
+    if i > j:
+        i, j = j, i
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+def is_dmat(path: str) -> bool:
+    """True if `path` starts with the .dmat magic (extension is not trusted)."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+# ----------------------------- container -----------------------------
+
+class CondensedMatrix:
+    """Read-only view on a .dmat file; `data` is a numpy memmap."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a {EXT} file: {path}")
+            (hlen,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(hlen).decode("utf-8"))
+        self.path = path
+        self.n: int = int(header["n"])
+        self.dtype: str = header["dtype"]
+        self.ids: List[str] = list(header["ids"])
+        self.meta: Dict = header.get("meta") or {}
+        offset = _data_offset(hlen)
+        m = self.n * (self.n - 1) // 2
+        if m:
+            self.data = np.memmap(path, dtype=_DTYPES[self.dtype], mode="r", offset=offset, shape=(m,))
+        else:
+            self.data = np.zeros(0, dtype=_DTYPES[self.dtype])
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, ij: Tuple[int, int]) -> float:
+        i, j = ij
+        if i == j:
+            return 0.0
+        return float(self.data[condensed_index(self.n, i, j)])
+
+    def row(self, i: int) -> np.ndarray:
+        """Distances from item i to every item (float64, length n)."""
+        n = self.n
+        out = np.zeros(n, dtype=float)
+        # column i of the upper triangle (rows k < i)
+        if i > 0:
+            k = np.arange(i)
+            out[:i] = self.data[n * k - k * (k + 1) // 2 + (i - k - 1)]
+        start = condensed_index(n, i, i + 1) if i + 1 < n else 0
+        out[i + 1:] = self.data[start:start + (n - i - 1)]
+        return out
+
+    def to_square(self, dtype=float) -> np.ndarray:
+        """Dense symmetric n×n matrix with a zero diagonal."""
+        n = self.n
+        D = np.zeros((n, n), dtype=dtype)
+        pos = 0
+        for i in range(n - 1):
+            seg = self.data[pos:pos + (n - i - 1)]
+            D[i, i + 1:] = seg
+            D[i + 1:, i] = seg
+            pos += n - i - 1
+        return D
+
+
+def open_dmat(path: str) -> CondensedMatrix:
+    return CondensedMatrix(path)
+
+def _data_offset(hlen: int) -> int:
+    head = len(MAGIC) + 4 + hlen
+    return (head + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def write_dmat(path: str, ids: List[str], D, dtype: str = "float64",
+               meta: Optional[Dict] = None) -> str:
+    """
+    Write a square (n×n) or condensed (n*(n-1)/2) matrix to `path`.
+    Square input is read from its upper triangle. Written atomically.
+    """
+    if dtype not in _DTYPES:
+        raise ValueError(f"dtype must be one of {sorted(_DTYPES)}")
+    ids = [str(x) for x in ids]
+    n = len(ids)
+    D = np.asarray(D)
+    m = n * (n - 1) // 2
+    if D.ndim == 1 and D.shape[0] != m:
+        raise ValueError(f"condensed length {D.shape[0]} != n*(n-1)/2 = {m}")
+    if D.ndim == 2 and D.shape != (n, n):
+        raise ValueError(f"matrix shape {D.shape} != ({n}, {n})")
+
+    header = json.dumps({"n": n, "dtype": dtype, "ids": ids, "meta": meta or {}},
+                        ensure_ascii=False).encode("utf-8")
+    pad = _data_offset(len(header)) - (len(MAGIC) + 4 + len(header))
+
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * pad)
+        if D.ndim == 1:
+            f.write(D.astype(_DTYPES[dtype], copy=False).tobytes())
+        else:
+            for i in range(n - 1):
+                f.write(D[i, i + 1:].astype(_DTYPES[dtype], copy=False).tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+# ----------------------------- CSV conversion -----------------------------
+
+def read_matrix_csv(path: str) -> Tuple[List[str], np.ndarray]:
+    """Read the `id,<ids...>` square CSV layout (symmetrized, diag = 0)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        raise ValueError(f"Empty matrix file: {path}")
+    ids = [h.strip() for h in rows[0][1:]]
+    n = len(ids)
+    D = np.zeros((n, n), dtype=float)
+    for i, row in enumerate(rows[1:n + 1]):
+        vals = row[1:]
+        if len(vals) != n:
+            raise ValueError(f"{os.path.basename(path)} row {i+1}: expected {n} values, got {len(vals)}")
+        D[i, :] = [float((v or "0").strip().replace(",", ".") or 0.0) for v in vals]
+    D = 0.5 * (D + D.T)
+    np.fill_diagonal(D, 0.0)
+    return ids, D
+
+def write_matrix_csv(path: str, ids: List[str], D) -> None:
+    """Square CSV in the step1b layout (`id` header, "%.8f" values)."""
+    n = len(ids)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id"] + list(ids))
+        for i in range(n):
+            w.writerow([ids[i]] + ["{:.8f}".format(v) for v in D[i]])
+
+def write_pairs_csv(path: str, ids: List[str], cm: CondensedMatrix) -> None:
+    n = len(ids)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id_i", "id_j", "dist"])
+        pos = 0
+        for i in range(n - 1):
+            seg = cm.data[pos:pos + (n - i - 1)]
+            for j, v in enumerate(seg, start=i + 1):
+                w.writerow([ids[i], ids[j], "{:.8f}".format(v)])
+            pos += n - i - 1
+
+def csv_to_dmat(csv_path: str, out_path: str, dtype: str = "float64",
+                meta: Optional[Dict] = None) -> str:
+    ids, D = read_matrix_csv(csv_path)
+    meta = dict(meta or {}, source=os.path.basename(csv_path))
+    return write_dmat(out_path, ids, D, dtype=dtype, meta=meta)
+
+def dmat_to_csv(dmat_path: str, out_matrix: str, out_pairs: Optional[str] = None) -> None:
+    cm = open_dmat(dmat_path)
+    write_matrix_csv(out_matrix, cm.ids, cm.to_square())
+    if out_pairs:
+        write_pairs_csv(out_pairs, cm.ids, cm)
+
+
+def read_distance_matrix_any(path: str) -> Tuple[List[str], np.ndarray]:
+    """(ids, dense float64 matrix) from either a .dmat or a square CSV."""
+    if is_dmat(path):
+        cm = open_dmat(path)
+        return cm.ids, cm.to_square()
+    return read_matrix_csv(path)
+
+
+# ----------------------------- CLI -----------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert between matrix CSV and binary .dmat")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("to-bin", help="matrix CSV -> .dmat")
+    a.add_argument("csv")
+    a.add_argument("out")
+    a.add_argument("--float32", action="store_true", help="store float32 (half the size)")
+    b = sub.add_parser("to-csv", help=".dmat -> matrix CSV (+ pairs CSV)")
+    b.add_argument("dmat")
+    b.add_argument("out")
+    b.add_argument("--pairs", default=None)
+    args = ap.parse_args()
+
+    if args.cmd == "to-bin":
+        csv_to_dmat(args.csv, args.out, dtype="float32" if args.float32 else "float64")
+        print(f"[OK] {args.csv} -> {args.out}")
+    else:
+        dmat_to_csv(args.dmat, args.out, args.pairs)
+        print(f"[OK] {args.dmat} -> {args.out}" + (f" (+ {args.pairs})" if args.pairs else ""))
+
+if __name__ == "__main__":
+    main()
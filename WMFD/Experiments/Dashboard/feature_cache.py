@@ -0,0 +1,200 @@
+# -- coding: utf-8 --
+"""
+feature_cache.py — on-disk cache of per-tree WMFD features
+
+precompute_features(nwk) parses the Newick string with ete3 and walks every
+leaf (BL, H, W, D) plus the split keys of the HD term. The same tree sets are
+re-read by every λ sweep / grid configuration, so the result is stored in a
+single SQLite file, content-addressed by
+
+    sha1(variant + FEATURE_VERSION + newick)
+
+where `variant` names the feature extractor (step1b parses W from "name@w",
+other scripts may not). A repeated tree is then loaded without any parsing.
+
+Entries are compact binary blobs (leaf names, a 4×L float64 block, the uint64
+split keys). The file is kept under a size limit by evicting the least
+recently used entries. Cached features come back with tree=None: neither
+wmfd_pair nor wmfd_kernel uses the ete3 object.
+
+Settings (environment)
+----------------------
+    WMFD_FEATURE_CACHE      path of the SQLite file, or "off" to disable
+                            (default: ~/.cache/wmfd/features.sqlite)
+    WMFD_FEATURE_CACHE_MB   size limit in MB (default: 512)
+"""
+
+import os
+import time
+import struct
+import sqlite3
+import hashlib
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Bump whenever a precompute_features changes what it returns.
+FEATURE_VERSION = 1
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "wmfd", "features.sqlite")
+DEFAULT_MAX_MB = 512
+
+_HEAD = struct.Struct("<III")   # n_leaves, n_splits, len(names blob)
+_SEP = "\x00"
+_CHUNK = 500                    # keys per SELECT (SQLite variable limit)
+
+
+# ----------------------------- keys / blobs -----------------------------
+
+def newick_key(nwk: str, variant: str) -> str:
+    h = hashlib.sha1()
+    h.update(f"{variant}\x00{FEATURE_VERSION}\x00".encode("utf-8"))
+    h.update(nwk.encode("utf-8"))
+    return h.hexdigest()
+
+def encode_features(f: tuple) -> bytes:
+    """(tree, BL, H, W, D, leaf_set, splits) -> bytes (the tree is dropped)."""
+    _t, bl, h, w, d, _leaf_set, splits = f
+    names = list(bl.keys())
+    vals = np.array([[bl[x], h[x], w[x], d[x]] for x in names], dtype="<f8").T
+    blob = _SEP.join(names).encode("utf-8")
+    splits = np.asarray(splits, dtype="<u8")
+    return b"".join((_HEAD.pack(len(names), splits.size, len(blob)), blob,
+                     np.ascontiguousarray(vals).tobytes(), splits.tobytes()))
+
+def decode_features(b: bytes) -> tuple:
+    n, m, nb = _HEAD.unpack_from(b, 0)
+    pos = _HEAD.size
+    names = b[pos:pos + nb].decode("utf-8").split(_SEP) if n else []
+    pos += nb
+    vals = np.frombuffer(b, dtype="<f8", count=4 * n, offset=pos).reshape(4, n)
+    pos += 8 * 4 * n
+    splits = np.frombuffer(b, dtype="<u8", count=m, offset=pos).astype(np.uint64)
+    bl, h, w, d = (dict(zip(names, row.tolist())) for row in vals)
+    return None, bl, h, w, d, set(names), splits
+
+
+# ----------------------------- cache -----------------------------
+
+class FeatureCache:
+    """SQLite key -> blob store with an LRU size limit."""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_MB << 20):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self.con = sqlite3.connect(path, timeout=60)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            " key TEXT PRIMARY KEY, data BLOB NOT NULL,"
+            " nbytes INTEGER NOT NULL, atime REAL NOT NULL)")
+        self.con.execute("CREATE INDEX IF NOT EXISTS features_atime ON features(atime)")
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """Blobs of the keys present; their access time is refreshed."""
+        uniq = list(dict.fromkeys(keys))
+        out: Dict[str, bytes] = {}
+        for a in range(0, len(uniq), _CHUNK):
+            part = uniq[a:a + _CHUNK]
+            q = "SELECT key, data FROM features WHERE key IN (%s)" % ",".join("?" * len(part))
+            out.update(self.con.execute(q, part).fetchall())
+        if out:
+            now = time.time()
+            with self.con:
+                self.con.executemany("UPDATE features SET atime=? WHERE key=?",
+                                     [(now, k) for k in out])
+        return out
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO features(key, data, nbytes, atime) VALUES (?,?,?,?)",
+                [(k, sqlite3.Binary(v), len(v), now) for k, v in items.items()])
+        self.evict()
+
+    def total_bytes(self) -> int:
+        return int(self.con.execute("SELECT COALESCE(SUM(nbytes), 0) FROM features").fetchone()[0])
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the total fits (down to 90 % of the limit)."""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        target = int(self.max_bytes * 0.9)
+        drop: List[str] = []
+        for key, nb in self.con.execute("SELECT key, nbytes FROM features ORDER BY atime"):
+            if total <= target:
+                break
+            drop.append(key)
+            total -= nb
+        with self.con:
+            self.con.executemany("DELETE FROM features WHERE key=?", [(k,) for k in drop])
+        return len(drop)
+
+
+def open_default() -> Optional[FeatureCache]:
+    """Cache configured by WMFD_FEATURE_CACHE / WMFD_FEATURE_CACHE_MB (None if off)."""
+    path = os.environ.get("WMFD_FEATURE_CACHE", DEFAULT_PATH)
+    if path.strip().lower() in ("", "0", "off", "none"):
+        return None
+    mb = float(os.environ.get("WMFD_FEATURE_CACHE_MB", DEFAULT_MAX_MB))
+    try:
+        return FeatureCache(path, int(mb * (1 << 20)))
+    except (OSError, sqlite3.Error) as e:
+        print(f"[WARN] feature cache disabled ({path}): {e}")
+        return None
+
+
+# ----------------------------- front end -----------------------------
+
+def cached_features(newicks: Sequence[str], compute: Callable[[str], tuple], variant: str,
+                    cache: Optional[FeatureCache] = None, labels: Optional[Sequence[str]] = None):
+    """
+    [compute(nwk) for nwk in newicks], served from the cache when possible.
+
+    Misses are computed once per distinct Newick string and written back.
+    A failing compute() raises ValueError naming the tree (labels[i] or its index).
+    With cache=None the default cache (open_default) is used for this call.
+    """
+    own = cache is None
+    if own:
+        cache = open_default()
+    try:
+        keys = [newick_key(nw, variant) for nw in newicks]
+        hit = cache.get_many(keys) if cache is not None else {}
+        feats: List[tuple] = [None] * len(newicks)
+        fresh: Dict[str, tuple] = {}
+        for i, (nw, k) in enumerate(zip(newicks, keys)):
+            if k in fresh:
+                feats[i] = fresh[k]
+            elif k in hit:
+                feats[i] = decode_features(hit[k])
+            else:
+                try:
+                    feats[i] = fresh[k] = compute(nw)
+                except Exception as e:
+                    who = labels[i] if labels is not None else i
+                    raise ValueError(f"Newick parse error for id={who}: {e}")
+        if cache is not None and fresh:
+            cache.put_many({k: encode_features(f) for k, f in fresh.items()})
+        return feats
+    finally:
+        if own and cache is not None:
+            cache.close()
@@ -3,8 +3,9 @@
 gptree_cluster_refined.py — (1a) generator aligned with loops (k, L, Ngen, plevel)
 
 - K=1 fast-path (no overlap constraint, never failure)
-- NO blocking timeout: no TimeoutError; we have a maximum number of tries per tree,
-  then fallback to the best candidate (closest to Plevel)
+- NO blocking timeout by default: we have a maximum number of tries per tree,
+  then fallback to the best candidate (closest to Plevel); an optional
+  timeout_s (0 = off) raises TimeoutError between two tries once exceeded
 - Progressive internal tolerance 
 - Avoids reusing the same species tree topology between clusters (k>=2)
 
@@ -16,8 +17,10 @@ import argparse
 import csv
 import random
 import sys
-from typing import List, Tuple, Set, FrozenSet
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Set, FrozenSet
 
+import numpy as np
 from ete3 import Tree
 import asymmetree.treeevolve as te
 from asymmetree.tools.PhyloTreeTools import to_newick
@@ -25,6 +28,10 @@ from asymmetree.tools.PhyloTreeTools import to_newick
 # ---- internal tolerance (not exposed) ----
 EPS_INTERNAL = 0.04  
 
+# Bump whenever generate_clusters changes what it returns for given arguments
+# (cached datasets, see dataset_cache.py, are keyed by it).
+GENERATOR_VERSION = 1
+
 # ---- validations -------------------------------------------------
 def validate_args(k: int, L: int, Ngen: int, plevel: float):
     if not (1 <= k <= 100):
@@ -67,6 +74,46 @@ def avg_overlap_with_cluster(candidate: Tree, cluster: List[Tree]) -> float:
     vals = [jaccard_leaf_overlap(candidate, t) for t in cluster]
     return sum(vals) / len(vals)
 
+class LeafOverlap:
+    """
+    Leaf sets of the accepted trees as a 0/1 matrix (trees × leaves) plus
+    their sizes. The mean Jaccard overlap of a candidate with all of them
+    (= avg_overlap_with_cluster) is one column gather:
+        inter_j = Σ_{l in cand} M[j, l],  union_j = |S_j| + |cand| - inter_j
+    instead of two get_leaf_names() calls and a set merge per accepted tree.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self.col: Dict[str, int] = {}
+        self.M = np.zeros((max(capacity, 1), 64), dtype=np.uint8)
+        self.sizes = np.zeros(max(capacity, 1), dtype=np.int64)
+        self.n = 0
+
+    def add(self, names: Iterable[str]):
+        leaves = set(names)
+        for x in leaves:
+            if x not in self.col:
+                self.col[x] = len(self.col)
+        rows, cols = self.M.shape
+        if self.n == rows or len(self.col) > cols:
+            M = np.zeros((2 * rows if self.n == rows else rows, max(cols, 2 * len(self.col))), dtype=np.uint8)
+            M[:rows, :cols] = self.M
+            self.M = M
+            self.sizes = np.concatenate([self.sizes, np.zeros(M.shape[0] - rows, dtype=np.int64)])
+        self.M[self.n, [self.col[x] for x in leaves]] = 1
+        self.sizes[self.n] = len(leaves)
+        self.n += 1
+
+    def mean_jaccard(self, names: Iterable[str]) -> float:
+        if self.n == 0:
+            return 1.0
+        leaves = set(names)
+        idx = [self.col[x] for x in leaves if x in self.col]
+        inter = self.M[:self.n, idx].sum(axis=1, dtype=np.int64)
+        union = self.sizes[:self.n] + len(leaves) - inter
+        jac = np.where(union > 0, inter / np.maximum(union, 1), 0.0)
+        return float(jac.mean())
+
 # ---- topological signatures (to avoid duplicates of S) ------
 def tree_topology_signature(ete_tree: Tree) -> Tuple[FrozenSet[str], FrozenSet[FrozenSet[str]]]:
     leafset = frozenset(ete_tree.get_leaf_names())
@@ -93,15 +140,21 @@ def build_cluster(
     hgt_rate: float,
     loss_rate: float,
     replace_prob: float,
+    deadline: Optional[float] = None,
 ) -> List[Tree]:
     """
     Construit un cluster de Ngen arbres.
-    
+    deadline: time.monotonic() limit (None = no limit), checked between tries.
     """
     cluster: List[Tree] = []
+    overlap = LeafOverlap(Ngen)  # leaf sets of the accepted trees
+
+    def accept(t: Tree):
+        cluster.append(t)
+        overlap.add(t.get_leaf_names())
 
     # 1st arbitrary tree
-    cluster.append(gptree_genetree(species_tree, hgt_rate, loss_rate, replace_prob))
+    accept(gptree_genetree(species_tree, hgt_rate, loss_rate, replace_prob))
 
     while len(cluster) < Ngen:
         accepted = False
@@ -109,15 +162,17 @@ def build_cluster(
         best_diff = 1e9
 
         for attempt in range(1, max_tries_per_tree + 1):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"generator timeout ({len(cluster)}/{Ngen} trees in the cluster)")
             cand = gptree_genetree(species_tree, hgt_rate, loss_rate, replace_prob)
-            ov = avg_overlap_with_cluster(cand, cluster)
+            ov = overlap.mean_jaccard(cand.get_leaf_names())
 
             # gradually widens the acceptance window
             widen = 0.01 * (attempt // 100)  # +0.01 every 100 tries
             eps_eff = EPS_INTERNAL + widen
 
             if (plevel - eps_eff) <= ov <= (plevel + eps_eff):
-                cluster.append(cand)
+                accept(cand)
                 accepted = True
                 break
 
@@ -128,10 +183,80 @@ def build_cluster(
 
         if not accepted:
             # fallback : we are still moving forward with the best candidate we met
-            cluster.append(best_tree if best_tree is not None else gptree_genetree(species_tree, hgt_rate, loss_rate, replace_prob))
+            accept(best_tree if best_tree is not None else gptree_genetree(species_tree, hgt_rate, loss_rate, replace_prob))
 
     return cluster
 
+# ---- whole dataset ------------------------------------------------
+def generate_clusters(
+    k: int,
+    L: int,
+    Ngen: int,
+    plevel: float,
+    seed: int = 0,
+    max_tries_per_tree: int = 2000,
+    hgt: float = 0.2,
+    loss: float = 0.2,
+    replace_prob: float = 0.9,
+    timeout_s: float = 0,
+) -> List[Tuple[int, int, str]]:
+    """
+    k clusters of Ngen trees as (cluster, tree_id, newick) rows, numbered
+    from 1 (the CSV written by main). Seeds Python's and NumPy's global
+    RNGs (both used by the simulator) with `seed`, so a given seed always
+    gives the same dataset. timeout_s > 0 bounds the whole run (TimeoutError).
+    """
+    validate_args(k, L, Ngen, plevel)
+    random.seed(seed or 0)
+    np.random.seed((seed or 0) & 0xFFFFFFFF)
+    deadline = time.monotonic() + timeout_s if timeout_s and timeout_s > 0 else None
+
+    # K=1 : fast-path simple, never failure, no overlap constraint
+    if k == 1:
+        S = gptree_speciestree(L)
+        trees = [gptree_genetree(S, hgt, loss, replace_prob) for _ in range(Ngen)]
+        return [(1, i, t.write(format=1)) for i, t in enumerate(trees, 1)]
+
+    # K >= 2: ensures different species topologies between clusters
+    seen_specs: Set[Tuple[FrozenSet[str], FrozenSet[FrozenSet[str]]]] = set()
+    rows: List[Tuple[int, int, str]] = []
+
+    for c in range(1, k + 1):
+        # draws a new species topology not yet seen
+        while True:
+            S = gptree_speciestree(L)
+            sig = species_topology_signature(S)
+            if sig not in seen_specs:
+                seen_specs.add(sig)
+                break
+
+        # little 'auto-relax' for tall trees (more similar trees => easier)
+        hgt_c, loss_c, rprob = hgt, loss, replace_prob
+        if plevel >= 0.55:
+            if hgt_c > 0.15: hgt_c = 0.15
+            if loss_c > 0.15: loss_c = 0.15
+            if rprob < 0.95: rprob = 0.95
+
+        trees_c = build_cluster(
+            species_tree=S,
+            Ngen=Ngen,
+            plevel=plevel,
+            max_tries_per_tree=max_tries_per_tree,
+            hgt_rate=hgt_c,
+            loss_rate=loss_c,
+            replace_prob=rprob,
+            deadline=deadline,
+        )
+        rows.extend((c, i, t.write(format=1)) for i, t in enumerate(trees_c, 1))
+
+    return rows
+
+def write_trees_csv(path: str, rows: List[Tuple[int, int, str]]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["cluster", "tree_id", "newick"])
+        w.writerows(rows)
+
 # ---- main -------------------------------------------------------
 def main():
     p = argparse.ArgumentParser(description="Generate clusters of phylogenetic trees with target overlap (1a).")
@@ -143,8 +268,7 @@ def main():
     p.add_argument("--seed", type=int, default=0, help="random seed")
     p.add_argument("--out", type=str, required=True, help="output CSV (cluster,tree_id,newick)")
 
-    # kept for compatibility, but ignored on the blocking logic side
-    p.add_argument("--timeout_s", type=int, default=0, help="(ignored) kept for backward-compat; no hard timeout")
+    p.add_argument("--timeout_s", type=float, default=0, help="give up after this many seconds (0 = no timeout)")
     p.add_argument("--max_tries_per_tree", type=int, default=2000, help="max attempts before fallback")
 
     p.add_argument("--hgt", type=float, default=0.2, help="HGT rate for simulator")
@@ -154,65 +278,19 @@ def main():
     args = p.parse_args()
 
     try:
-        validate_args(args.k, args.L, args.Ngen, args.plevel)
-    except ValueError as e:
+        rows = generate_clusters(args.k, args.L, args.Ngen, args.plevel, seed=args.seed,
+                                 max_tries_per_tree=args.max_tries_per_tree,
+                                 hgt=args.hgt, loss=args.loss, replace_prob=args.replace_prob,
+                                 timeout_s=args.timeout_s)
+    except (ValueError, TimeoutError) as e:
         print(e)
         sys.exit(1)
 
-    # seed Python
-    random.seed(args.seed or 0)
-
-    # K=1 : fast-path simple, never failure, no overlap constraint
+    write_trees_csv(args.out, rows)
     if args.k == 1:
-        S = gptree_speciestree(args.L)
-        trees = [gptree_genetree(S, args.hgt, args.loss, args.replace_prob) for _ in range(args.Ngen)]
-        with open(args.out, "w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(["cluster", "tree_id", "newick"])
-            for i, t in enumerate(trees, 1):
-                w.writerow([1, i, t.write(format=1)])
         print(f"[K=1 fast-path] Wrote {args.out} (N={args.Ngen})")
-        return
-
-    # K >= 2: ensures different species topologies between clusters
-    seen_specs: Set[Tuple[FrozenSet[str], FrozenSet[FrozenSet[str]]]] = set()
-
-    with open(args.out, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["cluster", "tree_id", "newick"])
-
-        for c in range(1, args.k + 1):
-            # draws a new species topology not yet seen
-            while True:
-                S = gptree_speciestree(args.L)
-                sig = species_topology_signature(S)
-                if sig not in seen_specs:
-                    seen_specs.add(sig)
-                    break
-
-            # little 'auto-relax' for tall trees (more similar trees => easier)
-            hgt = args.hgt
-            loss = args.loss
-            rprob = args.replace_prob
-            if args.plevel >= 0.55:
-                if hgt > 0.15: hgt = 0.15
-                if loss > 0.15: loss = 0.15
-                if rprob < 0.95: rprob = 0.95
-
-            trees_c = build_cluster(
-                species_tree=S,
-                Ngen=args.Ngen,
-                plevel=args.plevel,
-                max_tries_per_tree=args.max_tries_per_tree,
-                hgt_rate=hgt,
-                loss_rate=loss,
-                replace_prob=rprob,
-            )
-
-            for i, t in enumerate(trees_c, 1):
-                w.writerow([c, i, t.write(format=1)])
-
-    print(f"[OK] Wrote {args.out} with {args.k}×{args.Ngen} trees (L={args.L}, p={args.plevel})")
+    else:
+        print(f"[OK] Wrote {args.out} with {args.k}×{args.Ngen} trees (L={args.L}, p={args.plevel})")
 
 if __name__ == "__main__":
     main()
@@ -6,104 +6,124 @@ Orchestrate the steps 1a 1c of the pipeline on a grid (n,k,L,p,noise,repeat),
 then aggregates the results (ARI, objective, consistency) in a CSV.
 
 ✔ Loops in order:  n k L p  (and noise, repeat)
-✔ --resume: skips runs already done (present in --out or metrics.csv)
-✔ Generator: --gen_timeout_s (0 = no timeout), --gen_max_tries
+✔ Results in a SQLite store (result_store.py, --store): one transaction per cell,
+  committed by the worker that ran it; --out is exported from it
+✔ --resume: skips runs already in the store (primary-key lookup)
+✔ Generated datasets cached across metric / weights / noise variants
+  (dataset_cache.py, WMFD_DATASET_CACHE)
+✔ Seeds: seeding.cell_seeds (SeedSequence of --seed and the cell parameters),
+  one per stage (dataset / noise / cluster), identical on any worker or node
+✔ Generator: --gen_timeout_s (0 = no timeout; a cell over it is reported and
+  left out of the store, so --resume retries it), --gen_max_tries
 ✔ WMFD: configurable weights --wmfd_weights 0.30,0.20,0.25,0.15,0.10
 ✔ Intra-cluster consistency Jaccard: before and after noise
 ✔ Timings by step: sec_gen / sec_metric / sec_cluster
+✔ --jobs N: cells run in-process on a pool of N workers (default WMFD_N_JOBS)
+
+Each cell is one task: generation (gptree_cluster_refined.generate_clusters),
+noise, WMFD (wmfd_kernel) and K-medoids (step1c_clustering_kmedoids.k_medoids)
+run in the worker and hand trees / matrices over in memory, with no extra
+interpreter per step. Each finished cell is committed to the store at once
+(a crash loses at most the cells still running, never half a row) and
+--out is rewritten from the store, in grid order, when the grid ends or is
+interrupted, and at most every --export_every_s seconds while it runs (or
+later: python result_store.py export). The run directory still gets trees.csv, trees_noisy.csv, clusters_pred.csv,
+medoids.csv, dist_to_medoids.csv and metrics.csv (--keep_matrix adds matrix.dmat).
 
 CSV output (minimal columns expected per plot):
 timestamp,metric,k,L,n_per_group,noise,noise_mode,plevel,repeat,ARI,objective,coherence_measured,seed
 + bonus columns: run_dir, coherence_pre, sec_gen, sec_metric, sec_cluster
 """
 
-import argparse, os, sys, subprocess, random, csv, pathlib, time
+import argparse, os, sys, random, csv, pathlib, time, functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
 from datetime import datetime
 from itertools import combinations
-from typing import List
+from typing import List, Optional, Sequence
 
+import numpy as np
 from ete3 import Tree
 
-THIS_PY = sys.executable  # current interpreter (venv)
+import result_store
+import seeding
 
+N_JOBS = int(os.environ.get("WMFD_N_JOBS", "1"))
 
-# ---------- FS / subprocess utils ----------
+
+# ---------- FS utils ----------
 
 def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
-def run(cmd: List[str]):
-    subprocess.run(cmd, check=True)
-
 def parse_list(s, cast=float):
     return [cast(x.strip()) for x in s.split(",") if x.strip()]
 
-def _timed(fn, *a):
-    t0 = time.perf_counter()
-    fn(*a)
-    return time.perf_counter() - t0
-
 
 # --------- noise & consistency ---------
 
-def apply_label_noise_to_csv(in_csv, out_csv, noise_frac, seed):
-    """Bruit 'swap' : échange ~noise_frac des feuilles (par paires) dans chaque arbre."""
+def swap_leaf_labels(newick: str, noise_frac: float, rng: random.Random) -> str:
+    """Bruit 'swap' : échange ~noise_frac des feuilles (par paires) dans l'arbre."""
+    t = Tree(newick.strip(), format=1)
+    leaves = [lf for lf in t.iter_leaves()]
+    L = len(leaves)
+    swaps = max(0, int((noise_frac * L) // 2))
+    if swaps > 0:
+        idx = rng.sample(range(L), 2 * swaps)
+        for a, b in zip(idx[::2], idx[1::2]):
+            leaves[a].name, leaves[b].name = leaves[b].name, leaves[a].name
+    return t.write(format=1).strip()
+
+def drop_leaves(newick: str, drop_frac: float, rng: random.Random) -> str:
+    """Bruit 'drop' : retire aléatoirement ~drop_frac des feuilles (≥2 feuilles conservées)."""
+    t = Tree(newick.strip(), format=1)
+    leaf_names = [lf.name for lf in t.iter_leaves()]
+    L = len(leaf_names)
+    m = int(round(drop_frac * L))
+    m = max(0, min(L - 2, m))  # keep at least 2 sheets
+    if m > 0:
+        to_drop = set(rng.sample(leaf_names, m))
+        keep = [x for x in leaf_names if x not in to_drop]
+        t.prune(keep, preserve_branch_length=True)
+    return t.write(format=1).strip()
+
+def apply_noise(newicks: Sequence[str], mode: str, noise_frac: float, seed) -> List[str]:
+    """Noisy copies of the trees, in order (same draws as the *_to_csv variants)."""
     if noise_frac <= 0:
-        with open(in_csv, "r", encoding="utf-8") as fsrc, open(out_csv, "w", encoding="utf-8", newline="") as fdst:
-            fdst.write(fsrc.read())
-        return
+        return list(newicks)
     rng = random.Random(seed)
-    with open(in_csv, newline="", encoding="utf-8") as f_in, \
-         open(out_csv, "w", newline="", encoding="utf-8") as f_out:
-        r = csv.DictReader(f_in)
-        w = csv.DictWriter(f_out, fieldnames=r.fieldnames)
-        w.writeheader()
-        for row in r:
-            t = Tree(row["newick"].strip(), format=1)
-            leaves = [lf for lf in t.iter_leaves()]
-            L = len(leaves)
-            swaps = max(0, int((noise_frac * L) // 2))
-            if swaps > 0:
-                idx = rng.sample(range(L), 2 * swaps)
-                for a, b in zip(idx[::2], idx[1::2]):
-                    leaves[a].name, leaves[b].name = leaves[b].name, leaves[a].name
-            row["newick"] = t.write(format=1).strip()
-            w.writerow(row)
+    fn = swap_leaf_labels if mode == "swap" else drop_leaves
+    return [fn(nw, noise_frac, rng) for nw in newicks]
 
-def apply_leaf_drop_noise_to_csv(in_csv, out_csv, drop_frac, seed):
-    """Bruit 'drop' : retire aléatoirement ~drop_frac des feuilles dans chaque arbre (≥2 feuilles conservées)."""
-    if drop_frac <= 0:
+def _noise_csv(in_csv, out_csv, mode, noise_frac, seed):
+    if noise_frac <= 0:
         with open(in_csv, "r", encoding="utf-8") as fsrc, open(out_csv, "w", encoding="utf-8", newline="") as fdst:
             fdst.write(fsrc.read())
         return
-    rng = random.Random(seed)
-    with open(in_csv, newline="", encoding="utf-8") as f_in, \
-         open(out_csv, "w", newline="", encoding="utf-8") as f_out:
+    with open(in_csv, newline="", encoding="utf-8") as f_in:
         r = csv.DictReader(f_in)
-        w = csv.DictWriter(f_out, fieldnames=r.fieldnames)
+        fields = r.fieldnames
+        rows = list(r)
+    noisy = apply_noise([row["newick"] for row in rows], mode, noise_frac, seed)
+    with open(out_csv, "w", newline="", encoding="utf-8") as f_out:
+        w = csv.DictWriter(f_out, fieldnames=fields)
         w.writeheader()
-        for row in r:
-            t = Tree(row["newick"].strip(), format=1)
-            leaf_names = [lf.name for lf in t.iter_leaves()]
-            L = len(leaf_names)
-            m = int(round(drop_frac * L))
-            m = max(0, min(L - 2, m))  # keep at least 2 sheets
-            if m > 0:
-                to_drop = set(rng.sample(leaf_names, m))
-                keep = [x for x in leaf_names if x not in to_drop]
-                t.prune(keep, preserve_branch_length=True)
-            row["newick"] = t.write(format=1).strip()
+        for row, nw in zip(rows, noisy):
+            row["newick"] = nw
             w.writerow(row)
 
-def measure_intra_cluster_coherence(csv_path):
+def apply_label_noise_to_csv(in_csv, out_csv, noise_frac, seed):
+    _noise_csv(in_csv, out_csv, "swap", noise_frac, seed)
+
+def apply_leaf_drop_noise_to_csv(in_csv, out_csv, drop_frac, seed):
+    _noise_csv(in_csv, out_csv, "drop", drop_frac, seed)
+
+def intra_cluster_coherence(clusters: Sequence[int], newicks: Sequence[str]) -> float:
     """Cohérence intra-cluster = Jaccard moyen des ensembles de feuilles sur toutes les paires d'un cluster."""
     by_cluster = {}
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            c = int(str(row["cluster"]).strip())
-            leaves = set(Tree(row["newick"], format=1).get_leaf_names())
-            by_cluster.setdefault(c, []).append(leaves)
+    for c, nw in zip(clusters, newicks):
+        leaves = set(Tree(nw, format=1).get_leaf_names())
+        by_cluster.setdefault(int(c), []).append(leaves)
     vals = []
     for sets in by_cluster.values():
         if len(sets) < 2:
@@ -113,6 +133,177 @@ def measure_intra_cluster_coherence(csv_path):
             vals.append((len(a & b) / u) if u else 0.0)
     return (sum(vals) / len(vals)) if vals else 0.0
 
+def measure_intra_cluster_coherence(csv_path):
+    clusters, newicks = [], []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            clusters.append(int(str(row["cluster"]).strip()))
+            newicks.append(row["newick"])
+    return intra_cluster_coherence(clusters, newicks)
+
+
+# ---------- one cell (runs in a worker) ----------
+
+@dataclass(frozen=True)
+class Cell:
+    tag: str
+    n_per: int
+    k: int
+    L: int
+    plevel: float
+    noise: float
+    rep: int
+    seeds: seeding.CellSeeds
+    run_dir: str
+    index: int = 0                  # position in the grid enumeration (row order of --out)
+
+    @property
+    def seed(self) -> int:
+        """Seed of the generated dataset (the 'seed' column of the results)."""
+        return self.seeds.dataset
+
+@dataclass(frozen=True)
+class GridOptions:
+    metric: str
+    noise_mode: str
+    lambdas: tuple
+    gen_max_tries: int
+    keep_matrix: bool
+    gen_timeout_s: float = 0        # generator time limit per cell (0 = none)
+    store: Optional[str] = None     # result_store path, written by the workers
+    base_seed: int = 0
+    grid_id: str = ""               # result_store.make_grid_id of this grid
+
+    @property
+    def weights(self) -> str:
+        return ",".join(f"{x:g}" for x in self.lambdas) if self.metric == "wmfd" else ""
+
+def cell_key(cell: Cell, opts: GridOptions) -> dict:
+    return result_store.make_key(metric=opts.metric, weights=opts.weights, k=cell.k, L=cell.L,
+                                 n_per_group=cell.n_per, noise=cell.noise,
+                                 noise_mode=opts.noise_mode, plevel=cell.plevel,
+                                 repeat=cell.rep, base_seed=opts.base_seed)
+
+def rf_matrix(feats) -> np.ndarray:
+    """Normalized Robinson-Foulds |S1 Δ S2| / (|S1| + |S2|) on the split keys."""
+    splits = [f[6] for f in feats]
+    n = len(splits)
+    D = np.zeros((n, n))
+    for i in range(n):
+        for j in range(i + 1, n):
+            tot = splits[i].size + splits[j].size
+            inter = np.intersect1d(splits[i], splits[j], assume_unique=True).size
+            D[i, j] = D[j, i] = (tot - 2 * inter) / tot if tot else 0.0
+    return D
+
+def run_cell(cell: Cell, opts: GridOptions) -> dict:
+    """1a → noise → 1b → 1c for one cell, in memory; returns the result row fields."""
+    import gptree_cluster_refined as gen
+    import dataset_cache
+    import feature_cache
+    import step1b_metric_wmfd as s1b
+    import step1c_clustering_kmedoids as s1c
+    import wmfd_kernel
+
+    run_dir = cell.run_dir
+    ensure_dir(run_dir)
+
+    # 1a) generator
+    t0 = time.perf_counter()
+    # the timeout is not part of the dataset key: it does not change the trees
+    generate = functools.partial(gen.generate_clusters, timeout_s=opts.gen_timeout_s)
+    rows, gen_cached = dataset_cache.cached_dataset(
+        generate, gen.GENERATOR_VERSION,
+        k=cell.k, L=cell.L, Ngen=cell.n_per, plevel=cell.plevel, seed=cell.seeds.dataset,
+        max_tries_per_tree=opts.gen_max_tries)
+    gen.write_trees_csv(os.path.join(run_dir, "trees.csv"), rows)
+    t_gen = time.perf_counter() - t0
+
+    clusters = [c for c, _, _ in rows]
+    ids = [f"{c}.{t}" for c, t, _ in rows]
+    noisy = apply_noise([nw for _, _, nw in rows], opts.noise_mode, cell.noise, cell.seeds.noise)
+    gen.write_trees_csv(os.path.join(run_dir, "trees_noisy.csv"),
+                        [(c, t, nw) for (c, t, _), nw in zip(rows, noisy)])
+
+    # coherences
+    coh_pre = intra_cluster_coherence(clusters, [nw for _, _, nw in rows])
+    coh_post = intra_cluster_coherence(clusters, noisy)
+
+    # 1b) metric
+    t0 = time.perf_counter()
+    feats = feature_cache.cached_features(noisy, s1b.precompute_features, "step1b", labels=ids)
+    if opts.metric == "wmfd":
+        D = wmfd_kernel.wmfd_matrix(feats, *opts.lambdas, normalize=True)
+    else:
+        D = rf_matrix(feats)
+    if opts.keep_matrix:
+        import distmat
+        distmat.write_dmat(os.path.join(run_dir, f"matrix{distmat.EXT}"), ids, D,
+                           meta={"metric": opts.metric, "lambdas": list(opts.lambdas)})
+    t_metric = time.perf_counter() - t0
+
+    # 1c) clustering
+    t0 = time.perf_counter()
+    labels, medoids, obj, n_iter = s1c.k_medoids(D, cell.k, seed=cell.seeds.cluster, n_init=50,
+                                                 max_iter=200, n_jobs=1)
+    ari = s1c.adjusted_rand_index(clusters, labels)
+    s1c.write_clusters(os.path.join(run_dir, "clusters_pred.csv"), ids, labels)
+    s1c.write_medoids(os.path.join(run_dir, "medoids.csv"), medoids, ids)
+    s1c.write_dist_to_medoids(os.path.join(run_dir, "dist_to_medoids.csv"), ids, medoids, D)
+    s1c.write_metrics(os.path.join(run_dir, "metrics.csv"), cell.k, obj, n_iter, 50, cell.seeds.cluster, ari)
+    t_cluster = time.perf_counter() - t0
+
+    return dict(ari=float(ari), obj=float(obj), coh_pre=coh_pre, coh_post=coh_post,
+                gen_cached=gen_cached, t_gen=t_gen, t_metric=t_metric, t_cluster=t_cluster)
+
+
+# ---------- scheduler ----------
+
+_STORES = {}  # one store connection per process and path
+
+def _init_worker(scripts_dir: Optional[str]):
+    # spawn (Windows) workers start with a fresh sys.path
+    if scripts_dir and scripts_dir not in sys.path:
+        sys.path.insert(0, scripts_dir)
+
+def _commit(cell: Cell, opts: GridOptions, res: dict):
+    store = _STORES.get(opts.store)
+    if store is None:
+        store = _STORES[opts.store] = result_store.ResultStore(opts.store)
+    store.put(cell_key(cell, opts), {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "ARI": res["ari"], "objective": res["obj"], "coherence_measured": res["coh_post"],
+        "seed": cell.seed, "run_dir": cell.run_dir, "coherence_pre": f"{res['coh_pre']:.6f}",
+        "sec_gen": f"{res['t_gen']:.3f}", "sec_metric": f"{res['t_metric']:.3f}",
+        "sec_cluster": f"{res['t_cluster']:.3f}", "grid_id": opts.grid_id, "cell_index": cell.index,
+    })
+
+def _safe_run_cell(cell: Cell, opts: GridOptions):
+    try:
+        res = run_cell(cell, opts)
+        if opts.store:
+            _commit(cell, opts, res)
+        return res, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def run_cells(cells: Sequence[Cell], opts: GridOptions, on_result, n_jobs: int = 1,
+              scripts_dir: Optional[str] = None):
+    """
+    Run every cell (on a process pool when n_jobs > 1) and call
+    on_result(cell, result, error) as soon as each one is done.
+    """
+    n_jobs = (os.cpu_count() or 1) if n_jobs < 0 else max(1, n_jobs)
+    if n_jobs == 1 or len(cells) <= 1:
+        for cell in cells:
+            on_result(cell, *_safe_run_cell(cell, opts))
+        return
+    with ProcessPoolExecutor(min(n_jobs, len(cells)), initializer=_init_worker,
+                             initargs=(scripts_dir,)) as ex:
+        futures = {ex.submit(_safe_run_cell, cell, opts): cell for cell in cells}
+        for fut in as_completed(futures):
+            on_result(futures[fut], *fut.result())
+
 
 # ---------- main ----------
 
@@ -121,7 +312,7 @@ def main():
     ap.add_argument("--workdir", default="C:\\ARI_Dashboard\\Essaie",
                     help="Dossier de travail pour créer les runs (run_*) et écrire les sorties.")
     ap.add_argument("--scripts_dir", default=None,
-                    help="Dossier où se trouvent les scripts 1a/1b/1c. Par défaut = --workdir.")
+                    help="Dossier où se trouvent les modules 1a/1b/1c. Par défaut = ce dossier.")
 
     ap.add_argument("--k_list",   default="3",           help="ex: 2,3,4,5")
     ap.add_argument("--L_list",   default="20,40,60",    help="ex: 20,40,60")
@@ -138,16 +329,21 @@ def main():
     ap.add_argument("--repeats", type=int, default=1)
     ap.add_argument("--seed",    type=int, default=0)
     ap.add_argument("--resume", action="store_true",
-                    help="Saute les runs déjà présents dans --out ou déjà complétés (metrics.csv).")
+                    help="Saute les runs déjà présents dans le store (--store).")
 
-    ap.add_argument("--gen_timeout_s",   type=int, default=0,    help="Timeout par cluster pour générateur (0 = off).")
+    ap.add_argument("--gen_timeout_s",   type=float, default=0,  help="Timeout du générateur par cellule, en s (0 = off).")
     ap.add_argument("--gen_max_tries",   type=int, default=2000, help="Max tentatives/ajout d'arbre (générateur).")
 
-    ap.add_argument("--out", default="results_dashboard.csv", help="CSV d’agrégation des résultats.")
+    ap.add_argument("--jobs", type=int, default=N_JOBS, help="cellules en parallèle (-1 = tous les cœurs)")
+    ap.add_argument("--keep_matrix", action="store_true", help="écrire matrix.dmat dans chaque run")
+    ap.add_argument("--out", default="results_dashboard.csv", help="CSV d’agrégation des résultats (exporté du store).")
+    ap.add_argument("--store", default=None, help="store SQLite des résultats (défaut: --out en .sqlite)")
+    ap.add_argument("--export_every_s", type=float, default=300,
+                    help="réécrire --out au plus toutes les N s pendant la grille (0 = seulement à la fin)")
     args = ap.parse_args()
 
     workdir = os.path.abspath(args.workdir)
-    scripts_dir = os.path.abspath(args.scripts_dir) if args.scripts_dir else workdir
+    scripts_dir = os.path.abspath(args.scripts_dir) if args.scripts_dir else os.path.dirname(os.path.abspath(__file__))
     ensure_dir(workdir)
 
     Ks  = parse_list(args.k_list, int)
@@ -157,164 +353,77 @@ def main():
     Ps  = parse_list(args.noise_list, float)
     L1, L2, L3, L4, L5 = [float(x) for x in args.wmfd_weights.split(",")]
 
-    # scripts 
-    path_gen   = os.path.join(scripts_dir, "gptree_cluster_refined.py")
-    path_m_wmf = os.path.join(scripts_dir, "step1b_metric_wmfd.py")
-    path_m_rf  = os.path.join(scripts_dir, "step1b_metric_rf.py")
-    path_km    = os.path.join(scripts_dir, "step1c_clustering_kmedoids.py")
-
-    # quick checks
-    if not os.path.isfile(path_gen):
-        print(f"[FATAL] Introuvable: {path_gen}"); sys.exit(2)
-    if args.metric == "wmfd":
-        if not os.path.isfile(path_m_wmf):
-            print(f"[FATAL] Introuvable: {path_m_wmf}"); sys.exit(2)
-    else:
-        if not os.path.isfile(path_m_rf):
-            print(f"[FATAL] Introuvable: {path_m_rf}"); sys.exit(2)
-    if not os.path.isfile(path_km):
-        print(f"[FATAL] Introuvable: {path_km}"); sys.exit(2)
+    # modules 1a/1b/1c, imported in-process by the workers
+    for mod in ("gptree_cluster_refined.py", "step1b_metric_wmfd.py", "step1c_clustering_kmedoids.py"):
+        if not os.path.isfile(os.path.join(scripts_dir, mod)):
+            print(f"[FATAL] Introuvable: {os.path.join(scripts_dir, mod)}"); sys.exit(2)
+    _init_worker(scripts_dir)
 
-    # CSV output
+    # results: SQLite store, CSV exported from it
     out_csv = os.path.abspath(args.out)
     ensure_dir(str(pathlib.Path(out_csv).parent))
-    first = not os.path.exists(out_csv)
-
-    # recovery: tags already present
-    done_tags = set()
-    if args.resume and os.path.exists(out_csv):
-        with open(out_csv, newline="", encoding="utf-8") as fprev:
-            for r in csv.DictReader(fprev):
-                try:
-                    k0   = int(r["k"]); L0 = int(r["L"]); n0 = int(r["n_per_group"])
-                    p0   = float(r["plevel"]); ptag = int(round(100 * p0))
-                    nse0 = float(r["noise"]);  ntag = int(round(100 * nse0))
-                    tag0 = f"k{k0}L{L0}_n{n0}_plev{ptag}_p{ntag}{r['noise_mode']}_rep{r['repeat']}"
-                    done_tags.add(tag0)
-                except Exception:
-                    pass
-        print(f"[RESUME] {len(done_tags)} runs déjà présents, ils seront ignorés.")
-
-    with open(out_csv, "a", newline="", encoding="utf-8") as f_out:
-        w = csv.writer(f_out)
-        if first:
-            w.writerow([
-                "timestamp","metric","k","L","n_per_group","noise","noise_mode","plevel","repeat",
-                "ARI","objective","coherence_measured","seed",
-                "run_dir","coherence_pre","sec_gen","sec_metric","sec_cluster"
-            ])
-
-        base_seed = args.seed
-
-        # ----- 4 LOOPS: (n, k, L, p) -----
-        for n_per in Ns:                 # 1) n (trees/cluster)
-            for k in Ks:                 # 2) k
-                for L in Ls:             # 3) L (leaves)
-                    for plevel in PLs:   # 4) p (overlap target)
-                        for noise in Ps:
-                            for rep in range(args.repeats):
-                                tag = f"k{k}L{L}_n{n_per}_plev{int(round(plevel*100))}_p{int(round(noise*100))}{args.noise_mode}_rep{rep}"
-                                run_dir = os.path.join(workdir, f"run_{tag}")
-                                ensure_dir(run_dir)
-
-                                # skip if (CSV) or if metrics.csv present
-                                if args.resume and (tag in done_tags or os.path.exists(os.path.join(run_dir, "metrics.csv"))):
-                                    print(f"[SKIP resume] {tag}")
-                                    continue
-
-                                seed = base_seed + (hash(("v2", n_per, k, L, plevel, noise, rep, args.noise_mode, args.metric)) & 0xffff)
-
-                                trees_csv   = os.path.join(run_dir, "trees.csv")
-                                noisy_csv   = os.path.join(run_dir, "trees_noisy.csv")
-                                matrix_csv  = os.path.join(run_dir, "matrix.csv")
-                                labels_csv  = os.path.join(run_dir, "labels.csv")
-                                pairs_csv   = os.path.join(run_dir, "pairs.csv")
-                                metrics_csv = os.path.join(run_dir, "metrics.csv")
-
-                                print(f"\n=== (n={n_per}, k={k}, L={L}, p={plevel:.2f}) noise={noise:.2f} rep={rep} ===")
-
-                                # 1a) generator
-                                cmd_gen = [
-                                    THIS_PY, path_gen,
-                                    "--k", str(k), "--L", str(L), "--Ngen", str(n_per),
-                                    "--plevel", str(plevel), "--seed", str(seed),
-                                    "--timeout_s", str(args.gen_timeout_s),
-                                    "--max_tries_per_tree", str(args.gen_max_tries),
-                                    "--out", trees_csv
-                                ]
-                                print(f"[GEN] {tag}")
-                                t_gen = _timed(run, cmd_gen)
-
-                                # noise
-                                if args.noise_mode == "swap":
-                                    apply_label_noise_to_csv(trees_csv, noisy_csv, noise, seed)
-                                else:
-                                    apply_leaf_drop_noise_to_csv(trees_csv, noisy_csv, noise, seed)
-
-                                # coherences
-                                coh_pre  = measure_intra_cluster_coherence(trees_csv)
-                                coh_post = measure_intra_cluster_coherence(noisy_csv)
-                                print(f"[COH] target(p)={plevel:.2f}  pre={coh_pre:.3f}  post={coh_post:.3f}")
-
-                                # 1b) metric
-                                if args.metric == "wmfd":
-                                    cmd_m = [
-                                        THIS_PY, path_m_wmf,
-                                        "--in_csv", noisy_csv,
-                                        "--out_matrix", matrix_csv,
-                                        "--out_pairs", pairs_csv,
-                                        "--out_labels", labels_csv,
-                                        "--L1", str(L1), "--L2", str(L2),
-                                        "--L3", str(L3), "--L4", str(L4), "--L5", str(L5),
-                                    ]
-                                else:
-                                    cmd_m = [
-                                        THIS_PY, path_m_wmf,
-                                        "--in_csv", noisy_csv,
-                                        "--out_matrix", matrix_csv,
-                                        "--out_pairs", pairs_csv,
-                                        "--out_labels", labels_csv,
-                                    ]
-                                print(f"[METRIC-{args.metric.upper()}] {tag}")
-                                t_metric = _timed(run, cmd_m)
-
-                                # 1c) clustering
-                                cmd_c = [
-                                    THIS_PY, path_km,
-                                    "--matrix", matrix_csv, "--k", str(k),
-                                    "--labels", labels_csv, "--seed", str(seed),
-                                    "--n_init", "50", "--max_iter", "200",
-                                    "--out_pred", os.path.join(run_dir, "clusters_pred.csv"),
-                                    "--out_medoids", os.path.join(run_dir, "medoids.csv"),
-                                    "--out_kxn", os.path.join(run_dir, "dist_to_medoids.csv"),
-                                    "--out_metrics", metrics_csv
-                                ]
-                                print(f"[KMEDOIDS] {tag}")
-                                t_cluster = _timed(run, cmd_c)
-
-                                # Read metrics.csv
-                                with open(metrics_csv, newline="", encoding="utf-8") as fm:
-                                    r = next(csv.DictReader(fm))
-                                # ARI
-                                ari = r.get("ARI")
-                                if ari is None:
-                                    ari = r.get("ari", "nan")
-                                ari = float(ari)
-                                # objective
-                                obj = r.get("objective", "")
-                                obj = float(obj) if obj not in ("", None, "nan") else None
-
-                                # write row
-                                w.writerow([
-                                    datetime.now().isoformat(timespec="seconds"),
-                                    args.metric, k, L, n_per, noise, args.noise_mode,
-                                    plevel, rep, ari, obj, coh_post, seed,
-                                    run_dir, f"{coh_pre:.6f}", f"{t_gen:.3f}", f"{t_metric:.3f}", f"{t_cluster:.3f}"
-                                ])
-                                f_out.flush()
-                                print(f"[DONE] {tag}  ARI={ari:.6f}  obj={obj}  "
-                                      f"coh_pre={coh_pre:.3f} coh_post={coh_post:.3f}  "
-                                      f"t(gen/metric/cluster)={t_gen:.1f}/{t_metric:.1f}/{t_cluster:.1f}s")
+    store_path = os.path.abspath(args.store) if args.store else os.path.splitext(out_csv)[0] + ".sqlite"
+    store = result_store.ResultStore(store_path)
+    weights = ",".join(f"{x:g}" for x in (L1, L2, L3, L4, L5)) if args.metric == "wmfd" else ""
+    grid_id = result_store.make_grid_id(
+        n=Ns, k=Ks, L=Ls, plevel=PLs, noise=Ps, repeats=args.repeats, seed=args.seed,
+        metric=args.metric, weights=weights, noise_mode=args.noise_mode)
+    opts = GridOptions(args.metric, args.noise_mode, (L1, L2, L3, L4, L5),
+                       args.gen_max_tries, args.keep_matrix, args.gen_timeout_s, store_path, args.seed,
+                       grid_id)
+
+    # migration: a CSV from before the store counts as done for --resume
+    if args.resume and len(store) == 0 and os.path.exists(out_csv):
+        n_imp = store.import_csv(out_csv, opts.weights, args.seed)
+        print(f"[RESUME] {n_imp} runs importés de {out_csv} dans {store_path}")
+
+    base_seed = args.seed
+
+    # ----- 4 LOOPS: (n, k, L, p), in this order in the output -----
+    cells: List[Cell] = []
+    index = 0
+    for n_per in Ns:                 # 1) n (trees/cluster)
+        for k in Ks:                 # 2) k
+            for L in Ls:             # 3) L (leaves)
+                for plevel in PLs:   # 4) p (overlap target)
+                    for noise in Ps:
+                        for rep in range(args.repeats):
+                            tag = f"k{k}L{L}_n{n_per}_plev{int(round(plevel*100))}_p{int(round(noise*100))}{args.noise_mode}_rep{rep}"
+                            run_dir = os.path.join(workdir, f"run_{tag}")
+
+                            seeds = seeding.cell_seeds(base_seed, k, L, n_per, plevel, rep,
+                                                       args.noise_mode, noise, args.metric, opts.weights)
+                            cell = Cell(tag, n_per, k, L, plevel, noise, rep, seeds, run_dir, index)
+                            index += 1
+
+                            # skip if already in the store
+                            if args.resume and store.has(cell_key(cell, opts)):
+                                print(f"[SKIP resume] {tag}")
+                                continue
+                            cells.append(cell)
+
+    print(f"[GRID] {len(cells)} runs, jobs={args.jobs}")
+
+    last_export = [time.monotonic()]
+
+    def on_result(cell: Cell, res: Optional[dict], err: Optional[str]):
+        if err is not None:
+            print(f"[WARN] {cell.tag}: {err}")
+            return
+        if args.export_every_s > 0 and time.monotonic() - last_export[0] >= args.export_every_s:
+            store.export_csv(out_csv)  # throttled: a full export costs O(rows)
+            last_export[0] = time.monotonic()
+        print(f"[DONE] {cell.tag}  ARI={res['ari']:.6f}  obj={res['obj']}  "
+              f"coh_pre={res['coh_pre']:.3f} coh_post={res['coh_post']:.3f}  "
+              f"t(gen/metric/cluster)={res['t_gen']:.1f}/{res['t_metric']:.1f}/{res['t_cluster']:.1f}s"
+              f"{'  (trees from cache)' if res['gen_cached'] else ''}")
+
+    try:
+        run_cells(cells, opts, on_result, n_jobs=args.jobs, scripts_dir=scripts_dir)
+    finally:
+        n_rows = store.export_csv(out_csv)
+        store.close()
+        print(f"[OK] {n_rows} runs → {out_csv}  (store: {store_path})")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,196 @@
+# -- coding: utf-8 --
+"""
+newick_io.py — streaming Newick reader
+
+iter_newick_records(path) yields (id, newick) records in a single pass over
+the file, without loading it: memory stays flat whatever the number of trees.
+
+Inputs
+------
+- .txt / .nwk / anything else : one tree per line, "id: (...);" or "(...);"
+  (a tree may also span several lines: text is buffered until its ';';
+  continuation lines must not start with "(" or "id:" in column 0, since
+  such a line starts a new record and an unterminated buffer before it is
+  dropped with a warning, as is one over MAX_RECORD_CHARS).
+- .csv : header with a newick|nwk|tree|newick_str column (and optionally
+  tree_id|id|treeid|t, cluster|true_cluster|c). Without such a header,
+  every cell that looks like a Newick string is taken.
+- any of the above gzip-compressed (.gz suffix or gzip magic bytes).
+
+Ids are "<cluster>.<tree_id>" or "<tree_id>" when those columns exist, the
+prefix before ':' on text lines, else the 1-based record number.
+
+Only a cheap syntactic check is done here (balanced parentheses, final
+';'). Full parsing is left to the consumer: pass validate=callable to skip
+records for which it raises / returns False (e.g. lambda s: Tree(s, format=1)).
+"""
+
+import io
+import os
+import re
+import csv
+import gzip
+import itertools
+from typing import Callable, Iterator, Optional, Tuple
+
+NEWICK_KEYS  = {"newick", "nwk", "tree", "newick_str"}
+ID_KEYS      = {"tree_id", "id", "treeid", "t"}
+CLUSTER_KEYS = {"cluster", "true_cluster", "c"}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_TREE_RE = re.compile(r"\(.*?\);", flags=re.DOTALL)
+_PREFIX_RE = re.compile(r"^\s*([^(\s:][^(:]*?)\s*:\s*(\(.*)$", flags=re.DOTALL)
+
+csv.field_size_limit(2**31 - 1)  # huge Newick cells
+
+MAX_RECORD_CHARS = 1 << 26  # text buffered without a ';' before giving up (64 M chars)
+
+
+# ----------------------------- helpers -----------------------------
+
+def open_text(path: str):
+    """Text handle on `path`, transparently gunzipped."""
+    with open(path, "rb") as f:
+        gz = f.read(2) == _GZIP_MAGIC
+    if gz:
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def _base_ext(path: str) -> str:
+    p = path[:-3] if path.lower().endswith(".gz") else path
+    return os.path.splitext(p)[1].lower()
+
+def _balanced(s: str) -> bool:
+    depth = 0
+    for ch in s:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+def clean_newick(s: str) -> Optional[str]:
+    """First '(...);' substring of s (quotes/newlines stripped), or None."""
+    s = s.strip().strip('"').strip("'")
+    if "(" not in s or ";" not in s:
+        return None
+    m = _TREE_RE.search(s)
+    if not m:
+        return None
+    nw = m.group(0).replace("\n", "").replace("\r", "")
+    return nw if _balanced(nw) else None
+
+def _passes(nw: str, validate: Optional[Callable]) -> bool:
+    if validate is None:
+        return True
+    try:
+        return validate(nw) is not False
+    except Exception:
+        return False
+
+
+# ----------------------------- readers -----------------------------
+
+def _starts_record(line: str) -> bool:
+    """'(...' or 'id: (...' in column 0."""
+    return line[:1] == "(" or (not line[:1].isspace() and _PREFIX_RE.match(line) is not None)
+
+def _drop(lineno: int, why: str):
+    print(f"[WARN] Newick record at line {lineno} dropped: {why}")
+
+def _iter_text(f, max_chars: int = MAX_RECORD_CHARS) -> Iterator[Tuple[Optional[str], str]]:
+    buf, size, start, skipping = [], 0, 0, False
+    for lineno, raw in enumerate(f, 1):
+        new = _starts_record(raw)
+        if buf and new:
+            _drop(start, "no ';' before the next record")
+            buf, size = [], 0
+        if skipping:  # rest of an oversized record
+            if not new:
+                skipping = ";" not in raw
+                continue
+            skipping = False
+        if not buf:
+            if "(" not in raw:
+                continue  # blank / non-tree line
+            start = lineno
+        buf.append(raw)
+        size += len(raw)
+        if ";" not in raw:
+            if size > max_chars:
+                _drop(start, f"over {max_chars} characters without ';'")
+                buf, size, skipping = [], 0, True
+            continue
+        text = "".join(buf)
+        buf, size = [], 0
+        m = _PREFIX_RE.match(text)
+        tid = m.group(1) if m else None
+        body = m.group(2) if m else text
+        # a line may hold several trees; the prefix id goes to the first one
+        for k, cand in enumerate(_TREE_RE.findall(body)):
+            nw = clean_newick(cand)
+            if nw:
+                yield (tid if k == 0 else None), nw
+    if buf:
+        _drop(start, "no ';' before the end of the file")
+
+def _pick(header, wanted):
+    for i, h in enumerate(header):
+        if (h or "").strip().lower().replace("\ufeff", "") in wanted:
+            return i
+    return None
+
+def _iter_csv(f) -> Iterator[Tuple[Optional[str], str]]:
+    rdr = csv.reader(f)
+    header = next(rdr, None)
+    if header is None:
+        return
+    nw_i = _pick(header, NEWICK_KEYS)
+    if nw_i is None:
+        # no usable header: scan every cell, header row included
+        for row in itertools.chain([header], rdr):
+            for cell in row:
+                nw = clean_newick(cell)
+                if nw:
+                    yield None, nw
+        return
+
+    id_i = _pick(header, ID_KEYS)
+    c_i = _pick(header, CLUSTER_KEYS)
+    for row in rdr:
+        if len(row) <= nw_i:
+            continue
+        nw = clean_newick(row[nw_i])
+        if not nw:
+            continue
+        tid = row[id_i].strip() if id_i is not None and id_i < len(row) else ""
+        cl = row[c_i].strip() if c_i is not None and c_i < len(row) else ""
+        if tid and cl:
+            tid = f"{_num(cl)}.{_num(tid)}"
+        yield (tid or None), nw
+
+def _num(s: str) -> str:
+    """'3.0' -> '3' (ids written by pandas), other strings unchanged."""
+    try:
+        v = float(s)
+        return str(int(v)) if v.is_integer() else s
+    except ValueError:
+        return s
+
+
+def iter_newick_records(path: str, validate: Optional[Callable[[str], object]] = None
+                        ) -> Iterator[Tuple[str, str]]:
+    """Yield (id, newick) for every tree of `path`, in file order, in one pass."""
+    reader = _iter_csv if _base_ext(path) == ".csv" else _iter_text
+    with open_text(path) as f:
+        k = 0
+        for tid, nw in reader(f):
+            k += 1
+            if _passes(nw, validate):
+                yield (tid or str(k)), nw
+
+def iter_newicks(path: str, validate: Optional[Callable[[str], object]] = None) -> Iterator[str]:
+    for _tid, nw in iter_newick_records(path, validate):
+        yield nw
@@ -0,0 +1,231 @@
+# -- coding: utf-8 --
+"""
+pam_engine.py — built-in k-medoids (PAM BUILD + FastPAM1 / FasterPAM SWAP)
+
+Pure NumPy replacement for the first-improvement PAM loops, used when the
+optional `kmedoids` package is not installed.
+
+Every point keeps its nearest medoid (near, d1) and the distance to its
+second nearest (d2). The loss change of swapping medoid i for candidate x
+is then, as in FastPAM1 (Schubert & Rousseeuw, 2019/2021):
+
+    Δ(i, x) = removal_loss[i] + Σ_o  shared(o, x)  + Σ_{o: near(o)=i} fix(o, x)
+
+    removal_loss[i] = Σ_{o: near(o)=i} (d2(o) - d1(o))
+    shared(o, x)    = min(D[o, x] - d1(o), 0)
+    fix(o, x)       = d1(o) - d2(o)            if D[o, x] < d1(o)
+                      D[o, x] - d2(o)           if d1(o) <= D[o, x] < d2(o)
+                      0                         otherwise
+
+so all k swaps of one candidate cost O(n) instead of O(k·n). The engine
+evaluates all (i, x) per pass with dense column blocks ("fastpam1": best
+swap per pass) or applies the first improving swap of each candidate
+("fasterpam": eager, fewer full passes). Caches are refreshed in O(n·k)
+after each swap.
+
+k_sweep(D, kmin, kmax) solves a whole range of k: the k+1 run starts from
+the k solution plus one greedy BUILD medoid (from the k solution's nearest
+distances), so every step only needs a few swaps.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Union
+
+import numpy as np
+
+# Bytes of the (n × block) temporaries of one candidate block.
+BLOCK_BYTES = 64 * 1024 * 1024
+_TOL = 1e-12
+
+
+@dataclass
+class PAMResult:
+    medoids: np.ndarray          # (k,) indices into D
+    labels: np.ndarray           # (n,) 0..k-1, index into medoids
+    loss: float                  # Σ distance to the nearest medoid
+    n_iter: int                  # passes over the candidates
+    n_swaps: int
+
+
+# ---- caches ----
+
+def _nearest_two(D: np.ndarray, medoids: np.ndarray):
+    """(near, d1, d2): nearest medoid slot, its distance, second distance."""
+    Dm = D[:, medoids]
+    part = np.argpartition(Dm, 1, axis=1)[:, :2]
+    a = np.take_along_axis(Dm, part, axis=1)
+    first = a[:, 0] <= a[:, 1]
+    # ties: lowest slot index, as np.argmin would pick
+    tie = a[:, 0] == a[:, 1]
+    near = np.where(first, part[:, 0], part[:, 1])
+    near = np.where(tie, np.minimum(part[:, 0], part[:, 1]), near)
+    d1 = np.where(first, a[:, 0], a[:, 1])
+    d2 = np.where(first, a[:, 1], a[:, 0])
+    return near.astype(np.intp), d1, d2
+
+
+# ---- initialisation ----
+
+def _build_step(D: np.ndarray, cur: np.ndarray, taken: np.ndarray) -> int:
+    """Non-medoid with the largest loss reduction given nearest distances `cur`."""
+    n = D.shape[0]
+    gain = np.zeros(n)
+    bs = _block_size(n)
+    for a in range(0, n, bs):
+        gain[a:a + bs] = np.maximum(cur[:, None] - D[:, a:a + bs], 0.0).sum(axis=0)
+    gain[taken] = -np.inf
+    return int(np.argmax(gain))
+
+
+def build_init(D: np.ndarray, k: int) -> np.ndarray:
+    """Greedy PAM BUILD: medoid of the whole set, then the largest loss reduction."""
+    n = D.shape[0]
+    medoids = [int(np.argmin(D.sum(axis=1)))]
+    cur = D[:, medoids[0]].copy()
+    taken = np.zeros(n, dtype=bool)
+    taken[medoids[0]] = True
+    while len(medoids) < k:
+        j = _build_step(D, cur, taken)
+        medoids.append(j)
+        taken[j] = True
+        np.minimum(cur, D[:, j], out=cur)
+    return np.asarray(medoids, dtype=np.intp)
+
+
+def random_init(n: int, k: int, seed=None) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=k, replace=False)).astype(np.intp)
+
+
+def _block_size(n: int) -> int:
+    return max(1, min(n, BLOCK_BYTES // (8 * max(n, 1) * 3)))
+
+
+# ---- swap evaluation ----
+
+def _swap_deltas(D, cols, near, d1, d2, removal, onehot):
+    """Δ(i, x) for every medoid slot i and candidate x in cols, shape (k, len(cols))."""
+    Dx = D[:, cols]                                   # (n, b)
+    closer = Dx < d1[:, None]
+    shared = np.where(closer, Dx - d1[:, None], 0.0).sum(axis=0)
+    second = ~closer & (Dx < d2[:, None])
+    fix = np.where(closer, (d1 - d2)[:, None], np.where(second, Dx - d2[:, None], 0.0))
+    return removal[:, None] + onehot @ fix + shared[None, :]
+
+
+def _caches(D, medoids, k):
+    near, d1, d2 = _nearest_two(D, medoids)
+    removal = np.bincount(near, weights=d2 - d1, minlength=k)
+    onehot = np.zeros((k, D.shape[0]))
+    onehot[near, np.arange(D.shape[0])] = 1.0
+    return near, d1, d2, removal, onehot
+
+
+def fastpam(D, k: int, init: Union[str, Sequence[int]] = "build", max_iter: int = 100,
+            method: str = "fastpam1", seed: Optional[int] = 0) -> PAMResult:
+    """
+    k-medoids on a precomputed distance matrix.
+
+    init    : "build" (greedy PAM BUILD), "random", or explicit medoid indices.
+    method  : "fastpam1" (best swap per pass) or "fasterpam" (eager swaps).
+    max_iter: maximum number of passes over the candidates.
+    """
+    D = np.asarray(D, dtype=float)
+    n = D.shape[0]
+    if not (1 <= k <= n):
+        raise ValueError(f"k must be in [1, {n}], got {k}")
+    if method not in ("fastpam1", "fasterpam"):
+        raise ValueError(f"unknown method: {method}")
+
+    if k == 1:
+        # closed form: the point with the smallest distance sum
+        m = int(np.argmin(D.sum(axis=1)))
+        return PAMResult(np.asarray([m]), np.zeros(n, dtype=int), float(D[:, m].sum()), 0, 0)
+
+    if isinstance(init, str):
+        if init == "build":
+            medoids = build_init(D, k)
+        elif init == "random":
+            medoids = random_init(n, k, seed)
+        else:
+            raise ValueError(f"unknown init: {init}")
+    else:
+        medoids = np.asarray(init, dtype=np.intp).copy()
+        if medoids.shape != (k,) or len(set(medoids.tolist())) != k:
+            raise ValueError("init must hold k distinct indices")
+
+    near, d1, d2, removal, onehot = _caches(D, medoids, k)
+    is_med = np.zeros(n, dtype=bool)
+    is_med[medoids] = True
+    it = swaps = 0
+
+    while it < max_iter and k < n:
+        it += 1
+        improved = False
+
+        if method == "fastpam1":
+            best = (-_TOL, -1, -1)
+            bs = _block_size(n)
+            for a in range(0, n, bs):
+                cols = np.arange(a, min(n, a + bs))
+                delta = _swap_deltas(D, cols, near, d1, d2, removal, onehot)
+                delta[:, is_med[cols]] = np.inf
+                i, b = np.unravel_index(int(np.argmin(delta)), delta.shape)
+                if delta[i, b] < best[0]:
+                    best = (float(delta[i, b]), int(i), int(cols[b]))
+            if best[1] >= 0:
+                _, i, x = best
+                is_med[medoids[i]] = False
+                medoids[i] = x
+                is_med[x] = True
+                near, d1, d2, removal, onehot = _caches(D, medoids, k)
+                swaps += 1
+                improved = True
+        else:
+            for x in range(n):
+                if is_med[x]:
+                    continue
+                delta = _swap_deltas(D, np.asarray([x]), near, d1, d2, removal, onehot)[:, 0]
+                i = int(np.argmin(delta))
+                if delta[i] < -_TOL:
+                    is_med[medoids[i]] = False
+                    medoids[i] = x
+                    is_med[x] = True
+                    near, d1, d2, removal, onehot = _caches(D, medoids, k)
+                    swaps += 1
+                    improved = True
+
+        if not improved:
+            break
+
+    labels = np.argmin(D[:, medoids], axis=1).astype(int)
+    loss = float(D[np.arange(n), medoids[labels]].sum())
+    return PAMResult(medoids.astype(int), labels, loss, it, swaps)
+
+
+def k_sweep(D, kmin: int, kmax: int, max_iter: int = 100,
+            method: str = "fastpam1") -> Dict[int, PAMResult]:
+    """
+    {k: PAMResult} for kmin <= k <= min(kmax, n - 1), warm-started:
+    BUILD for kmin, then each k+1 starts from the k medoids plus the greedy
+    BUILD addition computed from their nearest distances.
+    """
+    D = np.asarray(D, dtype=float)
+    n = D.shape[0]
+    kmin = max(1, kmin)
+    kmax = min(kmax, n - 1) if n > 1 else 1
+    out: Dict[int, PAMResult] = {}
+    if kmin > kmax:
+        return out
+    medoids = build_init(D, kmin) if kmin > 1 else None
+    for k in range(kmin, kmax + 1):
+        if medoids is not None and len(medoids) < k:
+            taken = np.zeros(n, dtype=bool)
+            taken[medoids] = True
+            cur = D[:, medoids].min(axis=1)
+            medoids = np.append(medoids, _build_step(D, cur, taken)).astype(np.intp)
+        init = "build" if medoids is None else medoids
+        res = fastpam(D, k, init=init, max_iter=max_iter, method=method)
+        out[k] = res
+        medoids = np.asarray(res.medoids, dtype=np.intp)
+    return out
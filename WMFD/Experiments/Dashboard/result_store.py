@@ -0,0 +1,209 @@
+# -- coding: utf-8 --
+"""
+result_store.py — transactional store of grid_experiments results
+
+One SQLite file (WAL journal) with one row per grid cell, keyed by the run
+parameters and the grid seed:
+
+    (metric, weights, k, L, n_per_group, noise, noise_mode, plevel, repeat, base_seed)
+
+Every cell is committed in its own transaction as soon as it finishes,
+from any number of worker processes (WAL: readers never block, writers
+wait up to `timeout` for the lock). A crash leaves only complete rows,
+and re-running a cell replaces its row instead of appending a duplicate.
+--resume checks a cell with a primary-key lookup.
+
+Each row also keeps grid_id, a digest of the grid definition that wrote
+it (make_grid_id: the n / k / L / plevel / noise lists, repeats, seed,
+metric, weights, noise mode), and cell_index, the position of its cell in
+that grid's enumeration (command-line order of n, k, L, plevel, noise,
+repeat). export_csv writes the results_dashboard.csv layout read by
+plot_dashboard grid by grid (in order of first insertion), each grid in
+its own enumeration order, i.e. the row order of the CSV appended by the
+grid before the store, atomically (temporary file + rename). Two grids
+with other lists never interleave; a --resume of the same grid has the
+same grid_id. import_csv loads such a CSV, e.g. to migrate existing
+results, as one grid numbered in file order.
+
+CLI
+---
+    python result_store.py export --store results.sqlite --out results_dashboard.csv
+    python result_store.py import --store results.sqlite --csv results_dashboard.csv
+"""
+
+import os
+import csv
+import sqlite3
+import hashlib
+import argparse
+from typing import Dict, Iterable, Optional
+
+KEY_COLUMNS = ("metric", "weights", "k", "L", "n_per_group", "noise", "noise_mode",
+               "plevel", "repeat", "base_seed")
+VALUE_COLUMNS = ("timestamp", "ARI", "objective", "coherence_measured", "seed",
+                 "run_dir", "coherence_pre", "sec_gen", "sec_metric", "sec_cluster", "grid_id", "cell_index")
+
+# results_dashboard.csv header (grid_experiments / plot_dashboard)
+CSV_COLUMNS = ("timestamp", "metric", "k", "L", "n_per_group", "noise", "noise_mode", "plevel",
+               "repeat", "ARI", "objective", "coherence_measured", "seed",
+               "run_dir", "coherence_pre", "sec_gen", "sec_metric", "sec_cluster")
+
+_INT = {"k", "L", "n_per_group", "repeat", "base_seed", "seed", "cell_index"}
+_REAL = {"noise", "plevel", "ARI", "objective", "coherence_measured", "coherence_pre",
+         "sec_gen", "sec_metric", "sec_cluster"}
+_ROUND = 6  # noise / plevel are stored rounded, so 0.1 and 0.10000000001 share a key
+
+
+def _sql_type(c: str) -> str:
+    return "INTEGER" if c in _INT else "REAL" if c in _REAL else "TEXT"
+
+
+def _norm(c: str, v):
+    if v is None or v == "":
+        return None
+    if c in _INT:
+        return int(float(v))
+    if c in _REAL:
+        v = float(v)
+        return round(v, _ROUND) if c in ("noise", "plevel") else v
+    return str(v)
+
+
+def make_key(**params) -> Dict[str, object]:
+    """Normalized key from the KEY_COLUMNS parameters (weights may be '' for RF)."""
+    missing = [c for c in KEY_COLUMNS if c not in params]
+    if missing:
+        raise KeyError(f"missing key columns: {', '.join(missing)}")
+    return {c: _norm(c, params[c]) if c != "weights" else str(params[c] or "") for c in KEY_COLUMNS}
+
+
+def make_grid_id(**grid) -> str:
+    """Short digest of a grid definition (sorted name=value pairs)."""
+    text = "\x1f".join(f"{k}={grid[k]!r}" for k in sorted(grid))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ResultStore:
+    """SQLite (WAL) table of grid results, one row per key."""
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.con = sqlite3.connect(path, timeout=timeout)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        cols = ", ".join(f"{c} {_sql_type(c)}{' NOT NULL' if c in KEY_COLUMNS else ''}"
+                         for c in KEY_COLUMNS + VALUE_COLUMNS)
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS results ({cols},"
+                         f" PRIMARY KEY ({', '.join(KEY_COLUMNS)}))")
+        have = {r[1] for r in self.con.execute("PRAGMA table_info(results)")}
+        for c in VALUE_COLUMNS:  # stores created by an older version
+            if c not in have:
+                self.con.execute(f"ALTER TABLE results ADD COLUMN {c} {_sql_type(c)}")
+        self.con.commit()
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return int(self.con.execute("SELECT COUNT(*) FROM results").fetchone()[0])
+
+    def has(self, key: Dict[str, object]) -> bool:
+        where = " AND ".join(f"{c}=?" for c in KEY_COLUMNS)
+        q = f"SELECT 1 FROM results WHERE {where} LIMIT 1"
+        return self.con.execute(q, [key[c] for c in KEY_COLUMNS]).fetchone() is not None
+
+    def put(self, key: Dict[str, object], values: Dict[str, object]) -> None:
+        """Insert or replace the row of key, in one transaction."""
+        cols = KEY_COLUMNS + VALUE_COLUMNS
+        row = [key[c] for c in KEY_COLUMNS] + [_norm(c, values.get(c)) for c in VALUE_COLUMNS]
+        q = f"INSERT OR REPLACE INTO results ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with self.con:
+            self.con.execute(q, row)
+
+    def rows(self, metric: Optional[str] = None, weights: Optional[str] = None) -> Iterable[Dict[str, object]]:
+        """
+        Rows as dicts: grids in order of first insertion, each in its
+        enumeration order (cell_index), within each metric / weights / seed.
+        """
+        cond, args = [], []
+        if metric is not None:
+            cond.append("r.metric=?"); args.append(metric)
+        if weights is not None:
+            cond.append("r.weights=?"); args.append(weights)
+        where = f" WHERE {' AND '.join(cond)}" if cond else ""
+        cols = KEY_COLUMNS + VALUE_COLUMNS
+        q = (f"WITH g AS (SELECT grid_id, MIN(rowid) AS first FROM results GROUP BY grid_id)"
+             f" SELECT {', '.join('r.' + c for c in cols)} FROM results AS r"
+             f" LEFT JOIN g ON g.grid_id IS r.grid_id{where}"
+             " ORDER BY r.metric, r.weights, r.base_seed, g.first,"
+             " r.cell_index IS NULL, r.cell_index, r.rowid")
+        for r in self.con.execute(q, args):
+            yield dict(zip(cols, r))
+
+    def export_csv(self, path: str, metric: Optional[str] = None,
+                   weights: Optional[str] = None) -> int:
+        """Write the plot_dashboard CSV (atomic replace); returns the row count."""
+        tmp = f"{path}.{os.getpid()}.tmp"  # grids sharing the store may export concurrently
+        n = 0
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(CSV_COLUMNS)
+            for r in self.rows(metric, weights):
+                w.writerow(["" if r[c] is None else r[c] for c in CSV_COLUMNS])
+                n += 1
+        os.replace(tmp, path)
+        return n
+
+    def import_csv(self, path: str, weights: str = "", base_seed: int = 0) -> int:
+        """
+        Load a results_dashboard.csv (rows without the key columns are
+        skipped), as one grid whose cell_index is the file order.
+        """
+        grid = make_grid_id(imported=os.path.abspath(path))
+        n = 0
+        with open(path, newline="", encoding="utf-8") as f:
+            for i, r in enumerate(csv.DictReader(f)):
+                try:
+                    key = make_key(weights=weights, base_seed=base_seed,
+                                   **{c: r[c] for c in KEY_COLUMNS if c not in ("weights", "base_seed")})
+                except (KeyError, TypeError, ValueError):
+                    continue
+                self.put(key, dict(r, grid_id=grid, cell_index=i))
+                n += 1
+        return n
+
+
+# ----------------------------- CLI -----------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Store de résultats des grilles (SQLite WAL) <-> CSV")
+    ap.add_argument("cmd", choices=["export", "import"])
+    ap.add_argument("--store", required=True, help="fichier SQLite")
+    ap.add_argument("--out", default="results_dashboard.csv", help="export: CSV écrit")
+    ap.add_argument("--csv", default=None, help="import: CSV lu")
+    ap.add_argument("--metric", default=None, help="export: seulement cette métrique")
+    ap.add_argument("--weights", default=None, help="poids L1..L5 (export: filtre, import: valeur)")
+    ap.add_argument("--base_seed", type=int, default=0, help="import: --seed de la grille d'origine")
+    args = ap.parse_args()
+
+    with ResultStore(args.store) as store:
+        if args.cmd == "export":
+            n = store.export_csv(args.out, args.metric, args.weights)
+            print(f"[OK] {n} rows → {args.out}")
+        else:
+            if not args.csv:
+                ap.error("import requires --csv")
+            n = store.import_csv(args.csv, args.weights or "", args.base_seed)
+            print(f"[OK] {n} rows from {args.csv} → {args.store}")
+
+
+if __name__ == "__main__":
+    main()
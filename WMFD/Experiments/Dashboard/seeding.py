@@ -0,0 +1,79 @@
+# -- coding: utf-8 --
+"""
+seeding.py — deterministic per-cell, per-stage seeds for the grid
+
+A seed is derived from the grid --seed and the parameters a stage
+actually depends on, through numpy's SeedSequence:
+
+    SeedSequence(base_seed, spawn_key=(stage, *words(params))).generate_state(1)
+
+where words() is the SHA-256 of a canonical text form of the parameters
+(sorted names, ints as ints, floats via repr, strings as-is), cut into
+uint32 words. Unlike hash(), this does not depend on PYTHONHASHSEED, the
+process, the platform or the order of the keyword arguments, so a cell
+gives the same seeds on any worker or node, and reruns are bit-identical.
+
+Stages are nested, each one keyed by its own inputs only:
+
+    dataset  : k, L, n_per_group, plevel, repeat      (generator)
+    noise    : dataset + noise_mode, noise              (leaf swap / drop)
+    cluster  : noise + metric, weights                  (K-medoids restarts)
+
+so every metric / noise variant of a cell sees the same generated trees.
+Changing the derivation changes every result: bump SEED_VERSION then.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+SEED_VERSION = 1
+
+STAGES = ("dataset", "noise", "cluster")
+
+
+def _canon(v) -> str:
+    if isinstance(v, bool) or v is None:
+        return repr(v)
+    if isinstance(v, (int, np.integer)):
+        return str(int(v))
+    if isinstance(v, (float, np.floating)):
+        return repr(float(v))
+    if isinstance(v, str):
+        return v
+    raise TypeError(f"unsupported seed parameter type: {type(v).__name__}")
+
+
+def _words(params: dict) -> Tuple[int, ...]:
+    text = "\x1f".join(f"{k}={_canon(params[k])}" for k in sorted(params))
+    digest = hashlib.sha256(f"v{SEED_VERSION}\x1e{text}".encode("utf-8")).digest()
+    return tuple(int.from_bytes(digest[i:i + 4], "little") for i in range(0, len(digest), 4))
+
+
+def derive_seed(base_seed: int, stage: str, **params) -> int:
+    """uint32 seed for one stage from the grid seed and that stage's parameters."""
+    if stage not in STAGES:
+        raise ValueError(f"unknown stage: {stage}")
+    ss = np.random.SeedSequence(int(base_seed), spawn_key=(STAGES.index(stage),) + _words(params))
+    return int(ss.generate_state(1, dtype=np.uint32)[0])
+
+
+@dataclass(frozen=True)
+class CellSeeds:
+    dataset: int
+    noise: int
+    cluster: int
+
+
+def cell_seeds(base_seed: int, k: int, L: int, n_per_group: int, plevel: float, repeat: int,
+               noise_mode: str, noise: float, metric: str, weights: str) -> CellSeeds:
+    """Seeds of the three stages of one grid cell."""
+    data = dict(k=k, L=L, n_per_group=n_per_group, plevel=plevel, repeat=repeat)
+    noisy = dict(data, noise_mode=noise_mode, noise=noise)
+    return CellSeeds(
+        derive_seed(base_seed, "dataset", **data),
+        derive_seed(base_seed, "noise", **noisy),
+        derive_seed(base_seed, "cluster", **dict(noisy, metric=metric, weights=weights)),
+    )
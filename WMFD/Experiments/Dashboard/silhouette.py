@@ -0,0 +1,208 @@
+# -- coding: utf-8 --
+"""
+silhouette.py — silhouette from per-cluster distance sums
+
+sklearn's silhouette_score(D, labels, metric="precomputed") rescans the
+full n×n matrix for every labelling. Here every point keeps the sum of its
+distances to each cluster,
+
+    S[i, c] = Σ_{j: label(j)=c} D[i, j]        (n × k)
+
+from which a(i) = S[i, own] / (|own| - 1) and b(i) = min_{c≠own} S[i, c] / |c|
+follow in O(n·k). When labels change (a PAM swap, the k → k+1 step of a
+sweep, another restart) only the columns of the moved points are read:
+O(n · #moved) instead of O(n²).
+
+SilhouetteState(D, labels)   exact, incremental (move / relabel / add_cluster)
+silhouette_score(D, labels)  exact one-shot value (same convention as sklearn:
+                             singletons score 0, NaN when k < 2 or k >= n)
+silhouette_sample(D, labels, m)
+                             estimate from m sampled points (O(m·n)) with a
+                             normal confidence interval and a distribution-free
+                             Hoeffding bound (s(i) lies in [-1, 1]).
+
+relabel(..., align=True) first permutes the new cluster ids to best overlap
+the current ones (the silhouette does not depend on the ids), so two
+solutions from independent restarts still differ by few moves.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+def _as_labels(labels) -> np.ndarray:
+    labs = np.asarray(labels, dtype=np.intp).ravel()
+    if labs.size and labs.min() < 0:
+        raise ValueError("labels must be >= 0")
+    return labs
+
+
+def _point_scores(S: np.ndarray, own: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """s(i) from the rows S (m × k), their own cluster and the cluster sizes."""
+    m = S.shape[0]
+    rows = np.arange(m)
+    n_own = counts[own]
+    a = np.where(n_own > 1, S[rows, own] / np.maximum(n_own - 1, 1), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_to = S / counts[None, :]
+    mean_to[:, counts == 0] = np.inf
+    mean_to[rows, own] = np.inf
+    b = mean_to.min(axis=1)
+    den = np.maximum(a, b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(den > 0, (b - a) / den, 0.0)
+    s[n_own <= 1] = 0.0
+    return s
+
+
+def _cluster_sums(D: np.ndarray, labels: np.ndarray, k: int, rows=None) -> np.ndarray:
+    """S[rows, c] for every cluster c (all rows when rows is None)."""
+    R = D if rows is None else D[rows]
+    S = np.zeros((R.shape[0], k))
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        if members.size:
+            S[:, c] = R[:, members].sum(axis=1)
+    return S
+
+
+# ---- exact, incremental ----
+
+class SilhouetteState:
+    """Per-cluster distance sums of one labelling, updated as labels move."""
+
+    def __init__(self, D, labels, k: Optional[int] = None):
+        self.D = np.asarray(D, dtype=float)
+        labs = _as_labels(labels)
+        if labs.shape[0] != self.D.shape[0]:
+            raise ValueError("labels and D sizes differ")
+        k = int(labs.max()) + 1 if k is None else int(k)
+        self.labels = labs.copy()
+        self.counts = np.bincount(labs, minlength=k).astype(float)
+        self.S = _cluster_sums(self.D, labs, k)
+
+    @property
+    def k(self) -> int:
+        return self.S.shape[1]
+
+    @property
+    def n_clusters(self) -> int:
+        return int(np.count_nonzero(self.counts))
+
+    def add_cluster(self) -> int:
+        """Append an empty cluster; returns its id."""
+        self.S = np.hstack([self.S, np.zeros((self.S.shape[0], 1))])
+        self.counts = np.append(self.counts, 0.0)
+        return self.k - 1
+
+    def move(self, i: int, c: int) -> None:
+        """Point i joins cluster c: O(n)."""
+        old = int(self.labels[i])
+        if old == c:
+            return
+        while c >= self.k:
+            self.add_cluster()
+        col = self.D[:, i]
+        self.S[:, old] -= col
+        self.S[:, c] += col
+        self.counts[old] -= 1
+        self.counts[c] += 1
+        self.labels[i] = c
+
+    def align(self, labels) -> np.ndarray:
+        """labels with ids permuted to maximise the overlap with the current ones."""
+        from scipy.optimize import linear_sum_assignment
+        labs = _as_labels(labels)
+        k_new = int(labs.max()) + 1
+        k_all = max(k_new, self.k)
+        C = np.zeros((k_new, k_all))
+        np.add.at(C, (labs, self.labels), 1.0)
+        r, c = linear_sum_assignment(-C)
+        perm = np.full(k_new, -1, dtype=np.intp)
+        perm[r] = c
+        free = iter(sorted(set(range(k_all + k_new)) - set(c.tolist())))
+        for j in np.flatnonzero(perm < 0):
+            perm[j] = next(free)
+        return perm[labs]
+
+    def relabel(self, labels, align: bool = False) -> int:
+        """Switch to a new labelling; returns the number of moved points."""
+        labs = self.align(labels) if align else _as_labels(labels)
+        if labs.shape != self.labels.shape:
+            raise ValueError("labels and D sizes differ")
+        while int(labs.max()) >= self.k:
+            self.add_cluster()
+        moved = np.flatnonzero(labs != self.labels)
+        if moved.size == 0:
+            return 0
+        old = self.labels[moved]
+        new = labs[moved]
+        for c in np.union1d(old, new):
+            into = moved[new == c]
+            out = moved[old == c]
+            if into.size:
+                self.S[:, c] += self.D[:, into].sum(axis=1)
+            if out.size:
+                self.S[:, c] -= self.D[:, out].sum(axis=1)
+        self.counts += np.bincount(new, minlength=self.k) - np.bincount(old, minlength=self.k)
+        self.labels = labs.copy()
+        return int(moved.size)
+
+    def samples(self) -> np.ndarray:
+        """s(i) for every point."""
+        return _point_scores(self.S, self.labels, self.counts)
+
+    def score(self) -> float:
+        kk = self.n_clusters
+        if kk < 2 or kk >= self.D.shape[0]:
+            return float("nan")
+        return float(np.mean(self.samples()))
+
+
+def silhouette_score(D, labels) -> float:
+    """Exact mean silhouette on a precomputed matrix (labels 0..k-1)."""
+    return SilhouetteState(D, labels).score()
+
+
+# ---- sampled approximation ----
+
+@dataclass
+class SilhouetteEstimate:
+    value: float            # mean s(i) over the sample
+    stderr: float           # standard error (finite-population corrected)
+    low: float              # normal confidence interval
+    high: float
+    hoeffding: float        # |value - exact| <= hoeffding with prob. >= 1 - delta
+    m: int                  # sampled points
+    n: int
+
+
+def silhouette_sample(D, labels, m: int = 1000, seed: Optional[int] = 0,
+                      z: float = 1.96, delta: float = 0.05) -> SilhouetteEstimate:
+    """
+    Silhouette estimated from m points drawn without replacement, each scored
+    exactly against all n points (O(m·n)). With m >= n this is the exact value.
+    A fixed seed gives the same sample for every labelling of the same D.
+    """
+    D = np.asarray(D, dtype=float)
+    labs = _as_labels(labels)
+    n = labs.shape[0]
+    k = int(labs.max()) + 1
+    counts = np.bincount(labs, minlength=k).astype(float)
+    if np.count_nonzero(counts) < 2 or np.count_nonzero(counts) >= n:
+        nan = float("nan")
+        return SilhouetteEstimate(nan, nan, nan, nan, nan, 0, n)
+    m = int(min(max(m, 1), n))
+    idx = np.arange(n) if m == n else np.sort(np.random.default_rng(seed).choice(n, m, replace=False))
+    s = _point_scores(_cluster_sums(D, labs, k, idx), labs[idx], counts)
+    value = float(s.mean())
+    if m == n:
+        return SilhouetteEstimate(value, 0.0, value, value, 0.0, m, n)
+    fpc = math.sqrt((n - m) / (n - 1))
+    se = float(s.std(ddof=1) / math.sqrt(m) * fpc) if m > 1 else float("inf")
+    # s(i) in [-1, 1]: Hoeffding (also valid without replacement)
+    hb = 2.0 * math.sqrt(math.log(2.0 / delta) / (2.0 * m))
+    return SilhouetteEstimate(value, se, value - z * se, value + z * se, hb, m, n)
@@ -10,9 +10,10 @@ What it does
 - For each run folder, if it contains trees.csv and/or trees_noisy.csv,
   it computes the WMFD pairwise distance matrix.
 - Writes outputs next to each input, under a wmfd/ subfolder:
-    - <name>_wmfd_matrix.csv  (NxN matrix with headers)
-    - <name>_wmfd_pairs.csv   (upper-triangle i<j)
+    - <name>_wmfd.dmat        (binary condensed matrix + ids, see distmat.py)
     - <name>_labels.csv       (id,true_cluster)
+    - <name>_wmfd_matrix.csv / <name>_wmfd_pairs.csv only if WMFD_WRITE_CSV=1
+      (or later: python distmat.py to-csv <name>_wmfd.dmat ...)
 
 Inputs (per file)
 -----------------
@@ -24,18 +25,25 @@ CSV with columns (case/space/BOM tolerant):
 Outputs (per input file)
 ------------------------
 {run_dir}/wmfd/
-  - trees_wmfd_matrix.csv
-  - trees_wmfd_pairs.csv
+  - trees_wmfd.dmat
   - trees_labels.csv
 and/or
-  - trees_noisy_wmfd_matrix.csv
-  - trees_noisy_wmfd_pairs.csv
+  - trees_noisy_wmfd.dmat
   - trees_noisy_labels.csv
 
 Notes
 -----
 - WMFD uses pairwise min-max normalization per channel (BL/H/W/D).
 - If you re-run, files are overwritten by default.
+- Set WMFD_N_JOBS (e.g. 8, or -1 for all cores) to compute each matrix
+  with a process pool; the result does not depend on the worker count.
+- Per-tree features are cached by Newick hash (see feature_cache.py), so
+  re-running on the same trees (e.g. another λ setting) skips ete3 parsing.
+  WMFD_FEATURE_CACHE=off disables it.
+- λ sweep: set WMFD_LAMBDA_GRID to a CSV of L1..L5 rows. The per-pair
+  components are computed once per input (wmfd/<name>_wmfd_components.npz)
+  and every λ row gives wmfd/sweep/<name>_wmfd_lNNN.dmat, listed in
+  wmfd/<name>_sweep_index.csv.
 - No PowerShell args needed; just python step1b_metric_wmfd.py.
 """
 
@@ -45,6 +53,14 @@ import sys
 from typing import Dict, Set, List, Tuple
 from ete3 import Tree
 
+import distmat
+import wmfd_kernel
+import feature_cache
+
+N_JOBS = int(os.environ.get("WMFD_N_JOBS", "1"))
+WRITE_CSV = os.environ.get("WMFD_WRITE_CSV", "0") == "1"
+LAMBDA_GRID = os.environ.get("WMFD_LAMBDA_GRID", "")
+
 # ----------------------------- IO utils -----------------------------
 
 def _norm_keys(fieldnames):
@@ -62,8 +78,8 @@ def _pick_key(keys_map, wanted):
             return orig
     return None
 
-def read_trees_csv(in_csv: str):
-    """Read a trees CSV and validate required columns + Newick parsing."""
+def read_trees_csv(in_csv: str, validate: bool = True):
+    """Read a trees CSV and validate required columns (+ Newick parsing if `validate`)."""
     if not os.path.exists(in_csv):
         raise FileNotFoundError(f"Missing file: {in_csv}")
 
@@ -100,10 +116,11 @@ def read_trees_csv(in_csv: str):
                 raise ValueError(f"Invalid row (cluster='{cs}', tree_id='{ts}') in {in_csv}")
 
             # Validate Newick quickly
-            try:
-                _ = Tree(nw, format=1)
-            except Exception as e:
-                raise ValueError(f"Newick parse error for id={c}.{t} in {in_csv}: {e}")
+            if validate:
+                try:
+                    _ = Tree(nw, format=1)
+                except Exception as e:
+                    raise ValueError(f"Newick parse error for id={c}.{t} in {in_csv}: {e}")
 
             ids.append(f"{c}.{t}")
             clusters.append(c)
@@ -130,7 +147,7 @@ def _parent_degree(leaf) -> int:
 
 def precompute_features(nwk: str):
     """
-    Return (tree, leaf_BL, leaf_H, leaf_W, leaf_D, leaf_set, splits_set).
+    Return (tree, leaf_BL, leaf_H, leaf_W, leaf_D, leaf_set, split_keys).
     BL/H/W/D are raw here; pairwise min-max normalization is done in wmfd_pair.
     """
     t = Tree(nwk, format=1)
@@ -150,13 +167,7 @@ def precompute_features(nwk: str):
 
     leaf_set: Set[str] = set(leaf_BL.keys())
 
-    splits: Set[frozenset] = set()
-    for node in t.traverse("postorder"):
-        if node.is_leaf():
-            continue
-        clade = frozenset(l.name for l in node.iter_leaves())
-        if 1 < len(clade) < len(leaf_set):
-            splits.add(clade)
+    splits = wmfd_kernel.split_hashes(t)  # sorted uint64 split keys
 
     return t, leaf_BL, leaf_H, leaf_W, leaf_D, leaf_set, splits
 
@@ -229,30 +240,22 @@ def wmfd_pair(A, B, L1: float, L2: float, L3: float, L4: float, L5: float) -> fl
     WND_uncommon = L1*BL_uncommon + L2*H_uncommon + L3*W_uncommon + L4*D_uncommon
 
     # HD on splits (Jaccard)
-    unionS = S1 | S2
-    interS = S1 & S2
-    HD = 1.0 - (len(interS)/len(unionS)) if len(unionS) > 0 else 0.0
+    HD = wmfd_kernel.split_distance(S1, S2)
 
     return float(P * WND_uncommon + WND_common + L5 * HD)
 
 # ----------------------------- Writers -----------------------------
 
-def write_outputs(ids, clusters, D, out_matrix, out_pairs, out_labels):
-    n = len(ids)
-    os.makedirs(os.path.dirname(out_matrix), exist_ok=True)
-
-    with open(out_matrix, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["id"] + ids)
-        for i in range(n):
-            w.writerow([ids[i]] + [("{:.8f}".format(D[i][j])) for j in range(n)])
+def write_outputs(ids, clusters, D, out_dmat, out_labels,
+                  out_matrix=None, out_pairs=None, meta=None):
+    os.makedirs(os.path.dirname(out_dmat), exist_ok=True)
+    distmat.write_dmat(out_dmat, ids, D, meta=meta)
 
-    with open(out_pairs, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["id_i","id_j","dist"])
-        for i in range(n):
-            for j in range(i+1, n):
-                w.writerow([ids[i], ids[j], "{:.8f}".format(D[i][j])])
+    # Text layouts only on request (same content as the .dmat).
+    if out_matrix:
+        distmat.write_matrix_csv(out_matrix, ids, D)
+    if out_pairs:
+        distmat.write_pairs_csv(out_pairs, ids, distmat.open_dmat(out_dmat))
 
     with open(out_labels, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
@@ -260,33 +263,89 @@ def write_outputs(ids, clusters, D, out_matrix, out_pairs, out_labels):
         for i, lab in enumerate(clusters):
             w.writerow([ids[i], lab])
 
+def read_lambda_grid(path: str) -> List[Tuple[float, ...]]:
+    """Rows of 5 lambdas (L1..L5); a non-numeric header line is skipped."""
+    grid = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            vals = [v.strip() for v in row if v.strip()]
+            if not vals:
+                continue
+            try:
+                lam = tuple(float(v) for v in vals)
+            except ValueError:
+                if not grid:
+                    continue  # header
+                raise
+            if len(lam) != 5:
+                raise ValueError(f"{path}: expected 5 lambdas per row, got {len(lam)}")
+            grid.append(lam)
+    if not grid:
+        raise ValueError(f"No lambda rows in {path}")
+    return grid
+
 # ----------------------------- Core runner --------------------------
 
-def process_one_csv(in_csv: str, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10):
-    ids, clusters, newicks = read_trees_csv(in_csv)
-    feats = [precompute_features(nwk) for nwk in newicks]
+def load_features(in_csv: str):
+    # Newicks are validated by precompute_features on cache misses only.
+    ids, clusters, newicks = read_trees_csv(in_csv, validate=False)
+    try:
+        feats = feature_cache.cached_features(newicks, precompute_features, "step1b", labels=ids)
+    except ValueError as e:
+        raise ValueError(f"{e} in {in_csv}")
+    return ids, clusters, feats
+
+def process_one_csv(in_csv: str, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10, n_jobs=N_JOBS):
+    ids, clusters, feats = load_features(in_csv)
 
     n = len(ids)
-    D = [[0.0]*n for _ in range(n)]
     base = os.path.basename(in_csv)
     print(f"[WMFD] {base}  0/{n}")
-    for i in range(n):
-        if (i % 5) == 0 and i > 0:
-            print(f"[WMFD] {base}  {i}/{n}")
-        for j in range(i+1, n):
-            d = wmfd_pair(feats[i], feats[j], L1, L2, L3, L4, L5)
-            D[i][j] = D[j][i] = float(d)
+    # Same values as wmfd_pair over all i<j, computed by the vectorized kernel.
+    D = wmfd_kernel.wmfd_matrix(feats, L1, L2, L3, L4, L5, normalize=True, n_jobs=n_jobs)
     print(f"[WMFD] {base}  {n}/{n}")
 
     run_dir   = os.path.dirname(in_csv)
     out_dir   = os.path.join(run_dir, "wmfd")
     stem      = os.path.splitext(os.path.basename(in_csv))[0]  # "trees" or "trees_noisy"
-    out_matrix = os.path.join(out_dir, f"{stem}_wmfd_matrix.csv")
-    out_pairs  = os.path.join(out_dir, f"{stem}_wmfd_pairs.csv")
+    out_dmat   = os.path.join(out_dir, f"{stem}_wmfd{distmat.EXT}")
+    out_matrix = os.path.join(out_dir, f"{stem}_wmfd_matrix.csv") if WRITE_CSV else None
+    out_pairs  = os.path.join(out_dir, f"{stem}_wmfd_pairs.csv") if WRITE_CSV else None
     out_labels = os.path.join(out_dir, f"{stem}_labels.csv")
 
-    write_outputs(ids, clusters, D, out_matrix, out_pairs, out_labels)
-    print(f"[OK] WMFD → {out_matrix}")
+    meta = {"metric": "wmfd", "lambdas": [L1, L2, L3, L4, L5], "source": os.path.basename(in_csv)}
+    write_outputs(ids, clusters, D, out_dmat, out_labels, out_matrix, out_pairs, meta=meta)
+    print(f"[OK] WMFD → {out_dmat}")
+
+def sweep_one_csv(in_csv: str, grid: List[Tuple[float, ...]]):
+    """One .dmat per λ row of `grid`, from a single computation of the WMFD components."""
+    ids, clusters, feats = load_features(in_csv)
+    base = os.path.basename(in_csv)
+    print(f"[WMFD] {base}  components for {len(ids)} trees, {len(grid)} λ rows")
+    comps = wmfd_kernel.wmfd_components(feats)
+
+    out_dir   = os.path.join(os.path.dirname(in_csv), "wmfd")
+    sweep_dir = os.path.join(out_dir, "sweep")
+    stem      = os.path.splitext(base)[0]
+    os.makedirs(sweep_dir, exist_ok=True)
+    comps.save(os.path.join(out_dir, f"{stem}_wmfd_components.npz"))
+
+    index = []
+    for idx, (lam, D) in enumerate(comps.sweep(grid, normalize=True)):
+        out_dmat = os.path.join(sweep_dir, f"{stem}_wmfd_l{idx:03d}{distmat.EXT}")
+        meta = {"metric": "wmfd", "lambdas": list(grid[idx]), "source": base}
+        distmat.write_dmat(out_dmat, ids, D, meta=meta)
+        index.append([idx, *grid[idx], os.path.relpath(out_dmat, out_dir)])
+
+    with open(os.path.join(out_dir, f"{stem}_labels.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["id","true_cluster"])
+        w.writerows(zip(ids, clusters))
+    with open(os.path.join(out_dir, f"{stem}_sweep_index.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["idx", "L1", "L2", "L3", "L4", "L5", "dmat"])
+        w.writerows(index)
+    print(f"[OK] WMFD sweep → {sweep_dir} ({len(grid)} matrices)")
 
 # ----------------------------- Discovery ----------------------------
 
@@ -362,9 +421,16 @@ def main():
     for p in csvs:
         print("  ·", p)
 
+    grid = read_lambda_grid(LAMBDA_GRID) if LAMBDA_GRID else None
+    if grid:
+        print(f"\nλ sweep: {len(grid)} rows from {LAMBDA_GRID}")
+
     for path in csvs:
         try:
-            process_one_csv(path)
+            if grid:
+                sweep_one_csv(path, grid)
+            else:
+                process_one_csv(path)
         except Exception as e:
             print(f"[WARN] {path}: {e}")
 
@@ -8,11 +8,14 @@ Behavior
 - Start roots: current working directory AND ./A_noise_dense (if exists)
 - Discover runs by presence of a "wmfd" subfolder
 - For each run, pick matrix:
-    prefer clean: wmfd/trees_wmfd_matrix.csv
-    fallback    : wmfd/trees_noisy_wmfd_matrix.csv
+    prefer clean: wmfd/trees_wmfd.dmat, then wmfd/trees_wmfd_matrix.csv
+    fallback    : wmfd/trees_noisy_wmfd.dmat, then wmfd/trees_noisy_wmfd_matrix.csv
+  (.dmat files are memory-mapped, see distmat.py)
 - Try K in 2..min(12, N-1) (K=1 skipped because silhouette is undefined)
 - Select best K by:
-    1) highest Silhouette (metric='precomputed')
+    1) highest Silhouette (metric='precomputed'; per-cluster distance sums
+       updated from one K to the next, see silhouette.py; sampled estimate
+       when N > WMFD_SIL_SAMPLE, if set)
     2) tie-break: highest Calinski–Harabasz (medoid adaptation)
     3) tie-break: lowest Davies–Bouldin (medoid adaptation)
 - If labels are available (trees.csv or labels.csv), compute ARI (not used for selection)
@@ -31,7 +34,13 @@ import math
 from typing import List, Tuple, Optional
 
 import numpy as np
-from sklearn.metrics import silhouette_score
+import distmat
+import silhouette
+import cluster_validity
+
+# Above this many trees the silhouette is estimated from this many sampled
+# points (same sample for every K); 0 = always exact.
+SIL_SAMPLE = int(os.environ.get("WMFD_SIL_SAMPLE", "0"))
 
 # Try sklearn-extra
 _BACKEND = None
@@ -49,6 +58,9 @@ def _to_float(x: str) -> float:
     return float(x) if x else 0.0
 
 def read_distance_matrix(path: str) -> Tuple[List[str], np.ndarray]:
+    if distmat.is_dmat(path):
+        cm = distmat.open_dmat(path)
+        return cm.ids, cm.to_square()
     with open(path, newline="", encoding="utf-8") as f:
         rdr = csv.reader(f)
         rows = list(rdr)
@@ -151,58 +163,31 @@ def adjusted_rand_index(y_true: List[int], y_pred: List[int]) -> float:
         return 1.0 if nij_sum == max_index else 0.0
     return (nij_sum - expected) / denom
 
-def silhouette_from_precomputed(D: np.ndarray, labels_1: List[int]) -> float:
+def silhouette_from_precomputed(D: np.ndarray, labels_1: List[int],
+                                state: Optional[silhouette.SilhouetteState] = None) -> float:
     labs0 = np.asarray(labels_1, dtype=int) - 1
     if len(np.unique(labs0)) < 2:
         return float("nan")
-    return float(silhouette_score(D, labs0, metric="precomputed"))
+    if SIL_SAMPLE and D.shape[0] > SIL_SAMPLE:
+        return silhouette.silhouette_sample(D, labs0, m=SIL_SAMPLE, seed=0).value
+    if state is None:
+        return silhouette.silhouette_score(D, labs0)
+    state.relabel(labs0, align=True)
+    return state.score()
 
 def objective_sum_to_medoids(D: np.ndarray, labels_1: List[int], medoids: List[int]) -> float:
     idx = np.arange(D.shape[0])
     meds = np.array([medoids[lab - 1] for lab in labels_1], dtype=int)
     return float(np.sum(D[idx, meds]))
 
-def ch_medoids(D: np.ndarray, labels_1: List[int], medoids: List[int]) -> float:
-    n = D.shape[0]
-    k = len(set(labels_1))
-    if k < 2 or n <= k:
-        return float("nan")
-    within = 0.0
-    labs = np.asarray(labels_1, dtype=int)
-    for c in range(1, k + 1):
-        members = np.where(labs == c)[0]
-        if members.size == 0:
-            return float("nan")
-        m = medoids[c - 1]
-        within += float(np.sum(D[members, m] ** 2))
-    sums = np.sum(D, axis=1)
-    g = int(np.argmin(sums))
-    total = float(np.sum(D[:, g] ** 2))
-    between = max(total - within, 0.0)
-    return (between / (k - 1)) / (within / (n - k)) if within > 0 else float("inf")
+def ch_medoids(D: np.ndarray, labels_1: List[int], medoids: List[int],
+               center: Optional[int] = None) -> float:
+    labs0 = np.asarray(labels_1, dtype=int) - 1
+    return cluster_validity.ch_medoids(D, labs0, medoids, center=center)
 
 def db_medoids(D: np.ndarray, labels_1: List[int], medoids: List[int]) -> float:
-    k = len(set(labels_1))
-    if k < 2:
-        return float("nan")
-    labs = np.asarray(labels_1, dtype=int)
-    S = np.zeros(k, dtype=float)
-    for c in range(1, k + 1):
-        members = np.where(labs == c)[0]
-        if members.size == 0:
-            return float("nan")
-        m = medoids[c - 1]
-        S[c - 1] = float(np.mean(D[members, m])) if members.size > 0 else 0.0
-    R = np.zeros((k, k), dtype=float)
-    for i in range(k):
-        for j in range(k):
-            if i == j:
-                R[i, j] = 0.0
-            else:
-                dij = float(D[medoids[i], medoids[j]])
-                R[i, j] = (S[i] + S[j]) / dij if dij > 0 else np.inf
-    Ri = np.max(R, axis=1)
-    return float(np.mean(Ri))
+    labs0 = np.asarray(labels_1, dtype=int) - 1
+    return cluster_validity.db_medoids(D, labs0, medoids)
 
 
 # ----------------------------- K-Medoids engines -----------------------------
@@ -281,10 +266,14 @@ def run_kmedoids(D: np.ndarray, k: int, seed=0, n_init=10, max_iter=100):
 
 def choose_best_K(D: np.ndarray, K_list: List[int], seed=0, max_iter=100):
     results = []
+    sil_state = None
+    center = cluster_validity.global_medoid(D)
     for k in K_list:
         labels, medoids, obj, iters, backend = run_kmedoids(D, k, seed=seed, n_init=10, max_iter=max_iter)
-        sil = silhouette_from_precomputed(D, labels) if k >= 2 else float("nan")
-        ch  = ch_medoids(D, labels, medoids) if k >= 2 else float("nan")
+        if k >= 2 and sil_state is None:
+            sil_state = silhouette.SilhouetteState(D, np.asarray(labels, dtype=int) - 1)
+        sil = silhouette_from_precomputed(D, labels, sil_state) if k >= 2 else float("nan")
+        ch  = ch_medoids(D, labels, medoids, center) if k >= 2 else float("nan")
         db  = db_medoids(D, labels, medoids) if k >= 2 else float("nan")
         results.append(dict(k=k, labels=labels, medoids=medoids, obj=obj, iters=iters,
                             sil=sil, ch=ch, db=db, backend=backend))
@@ -308,12 +297,11 @@ def find_runs(roots: List[str]) -> List[str]:
     return sorted(runs)
 
 def pick_matrix(run_dir: str) -> Optional[str]:
-    cand_clean = os.path.join(run_dir, "wmfd", "trees_wmfd_matrix.csv")
-    cand_noisy = os.path.join(run_dir, "wmfd", "trees_noisy_wmfd_matrix.csv")
-    if os.path.exists(cand_clean):
-        return cand_clean
-    if os.path.exists(cand_noisy):
-        return cand_noisy
+    for stem in ("trees", "trees_noisy"):
+        for name in (f"{stem}_wmfd{distmat.EXT}", f"{stem}_wmfd_matrix.csv"):
+            cand = os.path.join(run_dir, "wmfd", name)
+            if os.path.exists(cand):
+                return cand
     return None
 
 
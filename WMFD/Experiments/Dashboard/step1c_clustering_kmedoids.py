@@ -3,7 +3,8 @@
 Step 1c) Clustering from pairwise distances (WMFD or RF) -> predicted partitions.
 
 Entry:
-- -matrix: CSV N N in the format:
+- -matrix: binary .dmat written by 1b (memory-mapped, see distmat.py),
+  or a CSV N N in the format:
     id,1.1,1.2,1.3,...
     1.1,0,  d12, d13,...
     1.2,d21, 0,  d23,...
@@ -20,40 +21,34 @@ Outputs:
 - metrics.csv   : k,objective,sum_intra,ARI(optional),n_iter,n_init,seed
 
 Algo: K-medoids (simplified PAM) on pre-calculated distances, with n_init random restarts.
+The matrix is a NumPy array (vectorized assignment / medoid update); restarts
+use independent seeds spawned from --seed and can run on a process pool
+(--n_jobs, default WMFD_N_JOBS or 1). The kept result is the best objective,
+ties going to the lowest restart index, so it does not depend on n_jobs.
 """
 
+import os
 import csv
 import argparse
-import random
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple
 
+import numpy as np
+
+import distmat
+
+N_JOBS = int(os.environ.get("WMFD_N_JOBS", "1"))
+
 # --------- Read/Write Utilities ----------
 
 def read_distance_matrix(path: str):
-    with open(path, newline="", encoding="utf-8") as f:
-        rdr = csv.reader(f)
-        rows = list(rdr)
-    header = rows[0]
-    ids = header[1:]
-    n = len(ids)
-    D = [[0.0]*n for _ in range(n)]
-    for i, row in enumerate(rows[1:]):
-        rid = row[0]
-        if rid != ids[i]:
-            # we tolerate but we force the alignment by position
-            pass
-        vals = row[1:]
-        if len(vals) != n:
-            raise ValueError(f"Ligne {i+1}: taille attendue {n}, trouvée {len(vals)}")
-        for j, v in enumerate(vals):
-            D[i][j] = float(v)
-    # balance + diag=0
-    for i in range(n):
-        D[i][i] = 0.0
-        for j in range(i+1, n):
-            m = 0.5*(D[i][j] + D[j][i])
-            D[i][j] = D[j][i] = m
-    return ids, D
+    """(ids, D) with D a symmetric float64 ndarray, zero diagonal."""
+    if distmat.is_dmat(path):
+        # binary container: already symmetric with a zero diagonal, no parsing
+        cm = distmat.open_dmat(path)
+        return cm.ids, cm.to_square()
+    # CSV: rows aligned by position, balanced as 0.5*(D + D.T), diag = 0
+    return distmat.read_matrix_csv(path)
 
 def write_clusters(path: str, ids: List[str], labels: List[int]):
     with open(path, "w", newline="", encoding="utf-8") as f:
@@ -121,79 +116,95 @@ def read_true_labels(path: str, ids: List[str]):
 
 # ---------- K-medoids ----------
 
-def assign_labels(D, medoids):
-    n = len(D)
-    labels = [0]*n
-    for i in range(n):
-        best, best_c = float("inf"), None
-        for c, m in enumerate(medoids):
-            d = D[i][m]
-            if d < best:
-                best, best_c = d, c+1  # clusters 1..k
-        labels[i] = best_c
-    return labels
-
-def update_medoids(D, labels, k):
-    n = len(D)
+def assign_labels(D: np.ndarray, medoids) -> np.ndarray:
+    """Nearest medoid of every point, as clusters 1..k (first medoid on ties)."""
+    return np.argmin(D[:, medoids], axis=1) + 1
+
+def update_medoids(D: np.ndarray, labels: np.ndarray, k: int):
+    """Per cluster, the member with the smallest distance sum (None if empty)."""
     medoids = [None]*k
     for c in range(1, k+1):
-        members = [i for i in range(n) if labels[i] == c]
-        if not members:
+        members = np.flatnonzero(labels == c)
+        if members.size == 0:
             continue
-        best_sum, best_i = float("inf"), members[0]
-        for i in members:
-            s = 0.0
-            for j in members:
-                s += D[i][j]
-            if s < best_sum:
-                best_sum, best_i = s, i
-        medoids[c-1] = best_i
+        sums = D[np.ix_(members, members)].sum(axis=1)
+        medoids[c-1] = int(members[int(np.argmin(sums))])
     return medoids
 
-def objective(D, labels, medoids):
+def objective(D: np.ndarray, labels: np.ndarray, medoids) -> float:
     # sum of the distances to the medoid of each cluster
-    s = 0.0
-    for i, lab in enumerate(labels):
-        m = medoids[lab-1]
-        s += D[i][m]
-    return s
-
-def k_medoids(D, k, seed=0, n_init=10, max_iter=100):
-    rng = random.Random(seed)
-    n = len(D)
-    best_obj, best_labels, best_meds, best_iters = float("inf"), None, None, 0
-    for run in range(n_init):
-        # random init without duplicate
-        medoids = rng.sample(range(n), k)
+    med = np.asarray(medoids)[np.asarray(labels) - 1]
+    return float(D[np.arange(len(med)), med].sum())
+
+def _one_restart(D: np.ndarray, k: int, seed_seq, max_iter: int):
+    rng = np.random.default_rng(seed_seq)
+    n = D.shape[0]
+    # random init without duplicate
+    medoids = [int(x) for x in rng.choice(n, size=k, replace=False)]
+    labels = assign_labels(D, medoids)
+    it = 0
+    while it < max_iter:
+        it += 1
+        new_medoids = update_medoids(D, labels, k)
+        # if medoid empty, we resample
+        for idx, m in enumerate(new_medoids):
+            if m is None:
+                used = set(new_medoids) | set(medoids)
+                cand = [i for i in range(n) if i not in used]
+                new_medoids[idx] = int(rng.choice(cand))
+        if set(new_medoids) == set(medoids):
+            break
+        medoids = new_medoids
         labels = assign_labels(D, medoids)
-        it = 0
-        while it < max_iter:
-            it += 1
-            new_medoids = update_medoids(D, labels, k)
-            # if medoid empty, we resample
-            for idx, m in enumerate(new_medoids):
-                if m is None:
-                    cand = rng.choice([i for i in range(n) if i not in new_medoids and i not in medoids])
-                    new_medoids[idx] = cand
-            if set(new_medoids) == set(medoids):
-                break
-            medoids = new_medoids
-            labels = assign_labels(D, medoids)
-        obj = objective(D, labels, medoids)
+    return objective(D, labels, medoids), labels, medoids, it
+
+# Matrix shared with the pool workers (inherited under fork, sent once per worker otherwise).
+_WORKER_D = None
+
+def _init_worker(D):
+    global _WORKER_D
+    _WORKER_D = D
+
+def _restart_task(args):
+    k, seed_seq, max_iter = args
+    return _one_restart(_WORKER_D, k, seed_seq, max_iter)
+
+def k_medoids(D, k, seed=0, n_init=10, max_iter=100, n_jobs=1):
+    """
+    Best of n_init restarts (lowest objective, lowest restart index on ties).
+    Restart r is seeded by the r-th child of SeedSequence(seed), so the result
+    is the same for any n_jobs.
+    """
+    D = np.asarray(D, dtype=float)
+    n_init = max(1, n_init)
+    seeds = np.random.SeedSequence(seed).spawn(n_init)
+    tasks = [(k, ss, max_iter) for ss in seeds]
+
+    n_jobs = (os.cpu_count() or 1) if n_jobs is not None and n_jobs < 0 else (n_jobs or 1)
+    n_jobs = min(n_jobs, n_init)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(D,)) as ex:
+            runs = list(ex.map(_restart_task, tasks, chunksize=max(1, n_init // (4 * n_jobs))))
+    else:
+        runs = [_one_restart(D, *t) for t in tasks]
+
+    best_obj, best_labels, best_meds, best_iters = float("inf"), None, None, 0
+    for obj, labels, medoids, it in runs:
         if obj < best_obj:
-            best_obj, best_labels, best_meds, best_iters = obj, labels[:], medoids[:], it
-    return best_labels, best_meds, best_obj, best_iters
+            best_obj, best_labels, best_meds, best_iters = obj, labels, medoids, it
+    return [int(x) for x in best_labels], list(best_meds), best_obj, best_iters
 
 # ---------- Main ----------
 
 def main():
     ap = argparse.ArgumentParser(description="1c) Clustering (K-medoids) from pairwise distance matrix")
-    ap.add_argument("--matrix", type=str, required=True, help="wmfd_matrix.csv (ou RF matrix)")
+    ap.add_argument("--matrix", type=str, required=True, help="trees_wmfd.dmat ou wmfd_matrix.csv (ou RF matrix)")
     ap.add_argument("--k", type=int, required=True, help="nombre de clusters")
     ap.add_argument("--labels", type=str, default=None, help="labels.csv pour ARI (optionnel)")
     ap.add_argument("--seed", type=int, default=0)
     ap.add_argument("--n_init", type=int, default=20, help="redémarrages aléatoires")
     ap.add_argument("--max_iter", type=int, default=100)
+    ap.add_argument("--n_jobs", type=int, default=N_JOBS, help="processus pour les redémarrages (-1 = tous)")
     ap.add_argument("--out_pred", type=str, default="clusters_pred.csv")
     ap.add_argument("--out_medoids", type=str, default="medoids.csv")
     ap.add_argument("--out_kxn", type=str, default="dist_to_medoids.csv")
@@ -202,7 +213,8 @@ def main():
 
     ids, D = read_distance_matrix(args.matrix)
 
-    labels, medoids, obj, n_iter = k_medoids(D, args.k, seed=args.seed, n_init=args.n_init, max_iter=args.max_iter)
+    labels, medoids, obj, n_iter = k_medoids(D, args.k, seed=args.seed, n_init=args.n_init,
+                                             max_iter=args.max_iter, n_jobs=args.n_jobs)
 
     # outputs
     write_clusters(args.out_pred, ids, labels)
@@ -9,6 +9,8 @@ import matplotlib.pyplot as plt
 import gptree_generate_structures as gen
 from ete3 import Tree
 
+import wmfd_kernel
+
 # =============== PARAMS =================
 MAX_RUNS: Optional[int] = None          # None = tous, sinon tronque pour debug (ex: 50)
 MAX_TREES_PER_RUN = 128                 # échantillon par run pour accélérer
@@ -37,7 +39,6 @@ def _precomp(t: Tree):
     W:  Dict[str, float] = {}
     D:  Dict[str, float] = {}
     Ls: Set[str] = set()
-    Splits: Set[frozenset] = set()
 
     for lf in t.iter_leaves():
         nm = str(lf.name)
@@ -47,11 +48,7 @@ def _precomp(t: Tree):
         W[nm]  = 1.0
         D[nm]  = float(len(lf.up.children) if lf.up else 1)
 
-    for nd in t.traverse("postorder"):
-        if not nd.is_leaf():
-            cl = frozenset(le.name for le in nd.iter_leaves())
-            if 1 < len(cl) < len(Ls):
-                Splits.add(cl)
+    Splits = wmfd_kernel.split_hashes(t)  # sorted uint64 split keys
 
     return (t, BL, H, W, D, Ls, Splits)
 
@@ -92,20 +89,15 @@ def wmfd_pair(A, B, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10) -> float:
     Wc = 0.30*(cBL/CNs) + 0.20*(cH/CNs) + 0.25*(cW/CNs) + 0.15*(cD/CNs)
     Wu = 0.30*(uBL/UNCs) + 0.20*(uH/UNCs) + 0.25*(uW/UNCs) + 0.15*(uD/UNCs)
 
-    Usp = S1 | S2; Isp = S1 & S2
-    HD  = 1.0 - (len(Isp)/len(Usp)) if len(Usp) > 0 else 0.0
+    HD  = wmfd_kernel.split_distance(S1, S2)
     P   = 1.0 - (len(I) / TN) if TN > 0 else 0.0
     return float(P*Wu + Wc + 0.10*HD)
 
 def wmfd_matrix_ete(trees: List[Tree]):
     feats = [_precomp(t) for t in trees]
     n = len(feats)
-    D = np.zeros((n, n), dtype=float)
-    for i in range(n):
-        if i % 8 == 0:
-            print(f"[all]   progress {i}/{n}", flush=True)
-        for j in range(i+1, n):
-            D[i, j] = D[j, i] = wmfd_pair(feats[i], feats[j])
+    # wmfd_pair's fixed weights, vectorized (W constant -> dW = 0)
+    D = wmfd_kernel.wmfd_matrix(feats, 0.30, 0.20, 0.25, 0.15, 0.10, use_weight=False)
     print(f"[all]   progress {n}/{n}", flush=True)
     return D
 
@@ -7,10 +7,14 @@ from typing import Dict, Set, Tuple, List, Optional
 import numpy as np
 
 from ete3 import Tree
-from sklearn.metrics import adjusted_rand_score, silhouette_score
-from sklearn.manifold import MDS
+from sklearn.metrics import adjusted_rand_score
 from sklearn.metrics import calinski_harabasz_score
 
+import wmfd_kernel
+import pam_engine
+import silhouette
+import cluster_validity
+
 print("[BOOT] importing generator…", flush=True)
 import gptree_generate_structures as gen
 print("[BOOT] generator imported ✓", flush=True)
@@ -21,6 +25,7 @@ AUTO_K      = True           # True = choisit K automatiquement (silhouette/CH)
 CRITERION   = "silhouette"   # "silhouette" | "ch" | "both"
 KMIN, KMAX  = 2, 10          # bornes pour la recherche de K si AUTO_K=True
 MAX_TREES_PER_RUN: Optional[int] = None  # ex. 128 pour aller + vite (None = tout)
+N_JOBS      = 1              # processus pour la matrice WMFD (-1 = tous les cœurs)
 
 # Grilles "raisonnables" (à ajuster rapidement si besoin)
 Ks      = [2, 3, 4]
@@ -52,13 +57,7 @@ def wmfd_precompute_tree(t: Tree):
         W[nm]  = 1.0
         D[nm]  = float(len(lf.up.children) if lf.up else 1)
     leaf_set: Set[str] = set(BL.keys())
-    splits: Set[frozenset] = set()
-    for nd in t.traverse("postorder"):
-        if nd.is_leaf():
-            continue
-        clade = frozenset(le.name for le in nd.iter_leaves())
-        if 1 < len(clade) < len(leaf_set):
-            splits.add(clade)
+    splits = wmfd_kernel.split_hashes(t)  # sorted uint64 split keys
     return (t, BL, H, W, D, leaf_set, splits)
 
 def _pair_norm(v1: float, v2: float, mn: float, mx: float) -> Tuple[float, float]:
@@ -97,25 +96,14 @@ def wmfd_pair(A, B, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10) -> float:
     Wc = L1*(cBL/CNs) + L2*(cH/CNs) + L3*(cW/CNs) + L4*(cD/CNs)
     Wu = L1*(uBL/UNCs) + L2*(uH/UNCs) + L3*(uW/UNCs) + L4*(uD/UNCs)
 
-    Usp = S1 | S2; Isp = S1 & S2
-    HD  = 1.0 - (len(Isp)/len(Usp)) if len(Usp) > 0 else 0.0
+    HD  = wmfd_kernel.split_distance(S1, S2)
     P   = 1.0 - (CN / TN) if TN > 0 else 0.0
     return float(P*Wu + Wc + L5*HD)
 
-def wmfd_matrix_ete(trees: List[Tree], progress: bool = True) -> np.ndarray:
+def wmfd_matrix_ete(trees: List[Tree], progress: bool = True, n_jobs: int = 1) -> np.ndarray:
     feats = [wmfd_precompute_tree(t) for t in trees]
-    n = len(feats)
-    D = np.zeros((n, n), dtype=float)
-    for i in range(n):
-        if progress and (i % 8 == 0):
-            print(f"[WMFD] {i}/{n}", flush=True)
-        fi = feats[i]
-        for j in range(i+1, n):
-            D[i, j] = D[j, i] = wmfd_pair(fi, feats[j])
-    if progress:
-        print(f"[WMFD] {n}/{n}", flush=True)
-    np.fill_diagonal(D, 0.0)
-    return D
+    # Vectorized equivalent of wmfd_pair over all pairs (W constant -> dW = 0).
+    return wmfd_kernel.wmfd_matrix(feats, use_weight=False, progress=progress, n_jobs=n_jobs)
 
 # ===================== K-MEDOIDS (dynMSC si dispo, sinon PAM) =====================
 def _check_D(D: np.ndarray) -> np.ndarray:
@@ -126,41 +114,44 @@ def _check_D(D: np.ndarray) -> np.ndarray:
     return D
 
 def pam_kmedoids(D: np.ndarray, k: int, max_iter: int = 60, seed: int = 42):
-    rng = np.random.default_rng(seed)
-    D = _check_D(D); n = D.shape[0]
-    # BUILD
-    costs = np.sum(D, axis=1)
-    medoids = [int(np.argmin(costs))]
-    while len(medoids) < k:
-        cur = np.min(D[:, medoids], axis=1)
-        best_gain, best_j = None, None
-        for j in range(n):
-            if j in medoids: continue
-            new_near = np.minimum(cur, D[:, j])
-            gain = float(np.sum(cur) - np.sum(new_near))
-            if (best_gain is None) or (gain > best_gain + 1e-12):
-                best_gain, best_j = gain, j
-        if best_j is None:
-            cand = [x for x in range(n) if x not in medoids]
-            best_j = int(rng.choice(cand))
-        medoids.append(int(best_j))
-    # SWAP
-    for _ in range(max_iter):
-        improved = False
-        current = float(np.sum(np.min(D[:, medoids], axis=1)))
-        non = [i for i in range(n) if i not in medoids]
-        for mi, m in enumerate(medoids):
-            for h in non:
-                trial = medoids.copy(); trial[mi] = h
-                cost = float(np.sum(np.min(D[:, trial], axis=1)))
-                if cost + 1e-12 < current:
-                    medoids = trial; improved = True; break
-            if improved: break
-        if not improved: break
-    labels = np.argmin(D[:, medoids], axis=1).astype(int)
-    return np.array(medoids, int), labels
-
-def choose_k_and_labels(D: np.ndarray, kmin=2, kmax=10, criterion="silhouette", seed=42):
+    # PAM BUILD + FastPAM1 swaps (best swap per pass, cached nearest/second medoid)
+    D = _check_D(D)
+    res = pam_engine.fastpam(D, k, init="build", max_iter=max_iter, seed=seed)
+    return res.medoids, res.labels
+
+def pam_sweep(D: np.ndarray, ks, max_iter: int = 60) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    # {k: (medoids, labels)} for the valid k of ks (2 <= k < n), warm-started:
+    # k+1 starts from the k medoids plus one greedy BUILD medoid
+    ks = [k for k in ks if 2 <= k < D.shape[0]]
+    if not ks:
+        return {}
+    sweep = pam_engine.k_sweep(_check_D(D), min(ks), max(ks), max_iter=max_iter)
+    return {k: (sweep[k].medoids, sweep[k].labels) for k in ks}
+
+class _CHScorer:
+    # CH par K : version médoïde sur D (défaut), ou sur un embedding landmark-MDS
+    def __init__(self, D: np.ndarray, embedding: Optional[str], seed: int):
+        self.D = D
+        self.X = None
+        self.center = None
+        if embedding == "landmark":
+            self.X = cluster_validity.landmark_mds(D, n_components=4, seed=seed)
+        elif embedding is None:
+            self.center = cluster_validity.global_medoid(D)
+        else:
+            raise ValueError(f"unknown CH embedding: {embedding}")
+
+    def __call__(self, labels, medoids) -> float:
+        try:
+            if self.X is not None:
+                return float(calinski_harabasz_score(self.X, labels))
+            return float(cluster_validity.ch_medoids(self.D, labels, medoids, center=self.center))
+        except Exception:
+            return np.nan
+
+def choose_k_and_labels(D: np.ndarray, kmin=2, kmax=10, criterion="silhouette", seed=42,
+                        ch_embedding: Optional[str] = None):
+    # ch_embedding: None = CH médoïde sur la matrice, "landmark" = CH sur landmark-MDS
     D = _check_D(D)
 
     # 1) dynMSC (si dispo) — uniquement pertinent pour "silhouette"
@@ -182,67 +173,62 @@ def choose_k_and_labels(D: np.ndarray, kmin=2, kmax=10, criterion="silhouette",
             if criterion == "silhouette":
                 return bestk, labels, medoids, rangek, sils, sil_star, None
 
-            # if criterion == "both", on calcule aussi CH via MDS
-            X = MDS(n_components=4, dissimilarity="precomputed", random_state=seed,
-                    n_init=1, max_iter=200).fit_transform(D)
-            ch_star = float(calinski_harabasz_score(X, labels))
-            # pour garder la trace des CH par K on refait un petit tour
-            chs = []
-            for k in rangek:
-                if k < 2 or k >= D.shape[0]:
-                    chs.append(np.nan)
-                    continue
-                _, lab_k = pam_kmedoids(D, k=k, seed=seed)
-                try:
-                    chs.append(float(calinski_harabasz_score(X, lab_k)))
-                except Exception:
-                    chs.append(np.nan)
+            # if criterion == "both", on calcule aussi CH par K (un seul balayage PAM warm-start)
+            ch_score = _CHScorer(D, ch_embedding, seed)
+            sweep = pam_sweep(D, rangek)
+            chs = [ch_score(sweep[k][1], sweep[k][0]) if k in sweep else np.nan for k in rangek]
             return bestk, labels, medoids, rangek, sils, sil_star, chs
 
         except Exception as e:
             print(f"[dynMSC] indisponible ({e}). Fallback PAM+{criterion}.", flush=True)
 
     # 2) Fallback full-Python (PAM + métrique choisie)
-    best_k, best_key, best_labels = None, -1e9, None
+    best_k, best_key, best_labels = None, (-1e9, -np.inf), None
     rangek = list(range(max(2, kmin), max(3, kmax)+1))
     sils: List[float] = []
     chs : List[float] = []
 
-    # Embedding MDS si CH utilisé
-    X = None
-    if criterion in ("ch", "both"):
-        X = MDS(n_components=4, dissimilarity="precomputed",
-                random_state=seed, n_init=1, max_iter=200).fit_transform(D)
+    ch_score = _CHScorer(D, ch_embedding, seed) if criterion in ("ch", "both") else None
 
+    # PAM pour tous les K d'un coup (K+1 repart de la solution K), labels gardés par K
+    sweep = pam_sweep(D, rangek)
+    sil_state = None  # sommes de distances par cluster, mises à jour d'un K au suivant
     for k in rangek:
-        if k < 2 or k >= D.shape[0]: 
+        if k not in sweep:
             if criterion in ("ch", "both"): chs.append(np.nan)
             if criterion in ("silhouette", "both"): sils.append(np.nan)
             continue
-        _, labels = pam_kmedoids(D, k=k, seed=seed)
+        meds_k, labels = sweep[k]
         key = 0.0
         s_val = np.nan; c_val = np.nan
         if criterion in ("silhouette", "both"):
-            try:
-                s_val = float(silhouette_score(D, labels, metric="precomputed"))
-            except Exception:
+            if sil_state is None:
+                sil_state = silhouette.SilhouetteState(D, labels)
+            else:
+                sil_state.relabel(labels, align=True)
+            s_val = sil_state.score()
+            if not np.isfinite(s_val):
                 s_val = float("-inf")
             sils.append(s_val)
             key += s_val
         if criterion in ("ch", "both"):
-            try:
-                c_val = float(calinski_harabasz_score(X, labels))
-            except Exception:
+            c_val = ch_score(labels, meds_k)
+            if np.isnan(c_val):
                 c_val = float("-inf")
             chs.append(c_val)
             # faible poids ajouté pour départager si égalité de silhouette
             if criterion == "both":
                 key += 1e-3 * (c_val if np.isfinite(c_val) else 0.0)
+        # Davies–Bouldin (médoïdes, sur la matrice) : départage à égalité (plus bas = mieux)
+        db_val = np.nan
+        if criterion in ("ch", "both"):
+            db_val = cluster_validity.db_medoids(D, labels, meds_k)
+        key = (key, -db_val if np.isfinite(db_val) else -np.inf)
 
         if key > best_key:
             best_k, best_key, best_labels = k, key, labels
 
-    medoids, best_labels = pam_kmedoids(D, k=best_k, seed=seed)
+    medoids, best_labels = sweep[best_k]
     sil_star = (np.nanmax(sils) if sils else None) if criterion in ("silhouette","both") else None
     return best_k, best_labels, medoids, rangek, sils if sils else None, sil_star, chs if chs else None
 
@@ -269,7 +255,7 @@ def run_all():
         print(f"\n[RUN {idx}/{len(runs)}] {r.run_name} | arbres utilisés={len(trees)} | K_true={r.K}", flush=True)
 
         # (1) WMFD
-        D = wmfd_matrix_ete(trees, progress=True)
+        D = wmfd_matrix_ete(trees, progress=True, n_jobs=N_JOBS)
         vals = D[np.triu_indices(D.shape[0], k=1)]
         print(f"[WMFD] shape={D.shape} | min={vals.min():.4f} | max={vals.max():.4f} | mean={vals.mean():.4f}", flush=True)
 
@@ -322,7 +308,7 @@ def run_all():
             sil_star_val = float(sil_star)
         else:
             try:
-                sil_star_val = float(silhouette_score(D, y_pred, metric="precomputed"))
+                sil_star_val = silhouette.silhouette_score(D, y_pred)
             except Exception:
                 sil_star_val = float("nan")
 
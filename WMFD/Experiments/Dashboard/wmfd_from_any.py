@@ -11,84 +11,39 @@ Dependency: ete3  (pip install ete3)
 """
 
 import os
-import re
 import csv
 from typing import List, Tuple, Dict, Set
 from ete3 import Tree
 
-# ----------- Newick detection helpers -----------
+import wmfd_kernel
+import feature_cache
+import newick_io
 
-def _looks_like_newick(s: str) -> bool:
-    s = s.strip().strip('"').strip("'")
-    return "(" in s and ")" in s and s.rstrip().endswith(";")
+# ----------- Newick reading -----------
 
-def _extract_first_newick(s: str) -> str | None:
-    s0 = s.strip().strip('"').strip("'")
-    if not s0:
-        return None
-    m = re.search(r"\(.*?\);", s0, flags=re.DOTALL)
-    return m.group(0).replace("\n", "").replace("\r", "") if m else None
+def _ete_check(nwk: str):
+    Tree(nwk, format=1)
 
-def read_newicks_any(path: str) -> List[str]:
-    """Try line-by-line, then CSV cells, then a global regex extraction."""
+def read_newicks_any(path: str, validate: bool = True) -> List[str]:
+    """
+    Newick strings of a .txt / .csv (optionally gzipped) file, read in one
+    streaming pass (see newick_io). Strings ete3 cannot parse are skipped
+    with a warning; validate=False keeps them (errors then surface in
+    precompute_features).
+    """
     newicks: List[str] = []
-
-    # 1) line-by-line
-    try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            for raw in f:
-                if not raw.strip():
-                    continue
-                if _looks_like_newick(raw):
-                    cand = _extract_first_newick(raw)
-                    if not cand:
-                        continue
-                    try:
-                        _ = Tree(cand, format=1)
-                        newicks.append(cand)
-                    except Exception:
-                        pass
-    except Exception:
-        pass
-    if newicks:
-        return newicks
-
-    # 2) parse CSV cells
-    try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            rdr = csv.reader(f)
-            for row in rdr:
-                for cell in row:
-                    if _looks_like_newick(cell):
-                        cand = _extract_first_newick(cell)
-                        if not cand:
-                            continue
-                        try:
-                            _ = Tree(cand, format=1)
-                            newicks.append(cand)
-                        except Exception:
-                            pass
-    except Exception:
-        pass
-    if newicks:
-        return newicks
-
-    # 3) global extraction
-    try:
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            txt = f.read()
-        for cand in re.findall(r"\(.*?\);", txt, flags=re.DOTALL):
-            c = cand.replace("\n", "").replace("\r", "").strip()
-            if not c:
-                continue
+    bad: List[str] = []
+    for tid, nw in newick_io.iter_newick_records(path):
+        if validate:
             try:
-                _ = Tree(c, format=1)
-                newicks.append(c)
+                _ete_check(nw)
             except Exception:
-                pass
-    except Exception:
-        pass
-
+                bad.append(tid)
+                continue
+        newicks.append(nw)
+    if bad:
+        more = f", ... (+{len(bad) - 5})" if len(bad) > 5 else ""
+        print(f"[WARN] {len(bad)} unparsable Newick record(s) skipped: {', '.join(bad[:5])}{more}")
     return newicks
 
 # ----------------------------- WMFD -----------------------------
@@ -123,13 +78,7 @@ def precompute_features(nwk: str):
 
     leaf_set: Set[str] = set(leaf_BL.keys())
 
-    splits: Set[frozenset] = set()
-    for node in t.traverse("postorder"):
-        if node.is_leaf():
-            continue
-        clade = frozenset(l.name for l in node.iter_leaves())
-        if 1 < len(clade) < len(leaf_set):
-            splits.add(clade)
+    splits = wmfd_kernel.split_hashes(t)  # sorted uint64 split keys
 
     return t, leaf_BL, leaf_H, leaf_W, leaf_D, leaf_set, splits
 
@@ -198,9 +147,7 @@ def wmfd_pair(A, B, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10) -> float:
     WND_uncommon = L1*BL_uncommon + L2*H_uncommon + L3*W_uncommon + L4*D_uncommon
 
     S1 = A[6]; S2 = B[6]
-    unionS = S1 | S2
-    interS = S1 & S2
-    HD = 1.0 - (len(interS)/len(unionS)) if len(unionS) > 0 else 0.0
+    HD = wmfd_kernel.split_distance(S1, S2)
 
     P = 1.0 - (CN / TN) if TN > 0 else 0.0
     return float(P * WND_uncommon + WND_common + L5 * HD)
@@ -250,18 +197,12 @@ if __name__ == "__main__":
         raise SystemExit(1)
 
     print(f"[OK] {len(newicks)} Newick trees detected.")
-    feats = [precompute_features(nw) for nw in newicks]
+    feats = feature_cache.cached_features(newicks, precompute_features, "wmfd_from_any")
 
     n = len(feats)
-    D = [[0.0]*n for _ in range(n)]
 
     print("[WMFD] computing pairwise distances…")
-    for i in range(n):
-        if i % 5 == 0:
-            print(f"  {i}/{n}")
-        for j in range(i+1, n):
-            d = wmfd_pair(feats[i], feats[j])
-            D[i][j] = D[j][i] = float(d)
+    D = wmfd_kernel.wmfd_matrix(feats, normalize=True)
     print(f"  {n}/{n}")
 
     stem = os.path.splitext(infile)[0]  # e.g., "trees"
@@ -0,0 +1,439 @@
+# -- coding: utf-8 --
+"""
+wmfd_index.py — persistent vantage-point tree for WMFD similarity search
+
+WMFD is not a metric, so the tree is built on a metric lower bound of it.
+Both Jaccard distances of the formula are metrics (leaf sets: P, split
+sets: HD), and with all channel values >= 0 (see wmfd_kernel.wmfd_lower_bound)
+
+    WMFD(a, b) >= P·Wu_lb + L5·HD >= ω·P + L5·HD =: m(a, b)
+
+where ω = Σ_ch λ_ch · min_trees(lo_ch) / max_trees(hi_ch) over the indexed
+trees. m is a metric (non-negative sum of metrics), so a VP-tree over m
+prunes by the triangle inequality, and every candidate it returns is
+verified with the exact WMFD (wmfd_kernel on the query + candidate only).
+
+    knn(tree, k)     best-first traversal in increasing m bound; stops when
+                     the next bound exceeds the k-th exact WMFD
+    range(tree, eps) every subtree whose m bound is <= eps, then verified
+    insert / delete  leaf buckets split past 2·leaf_size; deletions are
+                     tombstones, the tree is rebuilt once half of it is dead
+                     (or when an insert lowers ω, which changes m)
+    save / load      versioned .npz: flat node arrays + feature_cache blobs
+                     (no pickle, no ete3)
+
+CLI
+---
+    python wmfd_index.py build  --in trees.csv --index trees.vpt
+    python wmfd_index.py add    --in more.csv  --index trees.vpt
+    python wmfd_index.py remove --ids 1.3,2.7  --index trees.vpt
+    python wmfd_index.py query  --newick "((A:1,B:1):1,C:2);" --k 5 --index trees.vpt
+"""
+
+import heapq
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import wmfd_kernel
+import feature_cache
+
+INDEX_VERSION = 2
+_TOL = 1e-12
+
+
+class _Node:
+    __slots__ = ("vp", "mu", "inside", "outside", "bucket")
+
+    def __init__(self, vp=None, mu=0.0, inside=None, outside=None, bucket=None):
+        self.vp = vp            # item index of the vantage point (routing only if deleted)
+        self.mu = mu            # median m(vp, x) of the subtree
+        self.inside = inside    # m(vp, x) <  mu
+        self.outside = outside  # m(vp, x) >= mu
+        self.bucket = bucket    # leaf: list of item indices
+
+
+def _flatten(root: Optional[_Node]) -> Dict[str, np.ndarray]:
+    """Pre-order node arrays; leaves have vp = -1 and child = -1."""
+    vp, mu, inside, outside, boff, items = [], [], [], [], [0], []
+    stack = [(root, -1, 0)] if root is not None else []
+    while stack:
+        node, parent, side = stack.pop()
+        k = len(vp)
+        if parent >= 0:
+            (inside if side == 0 else outside)[parent] = k
+        leaf = node.bucket is not None
+        vp.append(-1 if leaf else node.vp)
+        mu.append(float(node.mu))
+        inside.append(-1)
+        outside.append(-1)
+        if leaf:
+            items.extend(node.bucket)
+        boff.append(len(items))
+        if not leaf:
+            stack.append((node.outside, k, 1))
+            stack.append((node.inside, k, 0))
+    return dict(node_vp=np.asarray(vp, dtype=np.int64), node_mu=np.asarray(mu, dtype="<f8"),
+                node_in=np.asarray(inside, dtype=np.int64),
+                node_out=np.asarray(outside, dtype=np.int64),
+                bucket_off=np.asarray(boff, dtype=np.int64),
+                bucket_items=np.asarray(items, dtype=np.int64))
+
+
+def _unflatten(z) -> Optional[_Node]:
+    vp, mu = z["node_vp"].tolist(), z["node_mu"].tolist()
+    inside, outside = z["node_in"].tolist(), z["node_out"].tolist()
+    boff, items = z["bucket_off"].tolist(), z["bucket_items"].tolist()
+    nodes = [_Node(bucket=items[boff[k]:boff[k + 1]]) if vp[k] < 0 else _Node(vp[k], mu[k])
+             for k in range(len(vp))]
+    for k, node in enumerate(nodes):
+        if node.bucket is None:
+            node.inside, node.outside = nodes[inside[k]], nodes[outside[k]]
+    return nodes[0] if nodes else None
+
+
+def _ranges(f) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-channel (min, max) leaf value of one feature tuple."""
+    _t, bl, h, w, d, _ls, _s = f
+    lo, hi = np.zeros(4), np.zeros(4)
+    for ch, vals in enumerate((bl, h, w, d)):
+        v = list(vals.values()) or [0.0]
+        lo[ch], hi[ch] = min(v), max(v)
+    return lo, hi
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 0.0
+    inter = len(a & b)
+    return 1.0 - inter / (len(a) + len(b) - inter)
+
+
+class VPTreeIndex:
+    """VP-tree over trees' WMFD features; items are addressed by id."""
+
+    def __init__(self, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+                 use_weight: bool = True, normalize: bool = True,
+                 leaf_size: int = 16, seed: int = 0, batch: int = 8):
+        if normalize:
+            L1, L2, L3, L4, L5 = wmfd_kernel.normalize_lambdas(L1, L2, L3, L4, L5)
+        self.lambdas = (L1, L2, L3, L4, L5)
+        self.use_weight = use_weight
+        self.leaf_size = max(1, leaf_size)
+        self.seed = seed
+        self.batch = max(1, batch)
+        self.ids: List[str] = []
+        self.feats: List[tuple] = []
+        self.alive: List[bool] = []
+        self._leaves: List[frozenset] = []
+        self._splits: List[frozenset] = []
+        self._rng: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._lo = np.full(4, np.inf)
+        self._hi = np.full(4, -np.inf)
+        self.omega = 0.0
+        self.root: Optional[_Node] = None
+        self._pos: Dict[str, int] = {}
+        self.n_exact = 0
+
+    # ---- metric ----
+
+    def _omega(self) -> float:
+        om = 0.0
+        for ch, lam in enumerate(self.lambdas[:4]):
+            if ch == 2 and not self.use_weight:
+                continue
+            if self._lo[ch] >= 0 and self._hi[ch] > 0:
+                om += lam * self._lo[ch] / self._hi[ch]
+        return om
+
+    def _m(self, a: int, b: int) -> float:
+        return (self.omega * _jaccard(self._leaves[a], self._leaves[b])
+                + self.lambdas[4] * _jaccard(self._splits[a], self._splits[b]))
+
+    def _add_item(self, tid: str, f: tuple, alive: bool = True) -> int:
+        if alive and tid in self._pos:
+            raise ValueError(f"duplicate tree id: {tid}")
+        f = (None,) + tuple(f[1:])
+        i = len(self.feats)
+        self.ids.append(tid)
+        self.feats.append(f)
+        self.alive.append(alive)
+        self._leaves.append(frozenset(f[5]))
+        self._splits.append(frozenset(wmfd_kernel._as_split_array(f[6]).tolist()))
+        lo, hi = _ranges(f)
+        self._rng.append((lo, hi))
+        np.minimum(self._lo, lo, out=self._lo)
+        np.maximum(self._hi, hi, out=self._hi)
+        if alive:
+            self._pos[tid] = i
+        return i
+
+    # ---- build / update ----
+
+    def _build(self, items: List[int], rng) -> _Node:
+        if len(items) <= self.leaf_size:
+            return _Node(bucket=list(items))
+        vp = items[int(rng.integers(len(items)))]
+        rest = [x for x in items if x != vp]
+        d = np.asarray([self._m(vp, x) for x in rest])
+        mu = float(np.median(d))
+        inside = [x for x, dx in zip(rest, d) if dx < mu]
+        outside = [x for x, dx in zip(rest, d) if dx >= mu]
+        if not inside or not outside:  # ties: keep a bucket
+            return _Node(bucket=list(items))
+        return _Node(vp, mu, self._build(inside, rng), self._build(outside, rng))
+
+    def build(self, feats: Sequence[tuple], ids: Optional[Sequence[str]] = None) -> "VPTreeIndex":
+        ids = [str(k + 1) for k in range(len(feats))] if ids is None else list(ids)
+        for tid, f in zip(ids, feats):
+            self._add_item(tid, f)
+        self.rebuild()
+        return self
+
+    def rebuild(self) -> None:
+        """Drop deleted items and rebuild the tree from the live ones."""
+        keep = [i for i, a in enumerate(self.alive) if a]
+        ids = [self.ids[i] for i in keep]
+        feats = [self.feats[i] for i in keep]
+        self.ids, self.feats, self.alive, self._leaves, self._splits, self._rng = [], [], [], [], [], []
+        self._pos = {}
+        self._lo, self._hi = np.full(4, np.inf), np.full(4, -np.inf)
+        for tid, f in zip(ids, feats):
+            self._add_item(tid, f)
+        self.omega = self._omega()
+        self.root = self._build(list(range(len(self.feats))), np.random.default_rng(self.seed))
+
+    def insert(self, tid: str, f: tuple) -> int:
+        """Add one tree; returns its item index."""
+        i = self._add_item(str(tid), f)
+        if self.root is None or self._omega() < self.omega - _TOL:
+            self.rebuild()  # m changed: stored medians are stale
+            return self._pos[str(tid)]
+        node = self.root
+        while node.bucket is None:
+            node = node.inside if self._m(node.vp, i) < node.mu else node.outside
+        node.bucket.append(i)
+        if len(node.bucket) > 2 * self.leaf_size:
+            sub = self._build(node.bucket, np.random.default_rng(self.seed + i))
+            node.vp, node.mu, node.inside, node.outside, node.bucket = \
+                sub.vp, sub.mu, sub.inside, sub.outside, sub.bucket
+        return i
+
+    def delete(self, tid: str) -> None:
+        i = self._pos.pop(str(tid))
+        self.alive[i] = False
+        if 2 * sum(self.alive) < len(self.alive):
+            self.rebuild()
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    # ---- search ----
+
+    def _query_item(self, f: tuple) -> int:
+        """Temporarily register the query to use _m; removed by _drop_query."""
+        f = (None,) + tuple(f[1:])
+        self._leaves.append(frozenset(f[5]))
+        self._splits.append(frozenset(wmfd_kernel._as_split_array(f[6]).tolist()))
+        self.feats.append(f)
+        lo, hi = _ranges(f)
+        self._rng.append((lo, hi))
+        if np.any(lo < self._lo - _TOL) or np.any(hi > self._hi + _TOL):
+            # the query widens the ranges: m would not bound WMFD for it
+            lo_all, hi_all = np.minimum(self._lo, lo), np.maximum(self._hi, hi)
+            saved = (self._lo, self._hi)
+            self._lo, self._hi = lo_all, hi_all
+            self._qscale = self._omega() / self.omega if self.omega > 0 else 0.0
+            self._lo, self._hi = saved
+        else:
+            self._qscale = 1.0
+        return len(self.feats) - 1
+
+    def _drop_query(self) -> None:
+        self._leaves.pop()
+        self._splits.pop()
+        self._rng.pop()
+        self.feats.pop()
+
+    def _bound(self, q: int, i: int) -> float:
+        """P·Wu_lb + L5·HD with the pair's own ranges (>= the scaled m)."""
+        (lq, hq), (li, hi) = self._rng[q], self._rng[i]
+        wu = 0.0
+        for ch, lam in enumerate(self.lambdas[:4]):
+            if ch == 2 and not self.use_weight:
+                continue
+            den = max(hq[ch], hi[ch])
+            if lq[ch] >= 0 and li[ch] >= 0 and den > 0:
+                wu += lam * min(lq[ch], li[ch]) / den
+        return (_jaccard(self._leaves[q], self._leaves[i]) * wu
+                + self.lambdas[4] * _jaccard(self._splits[q], self._splits[i]))
+
+    def _exact(self, q: int, items: List[int]) -> np.ndarray:
+        self.n_exact += len(items)
+        fm = wmfd_kernel.pack_features([self.feats[q]] + [self.feats[i] for i in items])
+        return wmfd_kernel.wmfd_block(fm, range(0, 1), range(1, len(items) + 1),
+                                      *self.lambdas, use_weight=self.use_weight)[0]
+
+    def _traverse(self, q: int, limit):
+        """
+        Yield (bound, item) in nondecreasing bound order while the bound is
+        <= limit() (re-read after each item). The triangle inequality is
+        applied on m (scaled by ω'/ω when the query widens the value
+        ranges); an item is then keyed by its tighter pair bound.
+        """
+        heap = [(0.0, 0, 0, self.root)]
+        tick = 1
+        s = self._qscale
+        while heap:
+            b, _, kind, obj = heapq.heappop(heap)
+            if b > limit() + _TOL:
+                return
+            if kind == 1:
+                yield b, obj
+                continue
+            node = obj
+            if node.bucket is not None:
+                for i in node.bucket:
+                    if self.alive[i]:
+                        heapq.heappush(heap, (self._bound(q, i), tick, 1, i)); tick += 1
+                continue
+            d = self._m(q, node.vp)
+            if self.alive[node.vp]:
+                heapq.heappush(heap, (self._bound(q, node.vp), tick, 1, node.vp)); tick += 1
+            # m(q, x) >= |m(q, vp) - m(vp, x)|; scaled bounds need s <= 1, so
+            # the pruning uses the unscaled m, then shrinks it by s
+            lb_in = max(b, s * max(0.0, d - node.mu))
+            lb_out = max(b, s * max(0.0, node.mu - d))
+            heapq.heappush(heap, (lb_in, tick, 0, node.inside)); tick += 1
+            heapq.heappush(heap, (lb_out, tick, 0, node.outside)); tick += 1
+
+    def knn(self, f: tuple, k: int = 1) -> List[Tuple[str, float]]:
+        """k nearest trees by exact WMFD: [(id, distance)], nearest first."""
+        if self.root is None or not len(self):
+            return []
+        q = self._query_item(f)
+        try:
+            best: List[Tuple[float, int]] = []   # max-heap of (-d, -i)
+            limit = lambda: -best[0][0] if len(best) >= k else np.inf
+            pending: List[int] = []
+
+            def flush():
+                for i, d in zip(pending, self._exact(q, pending)):
+                    if len(best) < k:
+                        heapq.heappush(best, (-float(d), -i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-float(d), -i))
+                pending.clear()
+
+            # exact WMFD in small batches (one packing each); a stale limit
+            # only costs extra evaluations, never a missed neighbour
+            for _b, i in self._traverse(q, limit):
+                pending.append(i)
+                if len(pending) >= (k if len(best) < k else self.batch):
+                    flush()
+            if pending:
+                flush()
+        finally:
+            self._drop_query()
+        out = sorted((-nd, -ni) for nd, ni in best)
+        return [(self.ids[i], d) for d, i in out]
+
+    def range(self, f: tuple, eps: float) -> List[Tuple[str, float]]:
+        """Every tree with WMFD <= eps: [(id, distance)], nearest first."""
+        if self.root is None or not len(self):
+            return []
+        q = self._query_item(f)
+        try:
+            cand = [i for _b, i in self._traverse(q, lambda: eps)]
+            d = self._exact(q, cand) if cand else np.zeros(0)
+        finally:
+            self._drop_query()
+        hits = sorted((float(dx), i) for dx, i in zip(d, cand) if dx <= eps + _TOL)
+        return [(self.ids[i], dx) for dx, i in hits]
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> str:
+        blobs = [feature_cache.encode_features(f) for f in self.feats]
+        blob_off = np.cumsum([0] + [len(b) for b in blobs], dtype=np.int64)
+        with open(path, "wb") as fh:
+            np.savez_compressed(fh, version=INDEX_VERSION,
+                                lambdas=np.asarray(self.lambdas, dtype="<f8"),
+                                use_weight=self.use_weight, leaf_size=self.leaf_size,
+                                seed=self.seed, ids=np.asarray(self.ids, dtype=str),
+                                alive=np.asarray(self.alive, dtype=bool),
+                                blobs=np.frombuffer(b"".join(blobs), dtype=np.uint8),
+                                blob_off=blob_off, **_flatten(self.root))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "VPTreeIndex":
+        """Load an index written by save (.npz, read with allow_pickle=False)."""
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != INDEX_VERSION:
+                raise ValueError(f"{path}: unsupported index version {int(z['version'])}")
+            idx = cls(*z["lambdas"].tolist(), use_weight=bool(z["use_weight"]), normalize=False,
+                      leaf_size=int(z["leaf_size"]), seed=int(z["seed"]))
+            blobs, off = z["blobs"].tobytes(), z["blob_off"].tolist()
+            for i, (tid, alive) in enumerate(zip(z["ids"].tolist(), z["alive"].tolist())):
+                idx._add_item(tid, feature_cache.decode_features(blobs[off[i]:off[i + 1]]), alive)
+            idx.omega = idx._omega()
+            idx.root = _unflatten(z)
+        return idx
+
+
+# ----------------------------- CLI -----------------------------
+
+def _read_features(path: str):
+    import newick_io
+    import step1b_metric_wmfd as s1b
+    ids, newicks = [], []
+    for tid, nw in newick_io.iter_newick_records(path):
+        ids.append(tid)
+        newicks.append(nw)
+    return ids, feature_cache.cached_features(newicks, s1b.precompute_features, "step1b", labels=ids)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="VP-tree index for WMFD similarity search")
+    ap.add_argument("cmd", choices=["build", "add", "remove", "query"])
+    ap.add_argument("--index", required=True, help="fichier index (.vpt)")
+    ap.add_argument("--in", dest="inp", default=None, help="arbres (.txt/.csv, gzip ok)")
+    ap.add_argument("--ids", default="", help="remove: ids séparés par des virgules")
+    ap.add_argument("--newick", default=None, help="query: arbre Newick")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--eps", type=float, default=None, help="query: rayon au lieu de k")
+    ap.add_argument("--leaf_size", type=int, default=16)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        ids, feats = _read_features(args.inp)
+        idx = VPTreeIndex(leaf_size=args.leaf_size).build(feats, ids)
+        idx.save(args.index)
+        print(f"[OK] {args.index}  {len(idx)} trees")
+        return
+
+    idx = VPTreeIndex.load(args.index)
+    if args.cmd == "add":
+        ids, feats = _read_features(args.inp)
+        for tid, f in zip(ids, feats):
+            idx.insert(tid, f)
+        idx.save(args.index)
+        print(f"[OK] +{len(ids)} → {len(idx)} trees")
+    elif args.cmd == "remove":
+        for tid in [x.strip() for x in args.ids.split(",") if x.strip()]:
+            idx.delete(tid)
+        idx.save(args.index)
+        print(f"[OK] {len(idx)} trees")
+    else:
+        import step1b_metric_wmfd as s1b
+        f = s1b.precompute_features(args.newick)
+        hits = idx.range(f, args.eps) if args.eps is not None else idx.knn(f, args.k)
+        for tid, d in hits:
+            print(f"{tid}\t{d:.6f}")
+        print(f"[INFO] {idx.n_exact}/{len(idx)} exact WMFD evaluations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,631 @@
+# -- coding: utf-8 --
+"""
+wmfd_kernel.py — vectorized all-pairs WMFD
+-------------------------------------------
+NumPy engine behind the WMFD matrix builders (step1b_metric_wmfd,
+wmfd_from_any, wmfd_cluster_all_inmem, wmfd_all_now, generation/wmfd).
+
+The per-tree feature tuples returned by the various
+``precompute_features`` / ``wmfd_precompute_tree`` helpers
+    (tree, BL, H, W, D, leaf_set, splits)
+are packed once into padded (n_trees × n_leaves) arrays plus a presence
+mask. The full distance matrix is then computed block by block with
+broadcast operations instead of a Python loop over the leaf union of
+every pair (optionally in parallel, see ``n_jobs``). Splits are fixed-width uint64 keys (see ``split_hashes``),
+so the topology term only compares sorted integer arrays. Results are
+the same as ``wmfd_pair`` up to floating-point summation order:
+
+    WMFD = P * WND_uncommon + WND_common + L5 * HD
+
+WMFD is linear in L1..L5, so ``wmfd_components`` can store the five
+per-pair coefficients once and evaluate any lambda grid as a matrix
+product (``WMFDComponents.condensed`` / ``sweep``).
+
+with pairwise min-max normalization per channel over the leaf union
+(absent leaves count as 0.0 in the bounds, as in ``wmfd_pair``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import multiprocessing as mp
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Channel order matches the lambda order L1..L4 of wmfd_pair.
+CHANNELS = ("BL", "H", "W", "D")
+
+DEFAULT_LAMBDAS = (0.30, 0.20, 0.25, 0.15, 0.10)
+
+# Upper bound for the (rows × cols × leaves) float64 temporaries of one block.
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class FeatureMatrices:
+    leaves: List[str]            # shared leaves (in >= 2 trees), column order
+    values: np.ndarray           # (4, n_trees, n_leaves), 0.0 where absent
+    present: np.ndarray          # (n_trees, n_leaves) bool
+    split_ids: np.ndarray        # dense split ids, concatenated per tree
+    split_owner: np.ndarray      # tree index of each split_ids entry
+    split_count: np.ndarray      # (n_trees,) number of splits per tree
+    # Leaves found in a single tree are always "uncommon" and only enter a
+    # pair through their min/max and |value| sum, so they are kept as
+    # per-tree summaries instead of mostly-empty columns.
+    priv_n: np.ndarray           # (n_trees,)
+    priv_min: np.ndarray         # (4, n_trees), +inf if none
+    priv_max: np.ndarray         # (4, n_trees), -inf if none
+    priv_abs: np.ndarray         # (4, n_trees), sum of |value|
+    split_keys: Optional[np.ndarray] = None  # uint64 key of each dense split id
+
+    @property
+    def n_trees(self) -> int:
+        return self.present.shape[0]
+
+
+# ---- bitset-encoded splits ----
+
+@lru_cache(maxsize=None)
+def _leaf_key(name: str) -> int:
+    """Fixed random 64-bit key of a leaf name."""
+    return int.from_bytes(hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def split_hashes(t) -> np.ndarray:
+    """
+    Sorted uint64 keys of the non-trivial splits of an ETE tree.
+
+    A split is the leaf bitmask of a clade with 1 < size < n_leaves; its
+    key is the XOR of the random keys of its leaves (a fixed-width hash of
+    the bitmask), built bottom-up in one postorder pass. Two trees share a
+    split iff they share its key, up to 64-bit collisions.
+    """
+    n_leaves = len({str(lf.name) for lf in t.iter_leaves()})
+    key, size = {}, {}
+    out = []
+    for nd in t.traverse("postorder"):
+        if nd.is_leaf():
+            key[nd] = _leaf_key(str(nd.name))
+            size[nd] = 1
+            continue
+        h, s = 0, 0
+        for ch in nd.children:
+            h ^= key[ch]
+            s += size[ch]
+        key[nd], size[nd] = h, s
+        if 1 < s < n_leaves:
+            out.append(h)
+    return np.unique(np.asarray(out, dtype=np.uint64))
+
+
+def _as_split_array(S) -> np.ndarray:
+    """Accept split keys or the legacy set of leaf-name frozensets."""
+    if isinstance(S, np.ndarray):
+        return S
+    keys = []
+    for clade in S:
+        h = 0
+        for x in clade:
+            h ^= _leaf_key(str(x))
+        keys.append(h)
+    return np.unique(np.asarray(keys, dtype=np.uint64))
+
+
+def split_distance(S1, S2) -> float:
+    """HD term: Jaccard distance between two sorted split-key arrays."""
+    S1, S2 = _as_split_array(S1), _as_split_array(S2)
+    inter = np.intersect1d(S1, S2, assume_unique=True).size
+    union = S1.size + S2.size - inter
+    return 1.0 - (inter / union) if union > 0 else 0.0
+
+
+# ---- packing ----
+
+def _fill_leaves(feats: Sequence[tuple], col: dict):
+    """Leaf columns + private-leaf summaries of feats for the column map col."""
+    n, L, C = len(feats), len(col), len(CHANNELS)
+    values = np.zeros((C, n, L), dtype=float)
+    present = np.zeros((n, L), dtype=bool)
+    priv_n = np.zeros(n, dtype=np.int64)
+    priv_min = np.full((C, n), np.inf)
+    priv_max = np.full((C, n), -np.inf)
+    priv_abs = np.zeros((C, n))
+    for i, f in enumerate(feats):
+        _t, bl, h, w, d, leaf_set, S = f
+        for x in leaf_set:
+            v = (bl.get(x, 0.0), h.get(x, 0.0), w.get(x, 0.0), d.get(x, 0.0))
+            k = col.get(x)
+            if k is not None:
+                present[i, k] = True
+                values[:, i, k] = v
+                continue
+            priv_n[i] += 1
+            for ch in range(C):
+                priv_min[ch, i] = min(priv_min[ch, i], v[ch])
+                priv_max[ch, i] = max(priv_max[ch, i], v[ch])
+                priv_abs[ch, i] += abs(v[ch])
+    return values, present, priv_n, priv_min, priv_max, priv_abs
+
+
+def pack_features(feats: Sequence[tuple], min_shared: int = 2) -> FeatureMatrices:
+    """
+    Pack ``(tree, BL, H, W, D, leaf_set, splits)`` tuples into padded arrays.
+
+    Leaves found in at least min_shared trees get a column. min_shared=1
+    gives every leaf a column, so that trees packed later with
+    ``append_features`` (queries) are exact against these ones.
+    """
+    count: dict = {}
+    for f in feats:
+        for x in f[5]:
+            count[x] = count.get(x, 0) + 1
+    leaves = sorted(x for x, c in count.items() if c >= min_shared)
+    col = {x: k for k, x in enumerate(leaves)}
+    values, present, priv_n, priv_min, priv_max, priv_abs = _fill_leaves(feats, col)
+    n = len(feats)
+
+    split_keys = [_as_split_array(f[6]) for f in feats]
+    split_count = np.asarray([k.size for k in split_keys], dtype=np.int64)
+    all_keys = np.concatenate(split_keys) if split_keys else np.zeros(0, np.uint64)
+    uniq, split_ids = np.unique(all_keys, return_inverse=True)
+    split_owner = np.repeat(np.arange(n), split_count)
+    return FeatureMatrices(leaves, values, present, split_ids.ravel(), split_owner, split_count,
+                           priv_n, priv_min, priv_max, priv_abs, uniq)
+
+
+def append_features(fm: FeatureMatrices, feats: Sequence[tuple]) -> FeatureMatrices:
+    """
+    fm followed by the trees feats, keeping fm's columns and split ids.
+
+    Leaves of the new trees without a column become private leaves, which
+    is exact for every (old, new) pair when fm was packed with
+    min_shared=1 (new-new pairs sharing such a leaf are not).
+    """
+    col = {x: k for k, x in enumerate(fm.leaves)}
+    values, present, priv_n, priv_min, priv_max, priv_abs = _fill_leaves(feats, col)
+    known = fm.split_keys if fm.split_keys is not None else np.zeros(0, np.uint64)
+    keys = [_as_split_array(f[6]) for f in feats]
+    count = np.asarray([k.size for k in keys], dtype=np.int64)
+    new_keys = np.concatenate(keys) if keys else np.zeros(0, np.uint64)
+    pos = np.searchsorted(known, new_keys)
+    hit = (pos < known.size) & (known[np.minimum(pos, max(known.size - 1, 0))] == new_keys) \
+        if known.size else np.zeros(new_keys.size, dtype=bool)
+    # unseen splits: fresh ids after the known ones (shared between new trees)
+    fresh, inv = np.unique(new_keys[~hit], return_inverse=True)
+    ids = pos.astype(np.int64)
+    ids[~hit] = known.size + inv.ravel()
+    n0 = fm.n_trees
+    return FeatureMatrices(
+        fm.leaves,
+        np.concatenate([fm.values, values], axis=1),
+        np.concatenate([fm.present, present]),
+        np.concatenate([fm.split_ids, ids]),
+        np.concatenate([fm.split_owner, n0 + np.repeat(np.arange(len(feats)), count)]),
+        np.concatenate([fm.split_count, count]),
+        np.concatenate([fm.priv_n, priv_n]),
+        np.concatenate([fm.priv_min, priv_min], axis=1),
+        np.concatenate([fm.priv_max, priv_max], axis=1),
+        np.concatenate([fm.priv_abs, priv_abs], axis=1),
+        np.concatenate([known, fresh]) if fm.split_keys is not None else None)
+
+
+def split_starts(fm: FeatureMatrices) -> np.ndarray:
+    """Offsets of each tree's split ids in fm.split_ids (length n_trees + 1)."""
+    return np.concatenate([[0], np.cumsum(fm.split_count)]).astype(np.int64)
+
+
+def take_features(fm: FeatureMatrices, idx) -> FeatureMatrices:
+    """
+    Packed features of the trees idx (in that order). Columns and split ids
+    are kept, so any pair gets the same WMFD as in the full set.
+    """
+    idx = np.asarray(idx, dtype=np.intp)
+    starts = split_starts(fm)
+    counts = fm.split_count[idx]
+    offs = np.repeat(starts[idx] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    pos = np.arange(int(counts.sum())) + offs
+    return FeatureMatrices(fm.leaves, fm.values[:, idx], fm.present[idx],
+                           fm.split_ids[pos], np.repeat(np.arange(idx.size), counts), counts,
+                           fm.priv_n[idx], fm.priv_min[:, idx], fm.priv_max[:, idx],
+                           fm.priv_abs[:, idx], fm.split_keys)
+
+
+def wmfd_one_to_many(fm: FeatureMatrices, i: int, cols, L1, L2, L3, L4, L5,
+                     use_weight: bool = True) -> np.ndarray:
+    """WMFD between tree i and each tree of cols (any index array)."""
+    return wmfd_cross(fm, [i], cols, L1, L2, L3, L4, L5, use_weight=use_weight)[0]
+
+
+def wmfd_cross(fm: FeatureMatrices, rows, cols, L1, L2, L3, L4, L5,
+               use_weight: bool = True, block_rows: Optional[int] = None) -> np.ndarray:
+    """
+    WMFD for rows × cols (any index arrays), as a (len(rows), len(cols))
+    array, computed block by block without the full matrix. Same values as
+    the matching entries of wmfd_matrix, 0 where a row and a column are the
+    same tree.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    out = np.zeros((rows.size, cols.size))
+    if rows.size == 0 or cols.size == 0:
+        return out
+    if block_rows is None:
+        block_rows = max(1, BLOCK_BYTES // (8 * max(len(fm.leaves), 1) * cols.size))
+    for a in range(0, rows.size, block_rows):
+        r = rows[a:a + block_rows]
+        sub = take_features(fm, np.concatenate([r, cols]))
+        out[a:a + r.size] = wmfd_block(sub, range(0, r.size), range(r.size, r.size + cols.size),
+                                       L1, L2, L3, L4, L5, use_weight=use_weight)
+    out[rows[:, None] == cols[None, :]] = 0.0  # as on the diagonal of wmfd_matrix
+    return out
+
+
+def normalize_lambdas(L1, L2, L3, L4, L5) -> Tuple[float, float, float, float, float]:
+    """Scale lambdas to sum to 1 (defaults if the sum is not positive)."""
+    tot = L1 + L2 + L3 + L4 + L5
+    if tot <= 0:
+        (L1, L2, L3, L4, L5), tot = DEFAULT_LAMBDAS, 1.0
+    return (L1/tot, L2/tot, L3/tot, L4/tot, L5/tot)
+
+
+def _hd_block(fm: FeatureMatrices, rows: range, cols: range) -> np.ndarray:
+    """Jaccard distance between split sets for rows × cols (vectorized merge)."""
+    out = np.zeros((len(rows), len(cols)), dtype=float)
+    if fm.split_ids.size == 0:
+        return out
+    starts = np.concatenate([[0], np.cumsum(fm.split_count)])
+    lo, hi = starts[cols.start], starts[cols.stop]
+    col_ids = fm.split_ids[lo:hi]
+    col_owner = fm.split_owner[lo:hi] - cols.start
+    mark = np.zeros(int(fm.split_ids.max()) + 1, dtype=bool)
+    n_j = fm.split_count[cols.start:cols.stop]
+    for a, i in enumerate(rows):
+        own = fm.split_ids[starts[i]:starts[i + 1]]
+        mark[own] = True
+        inter = np.bincount(col_owner, weights=mark[col_ids], minlength=len(cols))
+        mark[own] = False
+        union = fm.split_count[i] + n_j - inter
+        out[a] = np.where(union > 0, 1.0 - inter / np.maximum(union, 1), 0.0)
+    return out
+
+
+def _pair_terms(fm: FeatureMatrices, rows: range, cols: range, use_weight: bool = True):
+    """
+    Per-pair ingredients of WMFD for rows × cols:
+    P, HD and, for each channel (BL, H, W, D), the normalized mean |diff|
+    over common and over uncommon leaves (None for W if not use_weight).
+    """
+    r = slice(rows.start, rows.stop)
+    c = slice(cols.start, cols.stop)
+    Pi = fm.present[r][:, None, :]
+    Pj = fm.present[c][None, :, :]
+    U = Pi | Pj
+    I = Pi & Pj
+    X = U & ~I
+    npriv = fm.priv_n[r][:, None] + fm.priv_n[c][None, :]
+    CN = I.sum(axis=2)
+    TN = U.sum(axis=2) + npriv
+    CNs = np.maximum(CN, 1)
+    UNCs = np.maximum(TN - CN, 1)
+    # A private leaf of one tree pairs with an absent (0.0) value in the other.
+    zero = np.where(npriv > 0, 0.0, np.inf)
+
+    means = []
+    for ch in range(len(CHANNELS)):
+        if ch == 2 and not use_weight:
+            means.append(None)  # W constant: wmfd_pair uses dW = 0
+            continue
+        a = fm.values[ch, r][:, None, :]
+        b = fm.values[ch, c][None, :, :]
+        mn = np.where(U, np.minimum(a, b), np.inf).min(axis=2, initial=np.inf)
+        mx = np.where(U, np.maximum(a, b), -np.inf).max(axis=2, initial=-np.inf)
+        mn = np.minimum(np.minimum(mn, zero),
+                        np.minimum(fm.priv_min[ch, r][:, None], fm.priv_min[ch, c][None, :]))
+        mx = np.maximum(np.maximum(mx, -zero),
+                        np.maximum(fm.priv_max[ch, r][:, None], fm.priv_max[ch, c][None, :]))
+        ok = mx > mn
+        span = np.where(ok, mx - mn, 1.0)
+        lo = np.where(ok, mn, 0.0)[..., None]
+        diff = np.abs((a - lo) / span[..., None] - (b - lo) / span[..., None])
+        priv = (fm.priv_abs[ch, r][:, None] + fm.priv_abs[ch, c][None, :]) / span
+        com = np.where(ok, (diff * I).sum(axis=2), 0.0)
+        unc = np.where(ok, (diff * X).sum(axis=2) + priv, 0.0)
+        means.append((com / CNs, unc / UNCs))
+
+    P = np.where(TN > 0, 1.0 - CN / np.maximum(TN, 1), 0.0)
+    HD = _hd_block(fm, rows, cols)
+    return P, HD, means
+
+
+def wmfd_block(fm: FeatureMatrices, rows: range, cols: range,
+               L1, L2, L3, L4, L5, use_weight: bool = True) -> np.ndarray:
+    """WMFD for every (i, j) in rows × cols, as a (len(rows), len(cols)) array."""
+    P, HD, means = _pair_terms(fm, rows, cols, use_weight)
+    shape = (len(rows), len(cols))
+    Wc = np.zeros(shape)
+    Wu = np.zeros(shape)
+    for m, lam in zip(means, (L1, L2, L3, L4)):
+        if m is None:
+            continue
+        Wc = Wc + lam * m[0]
+        Wu = Wu + lam * m[1]
+    return P * Wu + Wc + L5 * HD
+
+
+# ---- lower bound ----
+
+def tree_ranges(fm: FeatureMatrices) -> Tuple[np.ndarray, np.ndarray]:
+    """(lo, hi): min / max leaf value of every tree per channel, each (4, n_trees)."""
+    pres = fm.present[None, :, :]
+    lo = np.where(pres, fm.values, np.inf).min(axis=2, initial=np.inf)
+    hi = np.where(pres, fm.values, -np.inf).max(axis=2, initial=-np.inf)
+    return np.minimum(lo, fm.priv_min), np.maximum(hi, fm.priv_max)
+
+
+def wmfd_lower_bound(fm: FeatureMatrices, rows, cols, L1, L2, L3, L4, L5,
+                     use_weight: bool = True, ranges=None) -> np.ndarray:
+    """
+    Cheap lower bound of WMFD for rows × cols (index arrays):
+
+        WMFD >= P * Wu_lb + L5 * HD
+
+    Wc >= 0 is dropped. For a channel whose values are >= 0 in both trees,
+    the normalization range of the pair is [0, max(hi_i, hi_j)] as soon as
+    a leaf is uncommon, and each uncommon leaf differs from the absent 0.0
+    by its own value, so its normalized |diff| is at least
+    min(lo_i, lo_j) / max(hi_i, hi_j). P and HD are exact; the cost is
+    O(leaves + splits) per pair instead of the per-channel min-max passes.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    cols = np.asarray(cols, dtype=np.intp)
+    lo, hi = tree_ranges(fm) if ranges is None else ranges
+    pr = fm.present[rows].astype(np.float32)
+    pc = fm.present[cols].astype(np.float32)
+    CN = (pr @ pc.T).astype(float)
+    same = rows[:, None] == cols[None, :]
+    CN += np.where(same, fm.priv_n[rows][:, None], 0)  # a tree shares its private leaves with itself
+    n_r = fm.present[rows].sum(axis=1) + fm.priv_n[rows]
+    n_c = fm.present[cols].sum(axis=1) + fm.priv_n[cols]
+    TN = n_r[:, None] + n_c[None, :] - CN
+    P = np.where(TN > 0, 1.0 - CN / np.maximum(TN, 1), 0.0)
+
+    sub = take_features(fm, np.concatenate([rows, cols]))
+    HD = _hd_block(sub, range(0, rows.size), range(rows.size, rows.size + cols.size))
+
+    Wu = np.zeros((rows.size, cols.size))
+    for ch, lam in enumerate((L1, L2, L3, L4)):
+        if ch == 2 and not use_weight:
+            continue
+        lr, lc = lo[ch, rows][:, None], lo[ch, cols][None, :]
+        den = np.maximum(hi[ch, rows][:, None], hi[ch, cols][None, :])
+        ok = (lr >= 0) & (lc >= 0) & (den > 0)
+        Wu += lam * np.where(ok, np.minimum(lr, lc) / np.where(ok, den, 1.0), 0.0)
+    return P * Wu + L5 * HD
+
+
+def component_block(fm: FeatureMatrices, rows: range, cols: range,
+                    use_weight: bool = True) -> np.ndarray:
+    """
+    (5, len(rows), len(cols)) coefficients of L1..L5: WMFD is linear in the
+    lambdas, WMFD = sum_k L_k * T[k] with
+        T[ch] = P * WND_uncommon[ch] + WND_common[ch]   (BL, H, W, D)
+        T[4]  = HD
+    """
+    P, HD, means = _pair_terms(fm, rows, cols, use_weight)
+    T = np.zeros((len(CHANNELS) + 1, len(rows), len(cols)))
+    for ch, m in enumerate(means):
+        if m is not None:
+            T[ch] = P * m[1] + m[0]
+    T[-1] = HD
+    return T
+
+
+# ---- lambda sweeps ----
+
+@dataclass
+class WMFDComponents:
+    """
+    Per-pair component tensor of a tree set, computed once; any lambda
+    vector (or a whole grid of them) is then a contraction over its first axis.
+    """
+    n: int
+    terms: np.ndarray            # (5, n*(n-1)/2), condensed upper triangle (see distmat)
+
+    def condensed(self, lambdas, normalize: bool = False) -> np.ndarray:
+        """Condensed WMFD values, (m,) for one lambda vector or (K, m) for a (K, 5) grid."""
+        lam = np.asarray(lambdas, dtype=float)
+        one = lam.ndim == 1
+        lam = np.atleast_2d(lam)
+        if lam.shape[1] != self.terms.shape[0]:
+            raise ValueError(f"expected {self.terms.shape[0]} lambdas per row, got {lam.shape[1]}")
+        if normalize:
+            lam = np.asarray([normalize_lambdas(*row) for row in lam])
+        out = lam @ self.terms
+        return out[0] if one else out
+
+    def matrix(self, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+               normalize: bool = False) -> np.ndarray:
+        """Square WMFD matrix for one lambda vector (same values as wmfd_matrix)."""
+        return squareform(self.condensed((L1, L2, L3, L4, L5), normalize), self.n)
+
+    def sweep(self, grid, normalize: bool = False, block: int = 256):
+        """Yield (lambdas, square matrix) for every row of a (K, 5) grid."""
+        grid = np.atleast_2d(np.asarray(grid, dtype=float))
+        for a in range(0, len(grid), block):
+            vals = self.condensed(grid[a:a + block], normalize)
+            for lam, v in zip(grid[a:a + block], vals):
+                yield tuple(lam.tolist()), squareform(v, self.n)
+
+    def save(self, path: str) -> str:
+        np.savez(path, n=np.asarray(self.n), terms=self.terms)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "WMFDComponents":
+        with np.load(path) as z:
+            return cls(int(z["n"]), z["terms"])
+
+
+def squareform(v: np.ndarray, n: int) -> np.ndarray:
+    """Condensed upper triangle (row-major, i<j) -> symmetric n×n matrix."""
+    D = np.zeros((n, n), dtype=float)
+    iu = np.triu_indices(n, 1)
+    D[iu] = v
+    return D + D.T
+
+
+def wmfd_components(feats, use_weight: bool = True, block_rows: Optional[int] = None,
+                    progress: bool = False) -> WMFDComponents:
+    """Component tensor of all pairs i<j (memory: 5 × n*(n-1)/2 float64)."""
+    fm = feats if isinstance(feats, FeatureMatrices) else pack_features(feats)
+    n = fm.n_trees
+    L = max(len(fm.leaves), 1)
+    if block_rows is None:
+        block_rows = max(1, BLOCK_BYTES // (8 * L * max(n, 1)))
+
+    terms = np.zeros((len(CHANNELS) + 1, n * (n - 1) // 2))
+    for start in range(0, n, block_rows):
+        stop = min(n, start + block_rows)
+        if progress:
+            print(f"[WMFD] components {start}/{n}", flush=True)
+        T = component_block(fm, range(start, stop), range(start, n), use_weight)
+        for a, i in enumerate(range(start, stop)):
+            pos = n * i - i * (i + 1) // 2
+            terms[:, pos:pos + (n - i - 1)] = T[:, a, a + 1:]
+    if progress:
+        print(f"[WMFD] components {n}/{n}", flush=True)
+    return WMFDComponents(n, terms)
+
+
+# ---- parallel tiles ----
+
+# Worker state, set once per process (inherited under fork, or through
+# the pool initializer under spawn).
+_WORKER: dict = {}
+
+
+def _attach_shared(name: str):
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(fm, shm_name, n, lambdas, use_weight):
+    if "D" not in _WORKER:
+        shm = _attach_shared(shm_name)
+        _WORKER.update(shm=shm, D=np.ndarray((n, n), dtype=float, buffer=shm.buf))
+    _WORKER.update(fm=fm, lambdas=lambdas, use_weight=use_weight)
+
+
+def _run_tile(tile):
+    r0, r1, c0, c1 = tile
+    _WORKER["D"][r0:r1, c0:c1] = wmfd_block(
+        _WORKER["fm"], range(r0, r1), range(c0, c1),
+        *_WORKER["lambdas"], use_weight=_WORKER["use_weight"])
+    return tile
+
+
+def upper_tiles(n: int, tile: int) -> List[Tuple[int, int, int, int]]:
+    """(r0, r1, c0, c1) tiles covering the upper triangle, row-major."""
+    return [(r0, min(n, r0 + tile), c0, min(n, c0 + tile))
+            for r0 in range(0, n, tile) for c0 in range(r0, n, tile)]
+
+
+def _resolve_jobs(n_jobs: Optional[int]) -> int:
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)  # -1 = all cores
+    return n_jobs
+
+
+def _wmfd_matrix_parallel(fm: FeatureMatrices, lambdas, use_weight: bool,
+                          n_jobs: int, tile: Optional[int], progress: bool) -> np.ndarray:
+    from multiprocessing import shared_memory
+
+    n = fm.n_trees
+    if tile is None:
+        L = max(len(fm.leaves), 1)
+        tile = max(1, int(math.sqrt(BLOCK_BYTES / (8 * L))))
+        # keep enough tiles for every worker
+        tile = min(tile, max(1, math.ceil(n / math.ceil(math.sqrt(2 * n_jobs)))))
+    tiles = upper_tiles(n, tile)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(8 * n * n, 8))
+    try:
+        D = np.ndarray((n, n), dtype=float, buffer=shm.buf)
+        D[:] = 0.0
+        if "fork" in mp.get_all_start_methods():
+            # Children inherit the features and the shared buffer, nothing is pickled.
+            ctx = mp.get_context("fork")
+            _WORKER.update(shm=shm, D=D)
+        else:
+            ctx = mp.get_context()
+        try:
+            with ctx.Pool(n_jobs, initializer=_init_worker,
+                          initargs=(fm, shm.name, n, lambdas, use_weight)) as pool:
+                for done, _ in enumerate(pool.imap_unordered(_run_tile, tiles), 1):
+                    if progress and (done % max(1, len(tiles) // 10) == 0 or done == len(tiles)):
+                        print(f"[WMFD] tiles {done}/{len(tiles)}", flush=True)
+        finally:
+            _WORKER.clear()
+        out = np.triu(D, 1)
+        del D
+    finally:
+        shm.close()
+        shm.unlink()
+    return out + out.T
+
+
+def wmfd_matrix(feats, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+                use_weight: bool = True, normalize: bool = False,
+                block_rows: Optional[int] = None, progress: bool = False,
+                n_jobs: Optional[int] = 1, tile: Optional[int] = None) -> np.ndarray:
+    """
+    Symmetric WMFD matrix for a list of precomputed feature tuples
+    (or an already packed ``FeatureMatrices``).
+
+    use_weight : include the W channel (False reproduces the dW = 0 variants).
+    normalize  : rescale the lambdas to sum to 1 first (step1b / wmfd_from_any).
+    block_rows : rows per block; by default sized from BLOCK_BYTES.
+    n_jobs     : worker processes (1 = serial, -1 = all cores). The upper
+                 triangle is cut into tiles written by the workers into a
+                 shared-memory matrix; every entry is computed by the same
+                 code whatever the schedule, so the output does not depend
+                 on n_jobs. Under spawn (Windows), the caller must sit
+                 behind ``if __name__ == "__main__":``.
+    tile       : tile side for n_jobs > 1; by default sized from BLOCK_BYTES.
+    """
+    fm = feats if isinstance(feats, FeatureMatrices) else pack_features(feats)
+    if normalize:
+        L1, L2, L3, L4, L5 = normalize_lambdas(L1, L2, L3, L4, L5)
+    n = fm.n_trees
+    n_jobs = _resolve_jobs(n_jobs)
+    if n_jobs > 1 and n > 1:
+        return _wmfd_matrix_parallel(fm, (L1, L2, L3, L4, L5), use_weight,
+                                     n_jobs, tile, progress)
+
+    L = max(len(fm.leaves), 1)
+    if block_rows is None:
+        block_rows = max(1, BLOCK_BYTES // (8 * L * max(n, 1)))
+
+    D = np.zeros((n, n), dtype=float)
+    for start in range(0, n, block_rows):
+        stop = min(n, start + block_rows)
+        if progress:
+            print(f"[WMFD] {start}/{n}", flush=True)
+        B = wmfd_block(fm, range(start, stop), range(start, n),
+                       L1, L2, L3, L4, L5, use_weight=use_weight)
+        D[start:stop, start:] = B
+    if progress:
+        print(f"[WMFD] {n}/{n}", flush=True)
+    D = np.triu(D, 1)
+    D = D + D.T
+    return D
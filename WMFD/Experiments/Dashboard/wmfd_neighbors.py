@@ -0,0 +1,359 @@
+# -- coding: utf-8 --
+"""
+wmfd_neighbors.py — ε-neighbourhoods of WMFD without the n×n matrix
+
+Every WMFD term is non-negative, so
+
+    WMFD(i, j) = P·Wu + Wc + L5·HD  >=  L5 · HD(i, j)
+
+where HD is the Jaccard distance between split sets. WMFD(i, j) <= ε then
+requires split-set Jaccard similarity >= t = 1 - ε / L5, which is a set
+similarity join:
+
+- size filter   : t·|S_i| <= |S_j| <= |S_i| / t
+- prefix filter : with splits ranked rarest first, two sets with
+                  J >= t share a split among the first |S| - ⌈t·|S|⌉ + 1
+                  of each (All-Pairs / PPJoin)
+
+Candidates from an inverted index over those prefixes are then checked
+against wmfd_kernel.wmfd_lower_bound (P·Wu_lb + L5·HD, exact P and HD),
+and only the survivors get a full WMFD evaluation
+(wmfd_kernel.wmfd_one_to_many). The result is a sparse radius-neighbours
+graph (scipy CSR, explicit zeros kept) that sklearn's DBSCAN / OPTICS take
+with metric="precomputed".
+
+NearestTrees runs exact knn(tree, k) / range(tree, eps) queries against
+a reference set with the same lower bound, evaluating exact WMFD only for
+references whose bound can still beat the answer.
+
+When ε >= L5 the join cannot prune: pairs are then screened by row blocks
+with the lower bound alone (O(n²) cheap tests, O(block·n) memory).
+
+CLI
+---
+    python wmfd_neighbors.py --in_csv trees.csv --eps 0.05 --min_samples 5
+        [--optics] [--graph trees_eps.npz] [--out trees_dbscan.csv]
+"""
+
+import os
+import csv
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+import wmfd_kernel
+
+_TOL = 1e-12
+
+
+# ----------------------------- split sets -----------------------------
+
+def ranked_splits(fm: wmfd_kernel.FeatureMatrices) -> List[np.ndarray]:
+    """Per-tree split ranks, sorted; rank 0 = split shared by the fewest trees."""
+    if fm.split_ids.size == 0:
+        return [np.zeros(0, dtype=np.int64) for _ in range(fm.n_trees)]
+    df = np.bincount(fm.split_ids)
+    order = np.lexsort((np.arange(df.size), df))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    starts = wmfd_kernel.split_starts(fm)
+    return [np.sort(rank[fm.split_ids[starts[i]:starts[i + 1]]]) for i in range(fm.n_trees)]
+
+
+def _prefix_len(s: int, t: float) -> int:
+    return s - int(np.ceil(t * s - 1e-9)) + 1
+
+
+def candidate_pairs(sets: List[np.ndarray], t: float):
+    """
+    Yield (i, [j, ...]) with j < i in processing order, covering every pair
+    with Jaccard(S_i, S_j) >= t (t > 0). Trees are visited by increasing
+    split count, so only the lower size bound has to be checked.
+    """
+    sizes = np.asarray([s.size for s in sets])
+    order = np.argsort(sizes, kind="stable")
+    index: Dict[int, List[int]] = defaultdict(list)
+    empty: List[int] = []
+    for i in order:
+        i = int(i)
+        s = sizes[i]
+        if s == 0:
+            # HD(∅, ∅) = 0, HD(∅, S) = 1 > 1 - t
+            if empty:
+                yield i, list(empty)
+            empty.append(i)
+            continue
+        lo = t * s - 1e-9
+        prefix = sets[i][:_prefix_len(s, t)]
+        cand = set()
+        for tok in prefix.tolist():
+            for j in index[tok]:
+                if sizes[j] >= lo:
+                    cand.add(j)
+        if cand:
+            yield i, sorted(cand)
+        for tok in prefix.tolist():
+            index[tok].append(i)
+
+
+# ----------------------------- radius graph -----------------------------
+
+def _all_pairs(fm, eps, lambdas, use_weight, ranges):
+    """(i, [j > i]) with wmfd_lower_bound <= eps, by row blocks (no pruning join)."""
+    n = fm.n_trees
+    bs = max(1, wmfd_kernel.BLOCK_BYTES // (8 * 4 * max(n, 1)))
+    for a in range(0, n - 1, bs):
+        rows = np.arange(a, min(n - 1, a + bs))
+        cols = np.arange(a + 1, n)
+        LB = wmfd_kernel.wmfd_lower_bound(fm, rows, cols, *lambdas, use_weight=use_weight, ranges=ranges)
+        for r, i in enumerate(rows):
+            ok = (LB[r] <= eps + _TOL) & (cols > i)
+            yield int(i), int(n - 1 - i), cols[ok]
+
+
+def _joined_pairs(fm, sets, t, eps, lambdas, use_weight, ranges):
+    """(i, [j]) from the split prefix join, filtered by the lower bound."""
+    for i, js in candidate_pairs(sets, t):
+        js = np.asarray(js, dtype=np.intp)
+        LB = wmfd_kernel.wmfd_lower_bound(fm, [i], js, *lambdas, use_weight=use_weight, ranges=ranges)[0]
+        yield i, js.size, js[LB <= eps + _TOL]
+
+
+def radius_graph(feats, eps: float, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+                 use_weight: bool = True, normalize: bool = True,
+                 progress: bool = False) -> Tuple[sparse.csr_matrix, dict]:
+    """
+    Symmetric CSR matrix holding WMFD(i, j) for every pair with WMFD <= eps
+    (explicit zeros included), plus counters {"candidates", "lb_pruned",
+    "evaluated", "edges"}. feats: feature tuples or a packed FeatureMatrices.
+    """
+    fm = feats if isinstance(feats, wmfd_kernel.FeatureMatrices) else wmfd_kernel.pack_features(feats)
+    if normalize:
+        L1, L2, L3, L4, L5 = wmfd_kernel.normalize_lambdas(L1, L2, L3, L4, L5)
+    lambdas = (L1, L2, L3, L4, L5)
+    n = fm.n_trees
+    ranges = wmfd_kernel.tree_ranges(fm)
+    t = 1.0 - eps / L5 if L5 > 0 else 0.0
+    if t > 0:
+        pairs = _joined_pairs(fm, ranked_splits(fm), t, eps, lambdas, use_weight, ranges)
+    else:
+        pairs = _all_pairs(fm, eps, lambdas, use_weight, ranges)
+
+    rows: List[np.ndarray] = []
+    cols: List[np.ndarray] = []
+    vals: List[np.ndarray] = []
+    stats = dict(candidates=0, lb_pruned=0, evaluated=0, edges=0)
+    for step, (i, n_cand, js) in enumerate(pairs):
+        stats["candidates"] += n_cand
+        stats["lb_pruned"] += n_cand - js.size
+        if js.size == 0:
+            continue
+        d = wmfd_kernel.wmfd_one_to_many(fm, i, js, *lambdas, use_weight=use_weight)
+        stats["evaluated"] += js.size
+        keep = d <= eps + _TOL
+        if keep.any():
+            rows.append(np.full(int(keep.sum()), i))
+            cols.append(js[keep])
+            vals.append(d[keep])
+        if progress and step % 1000 == 0:
+            print(f"[EPS] {step}/{n}  edges={sum(v.size for v in vals)}", flush=True)
+
+    r = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+    c = np.concatenate(cols) if cols else np.zeros(0, dtype=np.intp)
+    v = np.concatenate(vals) if vals else np.zeros(0)
+    stats["edges"] = int(v.size)
+    G = sparse.coo_matrix((np.concatenate([v, v]), (np.concatenate([r, c]), np.concatenate([c, r]))),
+                          shape=(n, n)).tocsr()
+    G.sort_indices()
+    return G, stats
+
+
+# ----------------------------- density clustering -----------------------------
+
+def dbscan_sparse(G: sparse.csr_matrix, eps: float, min_samples: int = 5) -> np.ndarray:
+    """DBSCAN labels (-1 = noise) from a radius graph built with radius >= eps."""
+    from sklearn.cluster import DBSCAN
+    return DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed").fit_predict(G)
+
+
+def optics_sparse(G: sparse.csr_matrix, max_eps: float, min_samples: int = 5, **kw):
+    """
+    Fitted OPTICS on the radius graph (pairs absent from G are farther than
+    max_eps). DBSCAN partitions at any eps' <= max_eps can then be read with
+    sklearn.cluster.cluster_optics_dbscan without touching the trees again.
+    """
+    from sklearn.cluster import OPTICS
+    return OPTICS(min_samples=min_samples, max_eps=max_eps, metric="precomputed", **kw) \
+        .fit(_pad_rows(G, min_samples, 2.0 * max_eps + 1.0))
+
+
+def _pad_rows(G: sparse.csr_matrix, k: int, far: float) -> sparse.csr_matrix:
+    """
+    sklearn takes the core distance from the k nearest stored entries of a
+    row (self included): rows with fewer entries get placeholders at a
+    distance above max_eps, which OPTICS reads as "not a core point".
+    """
+    C = G.tocoo()
+    off = C.row != C.col
+    n = G.shape[0]
+    G = sparse.coo_matrix((np.concatenate([C.data[off], np.zeros(n)]),   # self as an explicit entry
+                           (np.concatenate([C.row[off], np.arange(n)]),
+                            np.concatenate([C.col[off], np.arange(n)]))), shape=G.shape).tocsr()
+    have = np.diff(G.indptr)
+    short = np.flatnonzero(have < k)
+    if short.size == 0:
+        return G
+    r, c = [], []
+    for i in short:
+        nb = set(G.indices[G.indptr[i]:G.indptr[i + 1]].tolist())
+        extra = [j for j in range(n) if j not in nb][:k - have[i]]
+        r.extend([i] * len(extra))
+        c.extend(extra)
+    C = G.tocoo()
+    # assembled from coordinates: csr + csr would drop the explicit zeros
+    out = sparse.coo_matrix((np.concatenate([C.data, np.full(len(r), far)]),
+                             (np.concatenate([C.row, r]), np.concatenate([C.col, c]))),
+                            shape=G.shape).tocsr()
+    out.sort_indices()
+    return out
+
+
+# ----------------------------- exact kNN / range search -----------------------------
+
+class NearestTrees:
+    """
+    Exact WMFD search over a fixed reference set (stored trees, cluster
+    medoids, ...). A query is scored against every reference with
+    wmfd_kernel.wmfd_lower_bound first; exact WMFD is then evaluated in
+    increasing bound order and the scan stops as soon as the next bound
+    exceeds the current k-th distance (knn) or eps (range).
+
+    References are packed with every leaf as a column, so queries appended
+    later get exactly the WMFD of a joint computation. Lambdas follow
+    step1b (normalized to sum to 1 unless normalize=False).
+    """
+
+    def __init__(self, feats, L1=0.30, L2=0.20, L3=0.25, L4=0.15, L5=0.10,
+                 use_weight: bool = True, normalize: bool = True, batch: int = 8):
+        if normalize:
+            L1, L2, L3, L4, L5 = wmfd_kernel.normalize_lambdas(L1, L2, L3, L4, L5)
+        self.lambdas = (L1, L2, L3, L4, L5)
+        self.use_weight = use_weight
+        self.batch = max(1, batch)
+        self.fm = wmfd_kernel.pack_features(list(feats), min_shared=1)
+        self.n = self.fm.n_trees
+        self.n_exact = 0  # exact WMFD evaluations, for pruning statistics
+
+    def _with_queries(self, queries):
+        fm = wmfd_kernel.append_features(self.fm, list(queries))
+        return fm, wmfd_kernel.tree_ranges(fm)
+
+    def _bounds(self, fm, ranges, q: int) -> np.ndarray:
+        return wmfd_kernel.wmfd_lower_bound(fm, [q], np.arange(self.n), *self.lambdas,
+                                            use_weight=self.use_weight, ranges=ranges)[0]
+
+    def _exact(self, fm, q: int, cols: np.ndarray) -> np.ndarray:
+        self.n_exact += cols.size
+        return wmfd_kernel.wmfd_one_to_many(fm, q, cols, *self.lambdas, use_weight=self.use_weight)
+
+    def _knn(self, fm, ranges, q: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        lb = self._bounds(fm, ranges, q)
+        order = np.argsort(lb, kind="stable")
+        idx = np.zeros(0, dtype=np.intp)
+        dist = np.zeros(0)
+        a = 0
+        while a < self.n:
+            if idx.size >= k and lb[order[a]] > dist[k - 1]:
+                break
+            step = k if a == 0 else self.batch  # the k best bounds first
+            cols = order[a:a + step]
+            a += step
+            idx = np.concatenate([idx, cols])
+            dist = np.concatenate([dist, self._exact(fm, q, cols)])
+            best = np.lexsort((idx, dist))[:k]
+            idx, dist = idx[best], dist[best]
+        return idx, dist
+
+    def _range(self, fm, ranges, q: int, eps: float) -> Tuple[np.ndarray, np.ndarray]:
+        lb = self._bounds(fm, ranges, q)
+        cols = np.flatnonzero(lb <= eps + _TOL)
+        d = self._exact(fm, q, cols)
+        keep = d <= eps + _TOL
+        order = np.lexsort((cols[keep], d[keep]))
+        return cols[keep][order], d[keep][order]
+
+    def knn(self, tree, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances) of the k nearest references, nearest first."""
+        fm, ranges = self._with_queries([tree])
+        return self._knn(fm, ranges, self.n, min(k, self.n))
+
+    def range(self, tree, eps: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, distances) of every reference with WMFD <= eps, nearest first."""
+        fm, ranges = self._with_queries([tree])
+        return self._range(fm, ranges, self.n, eps)
+
+    def assign(self, trees) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest reference of each tree (e.g. new trees to cluster medoids)."""
+        trees = list(trees)
+        fm, ranges = self._with_queries(trees)
+        labels = np.zeros(len(trees), dtype=np.intp)
+        dist = np.zeros(len(trees))
+        for t in range(len(trees)):
+            i, d = self._knn(fm, ranges, self.n + t, 1)
+            labels[t], dist[t] = i[0], d[0]
+        return labels, dist
+
+
+# ----------------------------- CLI -----------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="DBSCAN / OPTICS on WMFD from a sparse ε-neighbourhood graph")
+    ap.add_argument("--in_csv", required=True, help="trees.csv (or any .txt/.csv, optionally gzipped)")
+    ap.add_argument("--eps", type=float, required=True, help="rayon ε (WMFD, lambdas normalisés)")
+    ap.add_argument("--min_samples", type=int, default=5)
+    ap.add_argument("--optics", action="store_true", help="OPTICS (max_eps=ε) au lieu de DBSCAN")
+    ap.add_argument("--graph", default=None, help="écrire le graphe ε (.npz, scipy.sparse)")
+    ap.add_argument("--out", default=None, help="labels CSV (défaut: <stem>_dbscan.csv)")
+    args = ap.parse_args()
+
+    import newick_io
+    import feature_cache
+    import step1b_metric_wmfd as s1b
+
+    ids, newicks = [], []
+    for tid, nw in newick_io.iter_newick_records(args.in_csv):
+        ids.append(tid)
+        newicks.append(nw)
+    print(f"[LOAD] {len(ids)} trees from {args.in_csv}")
+    feats = feature_cache.cached_features(newicks, s1b.precompute_features, "step1b", labels=ids)
+
+    G, stats = radius_graph(feats, args.eps, progress=True)
+    n = len(ids)
+    total = n * (n - 1) // 2
+    print(f"[EPS] {stats['evaluated']}/{total} pairs evaluated "
+          f"({stats['candidates']} candidates, {stats['lb_pruned']} pruned by the lower bound), {stats['edges']} edges")
+    if args.graph:
+        sparse.save_npz(args.graph, G)
+        print(f"[OK] {args.graph}")
+
+    if args.optics:
+        labels = optics_sparse(G, args.eps, args.min_samples).labels_
+    else:
+        labels = dbscan_sparse(G, args.eps, args.min_samples)
+
+    stem = os.path.splitext(args.in_csv[:-3] if args.in_csv.endswith(".gz") else args.in_csv)[0]
+    out = args.out or f"{stem}_{'optics' if args.optics else 'dbscan'}.csv"
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["tree_id", "cluster"])
+        for tid, lab in zip(ids, labels):
+            w.writerow([tid, int(lab)])
+    k = len(set(labels.tolist()) - {-1})
+    print(f"[OK] {out}  clusters={k}  noise={int(np.sum(labels == -1))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+# -- coding: utf-8 --
+"""
+benchmarks — timing harness for the WMFD metric, the clustering steps and
+the tree generators (see README.md in this folder).
+
+    python -m benchmarks --quick
+    python -m benchmarks --save_baseline
+    python -m benchmarks --baseline benchmarks/baseline.json
+"""
@@ -0,0 +1,92 @@
+# -- coding: utf-8 --
+"""
+python -m benchmarks  (from WMFD/Experiments)
+
+Runs the cases of cases.py over their size sweeps, prints time, throughput,
+peak memory and the fitted scaling exponent per case, writes a CSV, and
+optionally saves / compares against a JSON baseline. The exit code is 1
+when a case is slower than --tolerance × baseline.
+"""
+
+import argparse
+import os
+import sys
+
+from . import harness
+from .cases import CASES, available
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(_HERE, "baseline.json")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks",
+                                 description="Benchmark WMFD metric, clustering and generators.")
+    ap.add_argument("--cases", default="", help=f"comma list among: {', '.join(CASES)} (default: all)")
+    ap.add_argument("--quick", action="store_true", help="small sizes only (smoke run)")
+    ap.add_argument("--sizes", default="", help="override the swept sizes, e.g. 64,128,256")
+    ap.add_argument("--repeat", type=int, default=3, help="timed runs per size (best is kept)")
+    ap.add_argument("--no_memory", action="store_true", help="skip the tracemalloc run")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="benchmark_results.csv")
+    ap.add_argument("--baseline", default=None, help="JSON baseline to compare against")
+    ap.add_argument("--save_baseline", nargs="?", const=DEFAULT_BASELINE, default=None,
+                    help=f"write this run as the baseline (default path: {DEFAULT_BASELINE})")
+    ap.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown ratio")
+    args = ap.parse_args(argv)
+
+    names = [c.strip() for c in args.cases.split(",") if c.strip()] or list(CASES)
+    unknown = [c for c in names if c not in CASES]
+    if unknown:
+        ap.error(f"unknown case(s): {', '.join(unknown)}")
+    override = [int(x) for x in args.sizes.split(",") if x.strip()]
+
+    results = []
+    for name in names:
+        case = CASES[name]
+        ok, why = available(case)
+        if not ok:
+            print(f"[SKIP] {name}: {why}")
+            continue
+        sizes = override or (case.quick if args.quick else case.sizes)
+        for x in sizes:
+            n, L = case.args(x)
+            fn, items = case.setup(n, L, args.seed)
+            sec, peak = harness.measure(fn, repeat=args.repeat, memory=not args.no_memory)
+            m = harness.Measurement(name, x, n, L, sec, items, items / sec if sec > 0 else float("inf"), peak)
+            results.append(m)
+            print(f"[BENCH] {name:<22} {case.sweep}={x:<5} {sec:10.4f}s  "
+                  f"{m.throughput:12.1f} items/s  peak {peak:8.2f} MB", flush=True)
+
+    if not results:
+        print("No case run.")
+        return 0
+
+    exps = harness.summarize(results)
+    print("\nScaling exponents (time ~ size^b):")
+    for name, b in exps.items():
+        print(f"  {name:<22} {CASES[name].sweep}  b = {b:.2f}")
+
+    harness.write_csv(args.out, results, exps)
+    print(f"\n[OK] {args.out}")
+
+    if args.save_baseline:
+        harness.save_baseline(args.save_baseline, results)
+        print(f"[OK] baseline → {args.save_baseline}")
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f"[WARN] baseline not found: {args.baseline}")
+            return 0
+        regs = harness.compare(results, harness.load_baseline(args.baseline), args.tolerance)
+        if regs:
+            print(f"\n[REGRESSION] {len(regs)} measurement(s) slower than {args.tolerance}× baseline:")
+            for r in regs:
+                print(f"  {r.case} @ {r.x}: {r.seconds:.4f}s vs {r.baseline:.4f}s ({r.ratio:.2f}×)")
+            return 1
+        print(f"[OK] no regression vs {args.baseline} (tolerance {args.tolerance}×)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# -- coding: utf-8 --
+"""
+cases.py — benchmark cases on synthetic inputs
+
+Trees come from the in-memory generator of the Dashboard
+(gptree_generate_structures: K prototypes + NNI / branch-length jitter),
+distance matrices for the clustering cases are Euclidean distances between
+K Gaussian blobs, so every input is cheap to build and fully seeded.
+
+Each case sweeps one size (n = number of trees/points, or L = leaves) and
+returns, from its setup, the callable to time plus its number of work units.
+"""
+
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+DASHBOARD = os.path.join(os.path.dirname(_HERE), "Dashboard")
+if DASHBOARD not in sys.path:
+    sys.path.insert(0, DASHBOARD)
+
+K_GROUPS = 4
+
+
+@dataclass
+class Case:
+    name: str
+    sweep: str                                  # "n" or "L"
+    sizes: List[int]
+    quick: List[int]
+    fixed: int                                  # the other dimension
+    setup: Callable[[int, int, int], Tuple[Callable[[], object], int]]
+    requires: List[str] = field(default_factory=list)
+
+    def args(self, x: int) -> Tuple[int, int]:
+        """(n, L) for swept value x."""
+        return (x, self.fixed) if self.sweep == "n" else (self.fixed, x)
+
+
+# ---- synthetic inputs ----
+
+def make_trees(n: int, L: int, seed: int = 0, plevel: float = 0.5, noise: float = 25.0):
+    """n ETE trees with L leaves, in K_GROUPS groups of perturbed prototypes."""
+    import gptree_generate_structures as gen
+    trees = []
+    for i in range(n):
+        g = i % K_GROUPS
+        proto = gen._make_base_tree(L, seed=seed * 100003 + g * 1000 + L)
+        trees.append(gen._make_tree_from_proto(proto, plevel=plevel, noise_pct=noise,
+                                               seed=seed * 100003 + g * 1000 + i))
+    return trees
+
+
+def make_newicks(n: int, L: int, seed: int = 0) -> List[str]:
+    return [t.write(format=1) for t in make_trees(n, L, seed)]
+
+
+def blob_matrix(n: int, seed: int = 0, k: int = K_GROUPS, dim: int = 8) -> np.ndarray:
+    """Symmetric distance matrix of n points drawn around k centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(scale=4.0, size=(k, dim))
+    X = centres[np.arange(n) % k] + rng.normal(size=(n, dim))
+    sq = (X * X).sum(axis=1)
+    D = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2.0 * X @ X.T, 0.0))
+    np.fill_diagonal(D, 0.0)
+    return D
+
+
+def _pairs(n: int) -> int:
+    return n * (n - 1) // 2
+
+
+# ---- metric ----
+
+def _setup_wmfd_pair(n, L, seed):
+    import step1b_metric_wmfd as s1b
+    feats = [s1b.precompute_features(nw) for nw in make_newicks(K_GROUPS, L, seed)]
+    A, B = feats[0], feats[1]
+    reps = 50
+    def run():
+        for _ in range(reps):
+            s1b.wmfd_pair(A, B, 0.30, 0.20, 0.25, 0.15, 0.10)
+    return run, reps
+
+def _setup_precompute(n, L, seed):
+    import step1b_metric_wmfd as s1b
+    newicks = make_newicks(n, L, seed)
+    return (lambda: [s1b.precompute_features(nw) for nw in newicks]), n
+
+def _setup_matrix_step1b(n, L, seed):
+    import step1b_metric_wmfd as s1b
+    import wmfd_kernel
+    feats = [s1b.precompute_features(nw) for nw in make_newicks(n, L, seed)]
+    return (lambda: wmfd_kernel.wmfd_matrix(feats, normalize=True)), _pairs(n)
+
+def _setup_matrix_inmem(n, L, seed):
+    import wmfd_cluster_all_inmem as inmem
+    trees = make_trees(n, L, seed)
+    return (lambda: inmem.wmfd_matrix_ete(trees, progress=False)), _pairs(n)
+
+
+# ---- clustering ----
+
+def _setup_pam(n, L, seed):
+    import wmfd_cluster_all_inmem as inmem
+    D = blob_matrix(n, seed)
+    return (lambda: inmem.pam_kmedoids(D, K_GROUPS, seed=seed)), n
+
+def _setup_k_medoids(n, L, seed):
+    import step1c_clustering_kmedoids as s1c
+    D = blob_matrix(n, seed)
+    return (lambda: s1c.k_medoids(D, K_GROUPS, seed=seed, n_init=5, max_iter=100)), n
+
+def _setup_choose_k(n, L, seed):
+    import wmfd_cluster_all_inmem as inmem
+    D = blob_matrix(n, seed)
+    return (lambda: inmem.choose_k_and_labels(D, kmin=2, kmax=8, criterion="silhouette", seed=seed)), n
+
+
+# ---- generators ----
+
+def _setup_generate_runs(n, L, seed):
+    import gptree_generate_structures as gen
+    per = max(1, n // K_GROUPS)
+    return (lambda: gen.generate_runs(Ks=[K_GROUPS], Ls=[L], ns=[per], plevels=[0.5],
+                                      noises=[25], reps=[seed], return_format="ete")), per * K_GROUPS
+
+def _setup_build_cluster(n, L, seed):
+    import random
+    import gptree_cluster_refined as gcr
+    random.seed(seed)
+    S = gcr.gptree_speciestree(L)
+    def run():
+        random.seed(seed)
+        gcr.build_cluster(S, Ngen=n, plevel=0.5, max_tries_per_tree=200,
+                          hgt_rate=0.2, loss_rate=0.2, replace_prob=0.9)
+    return run, n
+
+
+CASES: Dict[str, Case] = {c.name: c for c in [
+    Case("wmfd_pair",          "L", [20, 40, 80, 160],     [20, 40],   0,  _setup_wmfd_pair),
+    Case("precompute",         "n", [32, 64, 128, 256],    [16, 32],   40, _setup_precompute),
+    Case("wmfd_matrix_step1b", "n", [32, 64, 128, 256],    [16, 32],   40, _setup_matrix_step1b),
+    Case("wmfd_matrix_step1b_L", "L", [20, 40, 80, 160],   [20, 40],   64, _setup_matrix_step1b),
+    Case("wmfd_matrix_inmem",  "n", [32, 64, 128, 256],    [16, 32],   40, _setup_matrix_inmem),
+    Case("pam_kmedoids",       "n", [64, 128, 256, 512],   [32, 64],   0,  _setup_pam),
+    Case("k_medoids",          "n", [64, 128, 256, 512],   [32, 64],   0,  _setup_k_medoids),
+    Case("choose_k_and_labels", "n", [64, 128, 256, 512],  [32, 64],   0,  _setup_choose_k),
+    Case("generate_runs",      "n", [16, 32, 64, 128],     [8, 16],    40, _setup_generate_runs),
+    Case("build_cluster",      "n", [4, 8, 16],            [4, 8],     20, _setup_build_cluster,
+         requires=["asymmetree"]),
+]}
+
+
+def available(case: Case) -> Tuple[bool, str]:
+    """(ok, reason): optional dependencies of a case."""
+    import importlib.util
+    for mod in case.requires:
+        if importlib.util.find_spec(mod) is None:
+            return False, f"{mod} not installed"
+    return True, ""
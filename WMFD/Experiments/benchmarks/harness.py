@@ -0,0 +1,137 @@
+# -- coding: utf-8 --
+"""
+harness.py — measurement, scaling fit and baseline comparison
+
+Each measurement runs the case `repeat` times and keeps the best wall time
+(least perturbed by the machine), then runs it once more under tracemalloc
+for the peak of Python/NumPy allocations. Timing and memory runs are kept
+separate because tracemalloc slows allocation-heavy code down.
+"""
+
+import gc
+import json
+import math
+import os
+import platform
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+@dataclass
+class Measurement:
+    case: str
+    x: int                 # value of the swept size (n or L)
+    n: int                 # number of trees / points
+    L: int                 # number of leaves (0 if not relevant)
+    seconds: float         # best of `repeat`
+    items: int             # work units (pairs, points, trees...) per call
+    throughput: float      # items / second
+    peak_mb: float         # tracemalloc peak, MB
+
+
+def measure(fn: Callable[[], object], repeat: int = 3, memory: bool = True):
+    """(best seconds, peak MB) of fn()."""
+    best = math.inf
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    peak = float("nan")
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def fit_exponent(xs, ys) -> float:
+    """Slope b of log(y) = a + b*log(x): runtime ~ x^b (nan with < 2 points)."""
+    xs = np.asarray(xs, float)
+    ys = np.asarray(ys, float)
+    ok = (xs > 0) & (ys > 0)
+    if ok.sum() < 2:
+        return float("nan")
+    return float(np.polyfit(np.log(xs[ok]), np.log(ys[ok]), 1)[0])
+
+
+def summarize(results: List[Measurement]) -> Dict[str, float]:
+    """Scaling exponent per case."""
+    by_case: Dict[str, List[Measurement]] = {}
+    for m in results:
+        by_case.setdefault(m.case, []).append(m)
+    return {c: fit_exponent([m.x for m in ms], [m.seconds for m in ms]) for c, ms in by_case.items()}
+
+
+# ---- baseline ----
+
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def save_baseline(path: str, results: List[Measurement]) -> None:
+    doc = {"env": environment(),
+           "exponents": summarize(results),
+           "results": [asdict(m) for m in results]}
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=1)
+
+
+def load_baseline(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@dataclass
+class Regression:
+    case: str
+    x: int
+    seconds: float
+    baseline: float
+    ratio: float
+
+
+def compare(results: List[Measurement], baseline: Dict, tolerance: float = 1.5,
+            min_seconds: float = 1e-3) -> List[Regression]:
+    """
+    Measurements slower than tolerance × baseline (same case and size).
+    Timings below min_seconds in both runs are too noisy to judge.
+    """
+    ref = {(r["case"], int(r["x"])): float(r["seconds"]) for r in baseline.get("results", [])}
+    out = []
+    for m in results:
+        b = ref.get((m.case, m.x))
+        if b is None or max(b, m.seconds) < min_seconds:
+            continue
+        ratio = m.seconds / b if b > 0 else math.inf
+        if ratio > tolerance:
+            out.append(Regression(m.case, m.x, m.seconds, b, ratio))
+    return out
+
+
+def write_csv(path: str, results: List[Measurement],
+              exponents: Optional[Dict[str, float]] = None) -> None:
+    import csv
+    exponents = exponents or summarize(results)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["case", "x", "n", "L", "seconds", "items", "throughput", "peak_mb", "exponent"])
+        for m in results:
+            w.writerow([m.case, m.x, m.n, m.L, f"{m.seconds:.6f}", m.items,
+                        f"{m.throughput:.3f}", f"{m.peak_mb:.3f}", f"{exponents.get(m.case, float('nan')):.3f}"])
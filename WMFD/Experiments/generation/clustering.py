@@ -4,8 +4,11 @@
 clustering.py
 -------------
 Clustering algorithms for phylogenetic tree distance matrices.
-Supports K-Medoids, K-Means, and DBSCAN with evaluation metrics.
+Supports K-Medoids, K-Means, DBSCAN and hierarchical (HAC, see hierarchy.py)
+with evaluation metrics.
 """
+import os
+import sys
 import numpy as np
 from sklearn.metrics import adjusted_rand_score, silhouette_score, calinski_harabasz_score
 from sklearn.manifold import MDS
@@ -16,6 +19,12 @@ try:
     _HAVE_KMEDOIDS = True
 except ImportError:
     _HAVE_KMEDOIDS = False
+# pam_engine is shared with ../Dashboard (appended: local modules keep priority)
+DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Dashboard")
+if DASHBOARD not in sys.path:
+    sys.path.append(DASHBOARD)
+import pam_engine  # built-in FastPAM1 when kmedoids is missing
+import hierarchy
 
 def cluster_data(distance_matrix, method="kmedoids", k=3, **kwargs):
     """
@@ -23,9 +32,12 @@ def cluster_data(distance_matrix, method="kmedoids", k=3, **kwargs):
     
     Args:
         distance_matrix: Precomputed distance matrix (n x n)
-        method: "kmedoids", "kmeans", or "dbscan"
+        method: "kmedoids", "kmeans", "dbscan" or "hac"
         k: Number of clusters (ignored for DBSCAN)
         **kwargs: Additional parameters for specific methods
+            hac: linkage ("average", "complete", "single", "weighted", "ward"),
+                 dendrogram (path of a saved linkage, reused or created),
+                 ids (tree ids of the rows, stored with / checked against it)
     Returns:
         labels: Cluster labels array
     """
@@ -33,7 +45,8 @@ def cluster_data(distance_matrix, method="kmedoids", k=3, **kwargs):
     
     if method == "kmedoids":
         if not _HAVE_KMEDOIDS:
-            raise ImportError("Install kmedoids: pip install kmedoids")
+            result = pam_engine.fastpam(D, k, init="build")
+            return np.array(result.labels, dtype=int)
         result = KM.fasterpam(D, k)
         return np.array(result.labels, dtype=int)
     
@@ -55,8 +68,18 @@ def cluster_data(distance_matrix, method="kmedoids", k=3, **kwargs):
         dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric="precomputed")
         return dbscan.fit_predict(D)
     
+    elif method == "hac":
+        # linkage computed once; every cut only replays the merges
+        link = kwargs.get("linkage", "average")
+        path = kwargs.get("dendrogram")
+        if path:
+            dend = hierarchy.cached_dendrogram(path, D, method=link, ids=kwargs.get("ids"))
+        else:
+            dend = hierarchy.Dendrogram.from_matrix(D, method=link, ids=kwargs.get("ids"), ks=[k])
+        return dend.labels_at_k(k)
+    
     else:
-        raise ValueError(f"Unknown method: {method}. Use 'kmedoids', 'kmeans', or 'dbscan'")
+        raise ValueError(f"Unknown method: {method}. Use 'kmedoids', 'kmeans', 'dbscan' or 'hac'")
 
 def evaluate_clustering(distance_matrix, labels, y_true=None):
     """
@@ -136,7 +159,8 @@ def process_wmfd_data(wmfd_data, method="kmedoids", **kwargs):
         
         # Clustering
         try:
-            pred_labels = cluster_data(D, method=method, k=k, **kwargs)
+            ids = entry.get("ids") or [f"{run_name}_{i}" for i in range(len(D))]
+            pred_labels = cluster_data(D, method=method, k=k, **dict(kwargs, ids=kwargs.get("ids", ids)))
             metrics = evaluate_clustering(D, pred_labels, true_labels)
             
             results[run_name] = {
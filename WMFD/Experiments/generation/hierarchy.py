@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -- coding: utf-8 --
+"""
+hierarchy.py
+------------
+Hierarchical agglomerative clustering (HAC) of WMFD matrices with a
+reusable dendrogram.
+
+The linkage is computed once (scipy, O(n²) from the condensed matrix) and
+kept as a Dendrogram; cutting it at k clusters or at a height h only
+replays the n - 1 merges, so a k = 1..20 sweep costs no extra distance
+work. Cuts for a range of k are computed in one pass at build time and
+saved with the linkage (.npz), so later runs load the labels directly.
+
+Linkages:
+    "average", "complete", "single", "weighted" : on WMFD directly
+    "ward"                                       : on a classical MDS embedding
+                                                   of WMFD (Ward needs Euclidean
+                                                   coordinates, WMFD is not one)
+
+Labels are 0..k-1, numbered by first appearance (same convention as
+cluster_data), so the same partition always gets the same ids.
+"""
+import os
+import hashlib
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+
+LINKAGES = ("average", "complete", "single", "weighted", "ward")
+DENDROGRAM_VERSION = 2
+
+
+def _condensed(distance_matrix) -> np.ndarray:
+    """Condensed vector from a square matrix (symmetrized) or a condensed one."""
+    D = np.asarray(distance_matrix, dtype=float)
+    if D.ndim == 1:
+        return D
+    D = 0.5 * (D + D.T)
+    np.fill_diagonal(D, 0.0)
+    return squareform(D, checks=False)
+
+
+def matrix_digest(distance_matrix) -> str:
+    """sha256 of the condensed float64 matrix: identifies the data a linkage was built from."""
+    v = np.ascontiguousarray(_condensed(distance_matrix), dtype="<f8")
+    return hashlib.sha256(v.tobytes()).hexdigest()
+
+
+def classical_mds(distance_matrix, n_components: int = 10) -> np.ndarray:
+    """Torgerson MDS: top eigenvectors of the double-centred squared distances."""
+    D = np.asarray(distance_matrix, dtype=float)
+    if D.ndim == 1:
+        D = squareform(D)
+    n = D.shape[0]
+    J = np.eye(n) - 1.0 / n
+    B = -0.5 * J @ (D ** 2) @ J
+    w, V = np.linalg.eigh(B)
+    order = np.argsort(w)[::-1][:max(1, min(n_components, n))]
+    w, V = w[order], V[:, order]
+    keep = w > 1e-12
+    if not np.any(keep):
+        return np.zeros((n, 1))
+    return V[:, keep] * np.sqrt(w[keep])
+
+
+def _first_appearance(labels: np.ndarray) -> np.ndarray:
+    _, first, inv = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(first.size, dtype=int)
+    rank[np.argsort(first)] = np.arange(first.size)
+    return rank[inv.ravel()]
+
+
+def _replay_cuts(Z: np.ndarray, n: int, ks: Sequence[int]) -> Dict[int, np.ndarray]:
+    """Labels at every k in ks from one pass over the merges."""
+    parent = np.arange(2 * n - 1)
+    wanted = sorted({k for k in ks if 1 <= k <= n}, reverse=True)
+    out: Dict[int, np.ndarray] = {}
+    step = 0
+    for k in wanted:
+        # the first n - k merges give k clusters
+        parent[Z[step:n - k, :2].astype(np.intp)] = (n + np.arange(step, n - k))[:, None]
+        step = n - k
+        roots = parent.copy()
+        while True:  # pointer jumping up to the current roots
+            nxt = roots[roots]
+            if np.array_equal(nxt, roots):
+                break
+            roots = nxt
+        out[k] = _first_appearance(roots[:n])
+    return out
+
+
+class Dendrogram:
+    """Linkage matrix of one run plus cached cuts."""
+
+    def __init__(self, Z: np.ndarray, method: str, ids: Optional[Sequence[str]] = None,
+                 cuts: Optional[Dict[int, np.ndarray]] = None, digest: str = ""):
+        self.Z = np.asarray(Z, dtype=float)
+        self.method = method
+        self.n = self.Z.shape[0] + 1
+        self.ids = list(ids) if ids is not None else None
+        self.digest = digest  # matrix_digest of the input matrix
+        self._cuts: Dict[int, np.ndarray] = dict(cuts or {})
+
+    @classmethod
+    def from_matrix(cls, distance_matrix, method: str = "average",
+                    ids: Optional[Sequence[str]] = None, n_components: int = 10,
+                    ks: Iterable[int] = range(1, 21)) -> "Dendrogram":
+        """
+        Build from a square or condensed WMFD matrix; cuts for ks are
+        precomputed (a single replay of the merges).
+        """
+        if method not in LINKAGES:
+            raise ValueError(f"Unknown linkage: {method}. Use one of {', '.join(LINKAGES)}")
+        if method == "ward":
+            X = classical_mds(distance_matrix, n_components)
+            Z = linkage(X, method="ward")
+        else:
+            Z = linkage(_condensed(distance_matrix), method=method)
+        dend = cls(Z, method, ids, digest=matrix_digest(distance_matrix))
+        dend._cuts.update(_replay_cuts(dend.Z, dend.n, list(ks)))
+        return dend
+
+    @property
+    def heights(self) -> np.ndarray:
+        """Merge heights, in merge order."""
+        return self.Z[:, 2]
+
+    def labels_at_k(self, k: int) -> np.ndarray:
+        """Partition into k clusters (labels 0..k-1)."""
+        k = int(k)
+        if not (1 <= k <= self.n):
+            raise ValueError(f"k must be in [1, {self.n}], got {k}")
+        if k not in self._cuts:
+            self._cuts.update(_replay_cuts(self.Z, self.n, [k]))
+        return self._cuts[k].copy()
+
+    def labels_for_ks(self, ks: Iterable[int]) -> Dict[int, np.ndarray]:
+        """{k: labels} for several k; missing cuts are added in one replay."""
+        ks = [int(k) for k in ks]
+        missing = [k for k in ks if k not in self._cuts]
+        if missing:
+            self._cuts.update(_replay_cuts(self.Z, self.n, missing))
+        return {k: self._cuts[k].copy() for k in ks if k in self._cuts}
+
+    def labels_at_height(self, h: float) -> np.ndarray:
+        """Clusters obtained by keeping only the merges at height <= h."""
+        return _first_appearance(fcluster(self.Z, t=h, criterion="distance"))
+
+    def k_at_height(self, h: float) -> int:
+        return int(self.n - np.count_nonzero(self.heights <= h))
+
+    def save(self, path: str) -> str:
+        ks = np.asarray(sorted(self._cuts), dtype=int)
+        cuts = np.vstack([self._cuts[k] for k in ks]).astype(np.int32) if ks.size \
+            else np.zeros((0, self.n), dtype=np.int32)
+        ids = np.asarray(self.ids if self.ids is not None else [], dtype=str)
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(f, version=DENDROGRAM_VERSION, Z=self.Z, method=self.method,
+                                ids=ids, ks=ks, cuts=cuts, digest=self.digest)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "Dendrogram":
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != DENDROGRAM_VERSION:
+                raise ValueError(f"{path}: unsupported dendrogram version {int(z['version'])}")
+            ids = z["ids"].tolist() or None
+            cuts = {int(k): z["cuts"][i].astype(int) for i, k in enumerate(z["ks"])}
+            return cls(z["Z"], str(z["method"]), ids, cuts, digest=str(z["digest"]))
+
+
+def cached_dendrogram(path: str, distance_matrix, method: str = "average",
+                      ids: Optional[Sequence[str]] = None, **kwargs) -> Dendrogram:
+    """
+    Load path if it holds a dendrogram of the same matrix (digest), linkage
+    and ids, else build and save it.
+    """
+    digest = matrix_digest(distance_matrix)
+    if os.path.exists(path):
+        try:
+            dend = Dendrogram.load(path)
+            if (dend.method == method and dend.digest == digest
+                    and (ids is None or dend.ids == list(ids))):
+                return dend
+        except (OSError, ValueError, KeyError):
+            pass
+    dend = Dendrogram.from_matrix(distance_matrix, method=method, ids=ids, **kwargs)
+    dend.save(path)
+    return dend
@@ -11,12 +11,22 @@ GÜRBÜZ Emre
 
 from __future__ import annotations
 
+import os
+import sys
 import time
 from typing import Dict, Set, Tuple, List, Optional
 import numpy as np
 
 from ete3 import Tree
 
+# shared modules (wmfd_kernel, pam_engine) live in ../Dashboard; appended so
+# that this folder's own modules (gptree_generate_structures) keep priority
+DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Dashboard")
+if DASHBOARD not in sys.path:
+    sys.path.append(DASHBOARD)
+
+import wmfd_kernel
+
 print("[BOOT] importing generator…", flush=True)
 import gptree_generate_structures as gen
 print("[BOOT] generator imported ✓", flush=True)
@@ -54,7 +64,7 @@ def wmfd_precompute_tree(t: Tree):
             - W: weights dict {leaf_name: weight}
             - D: degrees dict {leaf_name: parent_degree}
             - leaf_set: set of leaf names
-            - splits: set of bipartitions
+            - splits: sorted uint64 split keys (wmfd_kernel.split_hashes)
     """
     _uniq_names(t)
     root = t.get_tree_root()
@@ -72,14 +82,7 @@ def wmfd_precompute_tree(t: Tree):
         D[nm]  = float(len(lf.up.children) if lf.up else 1)
     
     leaf_set: Set[str] = set(BL.keys())
-    splits: Set[frozenset] = set()
-    
-    for nd in t.traverse("postorder"):
-        if nd.is_leaf():
-            continue
-        clade = frozenset(le.name for le in nd.iter_leaves())
-        if 1 < len(clade) < len(leaf_set):
-            splits.add(clade)
+    splits = wmfd_kernel.split_hashes(t)  # sorted uint64 split keys
     
     return (t, BL, H, W, D, leaf_set, splits)
 
@@ -137,39 +140,27 @@ def wmfd_pair(A, B, L1=0.15, L2=0.15, L3=0.35, L4=0.25, L5=0.10) -> float:
     Wu = L1*(uBL/UNCs) + L2*(uH/UNCs) + L3*(uW/UNCs) + L4*(uD/UNCs)
 
     # Topological component
-    Usp = S1 | S2; Isp = S1 & S2
-    HD  = 1.0 - (len(Isp)/len(Usp)) if len(Usp) > 0 else 0.0
+    HD  = wmfd_kernel.split_distance(S1, S2)
     P   = 1.0 - (CN / TN) if TN > 0 else 0.0
     
     return float(P*Wu + Wc + L5*HD)
 
-def wmfd_matrix_ete(trees: List[Tree], progress: bool = True) -> np.ndarray:
+def wmfd_matrix_ete(trees: List[Tree], progress: bool = True, n_jobs: int = 1) -> np.ndarray:
     """
     Compute pairwise WMFD distance matrix for a list of trees.
     
     Args:
         trees: List of ETE3 Tree objects
         progress: Whether to display progress
+        n_jobs: Worker processes for the tiled matrix (1 = serial, -1 = all cores)
         
     Returns:
         np.ndarray: Symmetric distance matrix
     """
     feats = [wmfd_precompute_tree(t) for t in trees]
-    n = len(feats)
-    D = np.zeros((n, n), dtype=float)
-    
-    for i in range(n):
-        if progress and (i % 8 == 0):
-            print(f"[WMFD] {i}/{n}", flush=True)
-        fi = feats[i]
-        for j in range(i+1, n):
-            D[i, j] = D[j, i] = wmfd_pair(fi, feats[j])
-    
-    if progress:
-        print(f"[WMFD] {n}/{n}", flush=True)
-    
-    np.fill_diagonal(D, 0.0)
-    return D
+    # Vectorized equivalent of wmfd_pair's defaults (W constant -> dW = 0)
+    return wmfd_kernel.wmfd_matrix(feats, 0.15, 0.15, 0.35, 0.25, 0.10,
+                                   use_weight=False, progress=progress, n_jobs=n_jobs)
 
 # ===================== PIPELINE IN-MEMORY =====================
 
@@ -182,6 +173,7 @@ def compute_all_wmfd_inmem(
     reps: Tuple[int, ...] = DEFAULT_reps,
     return_format: str = "ete",
     progress: bool = True,
+    n_jobs: int = 1,
 ):
     """
     Complete WMFD pipeline: generate trees and compute distance matrices.
@@ -190,6 +182,7 @@ def compute_all_wmfd_inmem(
         Ks, Ls, ns, plevels, noises, reps: Parameter grids for tree generation
         return_format: Tree format for generator
         progress: Whether to display progress
+        n_jobs: Worker processes per distance matrix (1 = serial, -1 = all cores)
         
     Returns:
         dict: {run_name: {"D": distance_matrix, "trees": trees, "meta": metadata}}
@@ -210,7 +203,7 @@ def compute_all_wmfd_inmem(
         if progress:
             print(f"\n[RUN {i}/{len(runs)}] {r.run_name} | N={len(trees)}", flush=True)
 
-        D = wmfd_matrix_ete(trees, progress=progress)
+        D = wmfd_matrix_ete(trees, progress=progress, n_jobs=n_jobs)
         vals = D[np.triu_indices(D.shape[0], 1)]
         
         if progress:
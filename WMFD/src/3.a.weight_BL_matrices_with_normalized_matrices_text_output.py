@@ -1,44 +1,8 @@
-import os
 import argparse
 from pathlib import Path
 import numpy as np
-import re
 
-def read_newick_trees(file_path):
-    """
-    Read multiple Newick trees from a text file.
-    """
-    trees = []
-    try:
-        with open(file_path, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line:
-                    trees.append(line)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"File not found: {file_path}")
-    
-    return trees
-
-def extract_values(newick_str):
-    """
-    Extract sequence names (including naive), weights, and branch lengths from a Newick string.
-    """
-    weights = {}
-    branch_lengths = {}
-    
-    parts = newick_str.replace('(', ',').replace(')', ',').strip(';').split(',')
-    
-    for part in parts:
-        part = part.strip()
-        if part and '@' in part and ':' in part:
-            name_weight, branch = part.split(':')
-            name, weight = name_weight.split('@')
-            name = name.strip()
-            weights[name] = float(weight)
-            branch_lengths[name] = float(branch)
-    
-    return weights, branch_lengths
+from tree_model import load_trees
 
 def sort_sequences(sequences):
     """
@@ -75,8 +39,7 @@ def create_matrices(trees):
     """
     all_sequences = set()
     for tree in trees:
-        weights, _ = extract_values(tree)
-        all_sequences.update(weights.keys())
+        all_sequences.update(tree.names)
     
     seq_list = sort_sequences(list(all_sequences))
     n_trees = len(trees)
@@ -86,7 +49,8 @@ def create_matrices(trees):
     branch_matrix = np.zeros((n_trees, n_sequences))
     
     for i, tree in enumerate(trees):
-        weights, branches = extract_values(tree)
+        weights = tree.to_dict("weight")
+        branches = tree.to_dict("branch_length")
         for j, seq in enumerate(seq_list):
             weight_matrix[i, j] = weights.get(seq, 0)
             branch_matrix[i, j] = branches.get(seq, 0)
@@ -129,7 +93,7 @@ def main():
     output_file = base_path / "matrices_with_normalization_60.txt"
     
     # Read trees and create matrices
-    trees = read_newick_trees(input_file)
+    trees = load_trees(input_file)
     (weight_matrix, branch_matrix, normalized_weight_matrix, 
      normalized_branch_matrix, sequence_names) = create_matrices(trees)
     
@@ -1,43 +1,9 @@
-import os
 import argparse
 from pathlib import Path
 import numpy as np
 from itertools import combinations
 
-def read_newick_trees(file_path):
-    """
-    Read multiple Newick trees from a text file.
-    """
-    trees = []
-    try:
-        with open(file_path, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line:
-                    trees.append(line)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"File not found: {file_path}")
-    return trees
-
-def extract_values(newick_str):
-    """
-    Extract sequence names (including naive), weights, and branch lengths from a Newick string.
-    """
-    weights = {}
-    branch_lengths = {}
-    
-    parts = newick_str.replace('(', ',').replace(')', ',').strip(';').split(',')
-    
-    for part in parts:
-        part = part.strip()
-        if part and '@' in part and ':' in part:
-            name_weight, branch = part.split(':')
-            name, weight = name_weight.split('@')
-            name = name.strip()
-            weights[name] = float(weight)
-            branch_lengths[name] = float(branch)
-    
-    return weights, branch_lengths
+from tree_model import load_trees
 
 def sort_sequences(sequences):
     """
@@ -74,8 +40,7 @@ def create_matrices(trees):
     """
     all_sequences = set()
     for tree in trees:
-        weights, _ = extract_values(tree)
-        all_sequences.update(weights.keys())
+        all_sequences.update(tree.names)
     
     seq_list = sort_sequences(list(all_sequences))
     n_trees = len(trees)
@@ -85,7 +50,8 @@ def create_matrices(trees):
     branch_matrix = np.zeros((n_trees, n_sequences))
     
     for i, tree in enumerate(trees):
-        weights, branches = extract_values(tree)
+        weights = tree.to_dict("weight")
+        branches = tree.to_dict("branch_length")
         for j, seq in enumerate(seq_list):
             weight_matrix[i, j] = weights.get(seq, 0)
             branch_matrix[i, j] = branches.get(seq, 0)
@@ -108,12 +74,12 @@ def analyze_tree_pairs(trees):
     # Analyze all pairs of trees
     for (i, tree1), (j, tree2) in combinations(enumerate(trees), 2):
         # Extract nodes for each tree
-        nodes1, _ = extract_values(tree1)
-        nodes2, _ = extract_values(tree2)
+        nodes1 = set(tree1.names)
+        nodes2 = set(tree2.names)
         
         # Find common and uncommon nodes
-        common_nodes = set(nodes1.keys()) & set(nodes2.keys())
-        all_nodes = set(nodes1.keys()) | set(nodes2.keys())
+        common_nodes = nodes1 & nodes2
+        all_nodes = nodes1 | nodes2
         uncommon_nodes = all_nodes - common_nodes
         
         # Get indices for common and uncommon nodes
@@ -167,7 +133,7 @@ def main():
     output_file = base_path / "node_comparison_results.txt"
     
     # Read trees and analyze
-    trees = read_newick_trees(input_file)
+    trees = load_trees(input_file)
     weight_results, branch_results = analyze_tree_pairs(trees)
     
     # Write results to file
@@ -1,35 +1,8 @@
-import os
 import argparse
 from pathlib import Path
 import numpy as np
 
-def read_newick_trees(file_path):
-    trees = []
-    try:
-        with open(file_path, 'r') as file:
-            for line in file:
-                line = line.strip()
-                if line:
-                    trees.append(line)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"File not found: {file_path}")
-    return trees
-
-def extract_values(newick_str):
-    weights = {}
-    branch_lengths = {}
-    parts = newick_str.replace('(', ',').replace(')', ',').strip(';').split(',')
-    
-    for part in parts:
-        part = part.strip()
-        if part and '@' in part and ':' in part:
-            name_weight, branch = part.split(':')
-            name, weight = name_weight.split('@')
-            name = name.strip()
-            weights[name] = float(weight)
-            branch_lengths[name] = float(branch)
-    
-    return weights, branch_lengths
+from tree_model import load_trees
 
 def sort_sequences(sequences):
     def extract_number(seq):
@@ -56,8 +29,7 @@ def min_max_normalize_matrix(matrix):
 def create_matrices(trees):
     all_sequences = set()
     for tree in trees:
-        weights, _ = extract_values(tree)
-        all_sequences.update(weights.keys())
+        all_sequences.update(tree.names)
     
     seq_list = sort_sequences(list(all_sequences))
     n_trees = len(trees)
@@ -67,7 +39,8 @@ def create_matrices(trees):
     branch_matrix = np.zeros((n_trees, n_sequences))
     
     for i, tree in enumerate(trees):
-        weights, branches = extract_values(tree)
+        weights = tree.to_dict("weight")
+        branches = tree.to_dict("branch_length")
         for j, seq in enumerate(seq_list):
             weight_matrix[i, j] = weights.get(seq, 0)
             branch_matrix[i, j] = branches.get(seq, 0)
@@ -125,7 +98,7 @@ def main():
     input_file = parser.parse_known_args()[0].input
     output_file = base_path / "normalized_pairwise_differences_60.txt"
     
-    trees = read_newick_trees(input_file)
+    trees = load_trees(input_file)
     normalized_weight_matrix, normalized_branch_matrix, sequence_names = create_matrices(trees)
     
     norm_weight_differences = calculate_pairwise_differences(normalized_weight_matrix)
@@ -1,103 +1,10 @@
 import argparse
 import numpy as np
-import re
 from pathlib import Path
 from itertools import combinations
 from datetime import datetime
 
-def parse_node_info(s):
-    """Extract node name without the @...:... part."""
-    if '@' in s:
-        return s.split('@')[0]
-    return s
-
-def get_all_connections(newick_str):
-    """Extract all parent-child connections from Newick string."""
-    # Remove the prefix (e.g., "60_1: ") by splitting at the first space
-    if ' ' in newick_str:
-        newick_str = newick_str.split(' ', 1)[1]
-    
-    # Remove trailing semicolon and spaces
-    newick_str = newick_str.strip().strip(';')
-    
-    connections = []
-    
-    def split_top_level(s):
-        """Split string by commas at top level only."""
-        parts = []
-        current = ""
-        level = 0
-        for c in s:
-            if c == '(':
-                level += 1
-            elif c == ')':
-                level -= 1
-            elif c == ',' and level == 0 and current:
-                parts.append(current)
-                current = ""
-                continue
-            current += c
-        if current:  # Add the last part
-            parts.append(current)
-        return parts
-
-    def process_node(node_str):
-        """Process a single node string and return its name."""
-        if '@' in node_str:
-            return node_str.split('@')[0].strip()
-        return node_str.split(':')[0].strip() if ':' in node_str else node_str.strip()
-
-    def extract_node_connections(s, parent=None):
-        """Recursively extract all connections from a tree string."""
-        local_connections = []
-        
-        if s.startswith('('):
-            # Find matching closing parenthesis
-            level = 0
-            end_idx = -1
-            for i, c in enumerate(s):
-                if c == '(':
-                    level += 1
-                elif c == ')':
-                    level -= 1
-                    if level == 0:
-                        end_idx = i
-                        break
-            
-            inner = s[1:end_idx]
-            remainder = s[end_idx + 1:]
-            
-            # Get current node name
-            current_node = process_node(remainder) if remainder else parent
-            
-            # Process all children
-            children = split_top_level(inner)
-            for child in children:
-                if '(' in child:
-                    # This is a subtree
-                    local_connections.extend(extract_node_connections(child, current_node))
-                else:
-                    # This is a leaf node
-                    child_name = process_node(child)
-                    if current_node and child_name:
-                        local_connections.append((current_node, child_name))
-            
-            if parent and current_node:
-                local_connections.append((parent, current_node))
-                
-        else:
-            # This is a leaf node
-            node_name = process_node(s)
-            if parent and node_name:
-                local_connections.append((parent, node_name))
-        
-        return local_connections
-
-    if newick_str.startswith('('):
-        # Process the main content
-        connections = extract_node_connections(newick_str, 'naive')
-    
-    return connections
+from tree_model import load_trees
 
 def create_adjacency_matrix(connections, max_seq_num=28):
     """Create adjacency matrix showing parent-child relationships."""
@@ -169,20 +76,18 @@ def main():
         f.write("=== Complete Newick String Analysis ===\n")
         f.write(f"Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
 
-        # Read and process Newick strings
-        with open(input_file, 'r') as infile:
-            newick_strings = [line.strip() for line in infile if line.strip()]
+        # Read the parsed trees
+        trees = load_trees(input_file)
 
         matrices = []
         string_ids = []
 
-        # Process each Newick string
-        for newick in newick_strings:
-            string_id = newick.split(':')[0].strip()
-            string_ids.append(string_id)
+        # Process each tree
+        for tree in trees:
+            string_ids.append(tree.tree_id)
             
-            # Process the string
-            connections = get_all_connections(newick)
+            # Process the parent-child connections
+            connections = tree.edges()
             matrix = create_adjacency_matrix(connections)
             matrices.append(matrix)
 
@@ -1,71 +1,16 @@
-import os
 import argparse
 from pathlib import Path
 import re
 import numpy as np
 
-def get_node_heights(newick_str):
-    if ': ' in newick_str:
-        newick_str = newick_str.split(': ')[1]
-    
-    heights = {'naive': 1}
-    
-    def get_next_node(s, start):
-        i = start
-        parentheses = 0
-        while i < len(s):
-            if s[i] == '(':
-                parentheses += 1
-            elif s[i] == ')':
-                parentheses -= 1
-            elif s[i] == ',' and parentheses == 0:
-                break
-            i += 1
-        return s[start:i], i
-    
-    current_height = 2
-    to_process = [(newick_str[1:-2], 'naive')]
-    
-    while to_process:
-        next_level = []
-        for content, parent in to_process:
-            i = 0
-            while i < len(content):
-                if content[i] == '(':
-                    count = 1
-                    j = i + 1
-                    while count > 0:
-                        if content[j] == '(': count += 1
-                        if content[j] == ')': count -= 1
-                        j += 1
-                    
-                    k = j
-                    while k < len(content) and content[k] not in ',);':
-                        k += 1
-                    
-                    if j < k:
-                        node = content[j:k].split('@')[0].strip()
-                        heights[node] = current_height
-                        next_level.append((content[i+1:j-1], node))
-                    i = k
-                else:
-                    node_str, next_i = get_next_node(content, i)
-                    if node_str:
-                        node = node_str.split('@')[0].strip()
-                        heights[node] = current_height
-                    i = next_i + 1
-        
-        to_process = next_level
-        current_height += 1
-    
-    return heights
+from tree_model import load_trees
 
 def create_height_matrix(trees):
     all_nodes = set()
     tree_heights = []
     
     for tree in trees:
-        heights = get_node_heights(tree)
+        heights = tree.to_dict("height")
         tree_heights.append(heights)
         all_nodes.update(heights.keys())
     
@@ -95,8 +40,7 @@ def normalize_matrix(matrix):
     return normalized
 
 def get_nodes_from_tree(tree):
-    heights = get_node_heights(tree)
-    return set(heights.keys())
+    return set(tree.names)
 
 def analyze_tree_differences():
     # Read the input file
@@ -105,8 +49,7 @@ def analyze_tree_differences():
     parser.add_argument("--input", type=Path, default=base_path / "weighted_newicks_60.txt")
     input_file = parser.parse_known_args()[0].input
     
-    with open(input_file, 'r') as f:
-        trees = [line.strip() for line in f if line.strip()]
+    trees = load_trees(input_file)
     
     # Get nodes for each tree
     tree_nodes = [get_nodes_from_tree(tree) for tree in trees]
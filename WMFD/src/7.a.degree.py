@@ -1,21 +1,9 @@
 import os
 import argparse
 from pathlib import Path
-import re
 import numpy as np
 
-class Node:
-    def __init__(self, name=None):
-        self.name = name
-        self.children = []
-        self.parent = None
-
-def clean_node_name(name):
-    """Extract the base name before @ symbol."""
-    if not name:
-        return None
-    parts = name.split('@')[0].strip()
-    return parts if parts else None
+from tree_model import load_trees
 
 def get_node_number(name):
     """Get the sequence number for ordering. Returns -1 for 'naive', number for 'seqN'."""
@@ -28,196 +16,26 @@ def get_node_number(name):
             return float('inf')
     return float('inf')
 
-def parse_custom_newick(newick_str):
-    """Parse the custom Newick format with @ symbols."""
-    def create_tree_from_string(s, pos):
-        node = Node()
-        children = []
-        current_token = []
-        
-        while pos < len(s):
-            char = s[pos]
-            
-            if char == '(':
-                child_node, new_pos = create_tree_from_string(s, pos + 1)
-                children.append(child_node)
-                pos = new_pos
-            elif char == ',':
-                if current_token:
-                    node_name = ''.join(current_token).strip()
-                    if node_name:
-                        new_node = Node(node_name)
-                        children.append(new_node)
-                    current_token = []
-                pos += 1
-            elif char == ')':
-                if current_token:
-                    node_name = ''.join(current_token).strip()
-                    if node_name:
-                        new_node = Node(node_name)
-                        children.append(new_node)
-                    current_token = []
-                pos += 1
-                # Read the label after closing parenthesis
-                while pos < len(s) and s[pos] not in ['(', ')', ',', ';']:
-                    current_token.append(s[pos])
-                    pos += 1
-                if current_token:
-                    node.name = ''.join(current_token).strip()
-                break
-            elif char == ';':
-                if current_token:
-                    node_name = ''.join(current_token).strip()
-                    if node_name:
-                        new_node = Node(node_name)
-                        children.append(new_node)
-                break
-            else:
-                current_token.append(char)
-                pos += 1
-        
-        # Set up parent-child relationships
-        node.children = children
-        for child in children:
-            child.parent = node
-            
-        return node, pos
-
-    # Clean the Newick string
-    newick_str = newick_str.strip()
-    if not newick_str.endswith(';'):
-        newick_str += ';'
-    
-    # Parse the tree
-    if newick_str.startswith('('):
-        root, _ = create_tree_from_string(newick_str, 0)
-    else:
-        root = Node(newick_str[:-1])
-    
-    return root
-
-def is_valid_node_name(name):
-    """Check if the node name is one we want to include (naive or seqN)."""
-    if not name:
-        return False
-    base_name = clean_node_name(name)
-    return base_name == 'naive' or base_name.startswith('seq')
-
-def has_branch_length(name):
-    """Check if a node has a branch length (contains ':')."""
-    return name and ':' in name
-
-def get_all_first_level_seq_nodes(node):
-    """Get all sequence nodes and unnamed nodes with branch length at the first level."""
-    first_level_nodes = set()
-    unnamed_with_length = 0
-    
-    def process_child(child):
-        if child.name:
-            if is_valid_node_name(child.name):
-                base_name = clean_node_name(child.name)
-                if base_name.startswith('seq'):
-                    first_level_nodes.add(base_name)
-                return True
-            elif has_branch_length(child.name):
-                nonlocal unnamed_with_length
-                unnamed_with_length += 1
-                return True
-        return False
-
-    # Process direct children
-    for child in node.children:
-        if not process_child(child):
-            # If child is not a valid node, check its children
-            for grandchild in child.children:
-                process_child(grandchild)
-                
-    return len(first_level_nodes) + unnamed_with_length
-
-def count_direct_children(node):
-    """Count direct children including valid nodes and unnamed nodes with branch length."""
-    count = 0
-    for child in node.children:
-        if child.name:
-            if is_valid_node_name(child.name):
-                base_name = clean_node_name(child.name)
-                if base_name.startswith('seq'):
-                    count += 1
-            elif has_branch_length(child.name):
-                count += 1
-    return count
-
-def calculate_node_degrees(root):
-    """Calculate degrees for all named nodes (naive and sequences) in the tree."""
-    degrees = {}
-    
-    def process_node(node):
-        """Process each node in the tree and calculate its degree."""
-        if node.name and is_valid_node_name(node.name):
-            base_name = clean_node_name(node.name)
-            
-            if base_name == 'naive':
-                # For naive, count all first-level sequence nodes and unnamed nodes with length
-                degrees[base_name] = get_all_first_level_seq_nodes(node)
-            else:
-                # For sequence nodes, count direct children and unnamed nodes with length
-                num_children = count_direct_children(node)
-                degrees[base_name] = num_children
-        
-        # Process all children
-        for child in node.children:
-            process_node(child)
-    
-    process_node(root)
-    return degrees
-
 def process_newick_file(file_path):
     """Process multiple Newick trees from a file and return their node degrees."""
-    all_trees_degrees = []
-    all_node_names = set()
-    
-    with open(file_path, 'r') as f:
-        newick_strings = f.readlines()
+    trees = load_trees(file_path)
     
-    print(f"Found {len(newick_strings)} lines in the file.")
+    print(f"Found {len(trees)} trees in the file.")
     
-    # First pass: collect all possible node names
-    for line in newick_strings:
-        if line.strip():
-            tree_str = re.sub(r'^.*?:\s*', '', line.strip())
-            root = parse_custom_newick(tree_str)
-            
-            def collect_names(node):
-                if node.name and is_valid_node_name(node.name):
-                    all_node_names.add(clean_node_name(node.name))
-                for child in node.children:
-                    collect_names(child)
-            
-            collect_names(root)
+    # Collect all possible node names
+    all_node_names = set()
+    for tree in trees:
+        all_node_names.update(tree.names)
     
     # Sort node names with naive first, then seq1, seq2, etc.
     sorted_node_names = sorted(all_node_names, key=get_node_number)
     print("Node names in order:", sorted_node_names)
     
-    # Second pass: calculate degrees
-    for i, line in enumerate(newick_strings, 1):
-        if line.strip():
-            try:
-                tree_str = re.sub(r'^.*?:\s*', '', line.strip())
-                root = parse_custom_newick(tree_str)
-                
-                # Calculate degrees
-                degrees = calculate_node_degrees(root)
-                
-                # Ensure all nodes are present in the degrees dictionary
-                full_degrees = {node: degrees.get(node, 0) for node in sorted_node_names}
-                all_trees_degrees.append(full_degrees)
-                
-                print(f"Processed tree {i}")
-                
-            except Exception as e:
-                print(f"Error processing tree {i}: {str(e)}")
-                continue
+    # Ensure all nodes are present in each tree's degrees dictionary
+    all_trees_degrees = []
+    for tree in trees:
+        degrees = tree.to_dict("degree")
+        all_trees_degrees.append({node: degrees.get(node, 0) for node in sorted_node_names})
     
     if not all_trees_degrees:
         raise Exception("No trees were successfully processed")
@@ -1,3 +1,4 @@
+import argparse
 import pandas as pd
 import os
 from pathlib import Path
@@ -60,17 +61,64 @@ def calculate_wmfd(row, lambda1, lambda2, lambda3, lambda4, lambda5):
         print(f"Error calculating WMFD for {row['Tree_Pair']}: {str(e)}")
         return None
 
+# Coefficient of each lambda in the WMFD of a row (common + penalty * uncommon).
+LAMBDA_FEATURES = ["BL", "Weight", "Degree", "Height"]
+
+def wmfd_components(df):
+    """(n_rows, 5) component matrix: WMFD = components @ [λ₁..λ₅] for every row."""
+    penalty = df['Penalty'].astype(float).to_numpy()
+    cols = []
+    for feat in LAMBDA_FEATURES:
+        common = df[f'Normalized_Common_{feat}'].astype(float).fillna(0).to_numpy()
+        uncommon = df[f'Normalized_Uncommon_{feat}'].astype(float).fillna(0).to_numpy()
+        cols.append(common + penalty * uncommon)
+    cols.append(df['Normalized_Hamming_Distance'].astype(float).fillna(0).to_numpy())
+    return np.column_stack(cols)
+
+def read_lambda_grid(path):
+    """λ₁..λ₅ rows from a CSV (header optional)."""
+    grid = pd.read_csv(path, header=None).apply(pd.to_numeric, errors="coerce")
+    grid = grid.dropna(how="all").to_numpy(dtype=float)  # a header row parses as NaN
+    if grid.shape[1] != 5:
+        raise ValueError(f"{path}: expected 5 lambda values per row, got {grid.shape[1]}")
+    return grid
+
+def wmfd_sweep(df, grid):
+    """WMFD of every row for every λ vector of grid: (n_rows, n_lambdas)."""
+    return wmfd_components(df) @ np.asarray(grid, dtype=float).T
+
 def main():
     try:
         # File paths
         base_path = Path(__file__).parent.parent / "simulated_data"
-        input_path = base_path / "tree_metrics 2.csv"
+        # Prefer the metrics written by pipeline.py; fall back to the legacy file.
+        default_metrics = base_path / "tree_metrics.csv"
+        if not default_metrics.exists():
+            default_metrics = base_path / "tree_metrics 2.csv"
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--metrics", type=Path, default=default_metrics)
+        parser.add_argument("--lambda_grid", type=Path, default=None,
+                            help="CSV of λ₁..λ₅ rows; writes wmfd_sweep.csv instead of prompting")
+        args = parser.parse_known_args()[0]
+        input_path = args.metrics
         output_path = base_path / "wmfd_results.csv"
         
         # Read input CSV
         print("Reading input file...")
         df = pd.read_csv(input_path)
         
+        if args.lambda_grid is not None:
+            grid = read_lambda_grid(args.lambda_grid)
+            values = wmfd_sweep(df, grid)
+            sweep_df = pd.DataFrame(np.round(values, 4), columns=[f"WMFD_{i}" for i in range(len(grid))])
+            sweep_df.insert(0, 'Tree_Pair', df['Tree_Pair'])
+            sweep_path = base_path / "wmfd_sweep.csv"
+            sweep_df.to_csv(sweep_path, index=False)
+            pd.DataFrame(grid, columns=["lambda1", "lambda2", "lambda3", "lambda4", "lambda5"]) \
+                .rename_axis("column").to_csv(base_path / "wmfd_sweep_lambdas.csv")
+            print(f"\n{len(grid)} λ vectors × {len(df)} pairs saved to: {sweep_path}")
+            return
+        
         # Get lambda values from user
         lambda1, lambda2, lambda3, lambda4, lambda5 = get_lambda_values()
         
@@ -1,3 +1,4 @@
+import argparse
 import os
 from pathlib import Path
 import pandas as pd
@@ -112,7 +113,13 @@ def print_symmetric_matrix(matrix, trees):
 def main():
     try:
         base_path = Path(__file__).parent.parent / "simulated_data"
-        input_path = base_path / "tree_metrics 2.csv"
+        # Prefer the metrics written by pipeline.py; fall back to the legacy file.
+        default_metrics = base_path / "tree_metrics.csv"
+        if not default_metrics.exists():
+            default_metrics = base_path / "tree_metrics 2.csv"
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--metrics", type=Path, default=default_metrics)
+        input_path = parser.parse_known_args()[0].metrics
         output_path = base_path / "wmfd_clustering_results.csv"
         
         print("Reading input file...")
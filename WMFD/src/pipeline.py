@@ -0,0 +1,205 @@
+"""Single-pass WMFD pipeline: trees -> tree_metrics rows -> WMFD.
+
+Computes, in one process and from one parse of the input, everything the
+numbered stages 2 → 7.c write as separate text reports:
+
+    Penalty                      (2.Penalty.py)
+    Normalized_*_Weight / _BL    (3.c)
+    Normalized_Hamming_Distance  (5.c)
+    Normalized_*_Height          (6.c)
+    Normalized_*_Degree          (7.c)
+
+and emits them as rows in the same schema as ``tree_metrics 2.csv``,
+which 8.WMFD.py and 9.DBSCAN_WMFD.py consume.  When lambda values are
+given the final WMFD per pair is written as well.
+
+Run with:  uv run python src/pipeline.py --input simulated_data/weighted_newicks_60.txt
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+from pathlib import Path
+
+import numpy as np
+
+from tree_model import TreeModel, load_trees, sort_node_names
+
+METRIC_COLUMNS = [
+    "Tree_Pair",
+    "Common_Nodes",
+    "Uncommon_Nodes",
+    "Total_Nodes",
+    "Penalty",
+    "Normalized_Common_Weight",
+    "Normalized_Uncommon_Weight",
+    "Normalized_Common_BL",
+    "Normalized_Uncommon_BL",
+    "Normalized_Common_Height",
+    "Normalized_Uncommon_Height",
+    "Normalized_Common_Degree",
+    "Normalized_Uncommon_Degree",
+    "Normalized_Hamming_Distance",
+]
+
+# (column suffix, TreeModel attribute)
+FEATURES = [
+    ("Weight", "weight"),
+    ("BL", "branch_length"),
+    ("Height", "height"),
+    ("Degree", "degree"),
+]
+
+
+def min_max_normalize_columns(matrix: np.ndarray) -> np.ndarray:
+    """Column-wise min-max scaling; constant columns become 0 (all zero) or 1."""
+    col_min = matrix.min(axis=0)
+    col_max = matrix.max(axis=0)
+    span = col_max - col_min
+    constant = span == 0
+    normalized = (matrix - col_min) / np.where(constant, 1.0, span)
+    normalized[:, constant] = (col_max[constant] != 0).astype(float)
+    return normalized
+
+
+def _feature_matrices(trees: list[TreeModel], nodes: list[str]):
+    """Presence mask plus one normalized (n_trees × n_nodes) matrix per feature."""
+    col = {name: k for k, name in enumerate(nodes)}
+    present = np.zeros((len(trees), len(nodes)), dtype=bool)
+    raw = {attr: np.zeros((len(trees), len(nodes))) for _, attr in FEATURES}
+    for i, tree in enumerate(trees):
+        cols = np.fromiter((col[n] for n in tree.names), dtype=np.intp, count=len(tree))
+        present[i, cols] = True
+        for _, attr in FEATURES:
+            raw[attr][i, cols] = getattr(tree, attr)
+    return present, {attr: min_max_normalize_columns(m) for attr, m in raw.items()}
+
+
+def _edge_codes(tree: TreeModel, col: dict[str, int], n_nodes: int) -> np.ndarray:
+    """Parent→child edges encoded as sorted ``parent * n_nodes + child`` integers."""
+    child = np.nonzero(tree.parent >= 0)[0]
+    if child.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    g = np.fromiter((col[n] for n in tree.names), dtype=np.int64, count=len(tree))
+    return np.unique(g[tree.parent[child]] * n_nodes + g[child])
+
+
+def compute_tree_metrics(trees: list[TreeModel]) -> list[dict]:
+    """Return one tree_metrics row (see ``METRIC_COLUMNS``) per tree pair i < j."""
+    nodes = sort_node_names({n for t in trees for n in t.names})
+    col = {name: k for k, name in enumerate(nodes)}
+    present, normalized = _feature_matrices(trees, nodes)
+
+    # Hamming distance between adjacency matrices == size of the symmetric
+    # difference of the edge sets; "nodes" are those touching any edge.
+    edges = [_edge_codes(t, col, len(nodes)) for t in trees]
+    n_edge_nodes = [
+        np.unique(np.concatenate([e // len(nodes), e % len(nodes)])).size for e in edges
+    ]
+
+    rows = []
+    n = len(trees)
+    for i in range(n - 1):
+        others = slice(i + 1, n)
+        common = present[i] & present[others]
+        uncommon = present[i] ^ present[others]
+        n_common = common.sum(axis=1)
+        n_uncommon = uncommon.sum(axis=1)
+        total = n_common + n_uncommon
+
+        averages = {}
+        for suffix, attr in FEATURES:
+            diff = np.abs(normalized[attr][i] - normalized[attr][others])
+            averages[suffix] = (
+                np.divide((diff * common).sum(axis=1), n_common,
+                          out=np.zeros(len(n_common)), where=n_common > 0),
+                np.divide((diff * uncommon).sum(axis=1), n_uncommon,
+                          out=np.zeros(len(n_uncommon)), where=n_uncommon > 0),
+            )
+
+        for k, j in enumerate(range(i + 1, n)):
+            hamming = np.setxor1d(edges[i], edges[j], assume_unique=True).size
+            norm_factor = n_edge_nodes[i] + n_edge_nodes[j] - 2
+            row = {
+                "Tree_Pair": f"(T_{i + 1},T_{j + 1})",
+                "Common_Nodes": int(n_common[k]),
+                "Uncommon_Nodes": int(n_uncommon[k]),
+                "Total_Nodes": int(total[k]),
+                "Penalty": 1 - n_common[k] / total[k] if total[k] else 0.0,
+            }
+            for suffix, _ in FEATURES:
+                row[f"Normalized_Common_{suffix}"] = float(averages[suffix][0][k])
+                row[f"Normalized_Uncommon_{suffix}"] = float(averages[suffix][1][k])
+            row["Normalized_Hamming_Distance"] = hamming / norm_factor if norm_factor > 0 else 0.0
+            rows.append(row)
+    return rows
+
+
+def calculate_wmfd(row: dict, lambda1, lambda2, lambda3, lambda4, lambda5) -> float:
+    """WMFD of one metrics row; the penalty only applies to the uncommon part."""
+    common_part = (
+        lambda1 * row["Normalized_Common_BL"] +
+        lambda2 * row["Normalized_Common_Weight"] +
+        lambda3 * row["Normalized_Common_Degree"] +
+        lambda4 * row["Normalized_Common_Height"]
+    )
+    uncommon_part = (
+        lambda1 * row["Normalized_Uncommon_BL"] +
+        lambda2 * row["Normalized_Uncommon_Weight"] +
+        lambda3 * row["Normalized_Uncommon_Degree"] +
+        lambda4 * row["Normalized_Uncommon_Height"]
+    )
+    return common_part + row["Penalty"] * uncommon_part + lambda5 * row["Normalized_Hamming_Distance"]
+
+
+def write_metrics_csv(rows: list[dict], output_path: Path) -> None:
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=METRIC_COLUMNS)
+        w.writeheader()
+        for row in rows:
+            w.writerow({
+                k: (f"{v:.4f}" if isinstance(v, float) else v) for k, v in row.items()
+            })
+
+
+def write_wmfd_csv(rows: list[dict], lambdas, output_path: Path) -> None:
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Tree_Pair", "WMFD"])
+        for row in rows:
+            w.writerow([row["Tree_Pair"], round(calculate_wmfd(row, *lambdas), 4)])
+
+
+def run_pipeline(input_file: Path, metrics_path: Path, lambdas=None,
+                 wmfd_path: Path | None = None) -> list[dict]:
+    """Parse ``input_file`` once and write the metrics (and optionally WMFD) CSVs."""
+    trees = load_trees(input_file)
+    rows = compute_tree_metrics(trees)
+    write_metrics_csv(rows, metrics_path)
+    if lambdas is not None:
+        write_wmfd_csv(rows, lambdas, wmfd_path or metrics_path.with_name("wmfd_results.csv"))
+    return rows
+
+
+def main():
+    base_path = Path(__file__).parent.parent / "simulated_data"
+    parser = argparse.ArgumentParser(description="Single-pass WMFD pipeline (stages 2 → 8).")
+    parser.add_argument("--input", type=Path, default=base_path / "weighted_newicks_60.txt")
+    parser.add_argument("--output", type=Path, default=base_path / "tree_metrics.csv")
+    parser.add_argument("--lambdas", default=None,
+                        help="λ₁..λ₅ (BL, Weight, Degree, Height, Hamming), e.g. 1,1,1,1,1")
+    parser.add_argument("--wmfd_output", type=Path, default=base_path / "wmfd_results.csv")
+    args = parser.parse_known_args()[0]
+
+    lambdas = [float(x) for x in args.lambdas.split(",")] if args.lambdas else None
+    if lambdas is not None and len(lambdas) != 5:
+        parser.error("--lambdas needs exactly 5 comma-separated values")
+
+    rows = run_pipeline(args.input, args.output, lambdas, args.wmfd_output)
+    print(f"{len(rows)} tree pairs written to: {args.output}")
+    if lambdas is not None:
+        print(f"WMFD values written to: {args.wmfd_output}")
+
+
+if __name__ == "__main__":
+    main()
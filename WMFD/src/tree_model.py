@@ -0,0 +1,342 @@
+"""Shared, compiled-once tree model for the WMFD pipeline scripts.
+
+Every numbered stage used to re-read the input file and re-parse each
+weighted Newick line with its own string-splitting parser.  This module
+parses a file once into compact per-tree arrays and caches the result
+next to the input (``<input>.model.npz``), so later stages only load
+arrays back.
+
+Input files are streamed line by line (gzip-compressed ones too), so
+memory is bounded by the compact arrays, not by the size of the text.
+
+Each input line looks like ``60_1: ((seq1@1:1,(seq3@2:1)seq2@4:2)naive@13:1);``
+where ``name@weight:branch_length`` labels every node.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+# Bump whenever the parsed representation changes, to invalidate caches.
+MODEL_VERSION = 3
+
+CACHE_SUFFIX = ".model.npz"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_CHUNK = 1 << 20
+
+_PREFIX_RE = re.compile(r"^([^(]*?):\s*(.*)$")
+
+
+@dataclass(frozen=True, eq=False)
+class TreeModel:
+    """One lineage tree as flat arrays indexed by node.
+
+    Nodes are stored in preorder, so ``parent[i] < i`` for every non-root
+    node and ``parent[root] == -1``.  Heights start at 1 for the root
+    (the naive node) and degrees count direct children.
+    """
+
+    tree_id: str
+    names: tuple[str, ...]
+    parent: np.ndarray
+    weight: np.ndarray
+    branch_length: np.ndarray
+    height: np.ndarray
+    degree: np.ndarray
+    index: dict[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "index", {n: i for i, n in enumerate(self.names)})
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def to_dict(self, attr: str) -> dict[str, float]:
+        """Map node name -> value of one per-node array (e.g. ``"height"``)."""
+        values = getattr(self, attr)
+        return {name: values[i].item() for i, name in enumerate(self.names)}
+
+    def edges(self) -> list[tuple[str, str]]:
+        """Parent-child connections as ``(parent_name, child_name)`` pairs."""
+        return [
+            (self.names[p], self.names[i])
+            for i, p in enumerate(self.parent.tolist())
+            if p >= 0
+        ]
+
+
+def split_tree_id(line: str, idx: int) -> tuple[str, str]:
+    """Split ``"60_1: (...);"`` into ``("60_1", "(...);")``.
+
+    Lines without a prefix get their 1-based line number as id.
+    """
+    line = line.strip()
+    m = _PREFIX_RE.match(line)
+    if m:
+        return m.group(1).strip(), m.group(2).strip()
+    return str(idx + 1), line
+
+
+def _parse_label(label: str) -> tuple[str, float, float]:
+    """``"seq16@4:1"`` -> ``("seq16", 4.0, 1.0)``."""
+    label = label.strip()
+    branch = 0.0
+    if ":" in label:
+        label, bl = label.rsplit(":", 1)
+        branch = float(bl) if bl.strip() else 0.0
+    weight = 1.0
+    if "@" in label:
+        label, w = label.split("@", 1)
+        weight = float(w) if w.strip() else 1.0
+    return label.strip(), weight, branch
+
+
+def parse_tree(newick: str, tree_id: str = "") -> TreeModel:
+    """Parse one weighted Newick string into a ``TreeModel``.
+
+    Unbalanced closing parentheses (``(...))naive@25:1);``, as produced by
+    1.making_weighted_newick.py) are tolerated: the trailing label is
+    attached to the outermost open node.  Unnamed internal nodes without
+    a label, such as the wrapper in ``((...)naive:1);``, are removed and
+    their children re-attached to the nearest kept ancestor.  An unnamed
+    node that carries a branch length (``(...):2``) is a placeholder: it
+    counts in its parent's degree and as a level in the heights below it,
+    as in the original per-stage parsers, but it is not exposed (no name,
+    no array entry), so name-based stages only see ``name@w:bl`` nodes.
+    ``parent`` links every node to its nearest labelled ancestor.
+    """
+    labels: list[str] = []
+    parents: list[int] = []
+    stack: list[int] = []
+    last: int | None = None  # node that just closed and may still get a label
+    buf: list[str] = []
+
+    def add_node(parent: int) -> int:
+        labels.append("")
+        parents.append(parent)
+        return len(labels) - 1
+
+    def flush() -> None:
+        nonlocal last
+        text = "".join(buf).strip()
+        buf.clear()
+        if not text:
+            return
+        if last is None:
+            last = add_node(stack[-1] if stack else -1)
+        labels[last] = text
+
+    for ch in newick.strip():
+        if ch == "(":
+            stack.append(add_node(stack[-1] if stack else -1))
+            last = None
+        elif ch == ",":
+            flush()
+            last = None
+        elif ch == ")":
+            flush()
+            if stack:
+                last = stack.pop()
+        elif ch == ";":
+            flush()
+            break
+        else:
+            buf.append(ch)
+    flush()
+
+    # Drop unlabelled nodes, re-attaching children to the nearest kept ancestor.
+    # Placeholders (unnamed, with a branch length) stay in this structure.
+    kept: list[int] = []          # label index of each kept node
+    kept_name: list[str] = []     # "" for placeholders
+    kept_parent: list[int] = []
+    new_index = [-1] * len(labels)
+    parsed = []
+    for i, label in enumerate(labels):
+        name, w, bl = _parse_label(label) if label else ("", 1.0, 0.0)
+        p = parents[i]
+        while p >= 0 and new_index[p] < 0:
+            p = parents[p]
+        if not name and ":" not in label:
+            parents[i] = p  # shortcut for descendants
+            continue
+        new_index[i] = len(kept)
+        kept.append(i)
+        kept_name.append(name)
+        kept_parent.append(new_index[p] if p >= 0 else -1)
+        parsed.append((w, bl))
+
+    # Height and degree on the kept structure: a placeholder is a level and a child.
+    full_height = np.ones(len(kept), dtype=np.int32)
+    for i, p in enumerate(kept_parent):
+        if p >= 0:
+            full_height[i] = full_height[p] + 1
+    full_parent = np.asarray(kept_parent, dtype=np.int64)
+    has_parent = full_parent >= 0
+    full_degree = np.bincount(full_parent[has_parent], minlength=len(kept)).astype(np.int32)
+
+    # Only labelled nodes are exposed; their parent is the nearest labelled ancestor.
+    out_index = [-1] * len(kept)
+    names: list[str] = []
+    parent: list[int] = []
+    rows: list[int] = []
+    for i, name in enumerate(kept_name):
+        if not name:
+            continue
+        p = kept_parent[i]
+        while p >= 0 and not kept_name[p]:
+            p = kept_parent[p]
+        out_index[i] = len(names)
+        names.append(name)
+        parent.append(out_index[p] if p >= 0 else -1)
+        rows.append(i)
+
+    parent_arr = np.asarray(parent, dtype=np.int32)
+    height = full_height[rows] if rows else np.zeros(0, dtype=np.int32)
+    degree = full_degree[rows] if rows else np.zeros(0, dtype=np.int32)
+    weight = [parsed[i][0] for i in rows]
+    branch = [parsed[i][1] for i in rows]
+
+    return TreeModel(
+        tree_id=tree_id,
+        names=tuple(names),
+        parent=parent_arr,
+        weight=np.asarray(weight, dtype=float),
+        branch_length=np.asarray(branch, dtype=float),
+        height=height,
+        degree=degree,
+    )
+
+
+def iter_records(lines):
+    """Yield ``(tree_id, newick)`` for every non-empty line, lazily."""
+    k = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        yield split_tree_id(line, k)
+        k += 1
+
+
+def parse_lines(lines) -> list[TreeModel]:
+    """Parse every non-empty line into a ``TreeModel``."""
+    return [parse_tree(newick, tree_id) for tree_id, newick in iter_records(lines)]
+
+
+def _open_binary(path: Path):
+    with open(path, "rb") as f:
+        gz = f.read(2) == _GZIP_MAGIC
+    return gzip.open(path, "rb") if gz else open(path, "rb")
+
+
+def iter_file_lines(path: Path | str):
+    """Decoded lines of a (possibly gzipped) text file, one at a time."""
+    with _open_binary(Path(path)) as f:
+        for raw in f:
+            yield raw.decode("utf-8")
+
+
+def iter_file_records(path: Path | str):
+    """Stream ``(tree_id, newick)`` records of a weighted Newick file."""
+    return iter_records(iter_file_lines(path))
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# --- compiled cache ---
+
+def _cache_path(path: Path) -> Path:
+    return path.with_name(path.name + CACHE_SUFFIX)
+
+
+def _pack(trees: list[TreeModel], digest: str) -> dict[str, np.ndarray]:
+    sizes = [len(t) for t in trees]
+    offsets = np.zeros(len(trees) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    def cat(attr, dtype):
+        parts = [getattr(t, attr) for t in trees]
+        return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype)
+
+    return {
+        "version": np.asarray(MODEL_VERSION),
+        "digest": np.asarray(digest),
+        "tree_ids": np.asarray([t.tree_id for t in trees], dtype=str),
+        "offsets": offsets,
+        "names": np.asarray([n for t in trees for n in t.names], dtype=str),
+        "parent": cat("parent", np.int32),
+        "weight": cat("weight", float),
+        "branch_length": cat("branch_length", float),
+        "height": cat("height", np.int32),
+        "degree": cat("degree", np.int32),
+    }
+
+
+def _unpack(z) -> list[TreeModel]:
+    offsets = z["offsets"]
+    names = z["names"].tolist()
+    arrays = {k: z[k] for k in ("parent", "weight", "branch_length", "height", "degree")}
+    trees = []
+    for t, tree_id in enumerate(z["tree_ids"].tolist()):
+        a, b = int(offsets[t]), int(offsets[t + 1])
+        trees.append(TreeModel(
+            tree_id=tree_id,
+            names=tuple(names[a:b]),
+            **{k: v[a:b] for k, v in arrays.items()},
+        ))
+    return trees
+
+
+def load_trees(path: Path | str, use_cache: bool = True) -> list[TreeModel]:
+    """Load every tree of a weighted Newick file, parsing it at most once.
+
+    The compiled arrays are stored in ``<path>.model.npz`` together with a
+    hash of the file contents, so an edited input is re-parsed
+    automatically.  Failing to write the cache is not an error.
+    """
+    path = Path(path)
+    digest = _file_digest(path)
+    cache = _cache_path(path)
+
+    if use_cache and cache.exists():
+        try:
+            with np.load(cache) as z:
+                if int(z["version"]) == MODEL_VERSION and str(z["digest"]) == digest:
+                    return _unpack(z)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    trees = parse_lines(iter_file_lines(path))
+
+    if use_cache:
+        tmp = cache.with_name(cache.name + f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, **_pack(trees, digest))
+            os.replace(tmp, cache)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+    return trees
+
+
+def sort_node_names(names) -> list[str]:
+    """Sort node names with naive first, then seqN numerically, then the rest."""
+    def key(name):
+        if name == "naive":
+            return (0, 0, name)
+        if name.startswith("seq") and name[3:].isdigit():
+            return (1, int(name[3:]), name)
+        return (2, 0, name)
+    return sorted(names, key=key)
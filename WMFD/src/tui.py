@@ -45,9 +45,12 @@ MAX_LINES = 500
 class ScriptEntry:
     filename: str
     output: str
+    in_process: bool = False
 
 
 SCRIPTS: list[ScriptEntry] = [
+    # Computes every metric of 2 → 7.c in one pass, without a subprocess.
+    ScriptEntry("pipeline.py", "tree_metrics.csv", in_process=True),
     ScriptEntry("2.Penalty.py", "penalties.txt"),
     ScriptEntry(
         "3.a.weight_BL_matrices_with_normalized_matrices_text_output.py",
@@ -105,6 +108,14 @@ def _truncate(text: str, max_lines: int) -> tuple[str, int]:
     return "\n".join(head), overflow
 
 
+def _run_in_process(output_path: Path) -> tuple[int, str, str]:
+    """Run the fused pipeline in this process; returns (returncode, stdout, stderr)."""
+    import pipeline
+
+    rows = pipeline.run_pipeline(INPUT_FILE, output_path)
+    return 0, f"{len(rows)} tree pairs written to: {output_path}\n", ""
+
+
 @dataclass
 class RunResult:
     script: ScriptEntry
@@ -355,16 +366,20 @@ class WMFDApp(App[None]):
         entry = SCRIPTS[idx]
         script_path = SRC_DIR / entry.filename
         try:
-            proc = subprocess.run(
-                [sys.executable, str(script_path), "--input", str(INPUT_FILE)],
-                capture_output=True,
-                text=True,
-                encoding="utf-8",
-                errors="replace",
-                cwd=str(SRC_DIR),
-            )
             output_path = DATA_DIR / entry.output
-            if proc.returncode == 0 and output_path.exists():
+            if entry.in_process:
+                returncode, stdout, stderr = _run_in_process(output_path)
+            else:
+                proc = subprocess.run(
+                    [sys.executable, str(script_path), "--input", str(INPUT_FILE)],
+                    capture_output=True,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    cwd=str(SRC_DIR),
+                )
+                returncode, stdout, stderr = proc.returncode, proc.stdout, proc.stderr
+            if returncode == 0 and output_path.exists():
                 raw = output_path.read_text(encoding="utf-8", errors="replace")
                 txt, truncated = _truncate(raw, MAX_LINES)
                 output_size = output_path.stat().st_size
@@ -372,9 +387,9 @@ class WMFDApp(App[None]):
                 txt, truncated, output_size = "", 0, 0
             result = RunResult(
                 script=entry,
-                returncode=proc.returncode,
-                stdout=proc.stdout,
-                stderr=proc.stderr,
+                returncode=returncode,
+                stdout=stdout,
+                stderr=stderr,
                 output_path=output_path,
                 output_text=txt,
                 output_size=output_size,
@@ -0,0 +1,159 @@
+"""Regression checks of the stage scripts on the shipped simulated data.
+
+Stages 2, 3.a, 3.b, 3.c and 4 only look at labelled ``name@w:bl`` nodes,
+so their reports must stay byte-identical to the ones written before the
+shared tree model (digests below).  The single-pass pipeline must agree
+with the staged reports it replaces.
+
+Run with:  python -m unittest discover -s WMFD/tests
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+WMFD_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = WMFD_DIR / "src"
+INPUT = WMFD_DIR / "simulated_data" / "weighted_newicks_60.txt"
+
+sys.path.insert(0, str(SRC_DIR))
+
+import tree_model  # noqa: E402
+
+# simulated_data/weighted_newicks_60.txt the digests below were taken from
+INPUT_SHA256 = "a8b5d3e9549674f68fd2bd145b3525c2f46b0d90ce21c369aca5f5bd8b8659b1"
+
+# stage script -> (report, sha256 of the baseline report)
+BASELINE = {
+    "2.Penalty.py": (
+        "penalties.txt",
+        "47eea47ca6ad64e72ab214caae6026789f8094235e8af4058f96c84739c8c573"),
+    "3.a.weight_BL_matrices_with_normalized_matrices_text_output.py": (
+        "matrices_with_normalization_60.txt",
+        "bbea7d610265ab449c5f5cce56cf8e0e65c7fa10f062150a2c76d22944f53e27"),
+    "3.b.BL_W_sum_common_uncommon.py": (
+        "node_comparison_results.txt",
+        "cc83ba43d0d83a0fc01a163cbaeb93968bd60504aa29cf8def180927df583013"),
+    "3.c.BL_W_normalized_sum_common_uncommon.py": (
+        "node_comparison_normalized_results.txt",
+        "8e16124131592e57188f5427d4b58ad8658824ab97fee51fe2d63ecfecadc042"),
+    "4.BL_W_differences_matrix.py": (
+        "normalized_pairwise_differences_60.txt",
+        "e559801ae77bd4e829ca30257bf858ebe252dabfd1571b35cffd17a3e815f5ba"),
+}
+
+# staged reports the pipeline columns are checked against
+PIPELINE_STAGES = [
+    "2.Penalty.py",
+    "3.c.BL_W_normalized_sum_common_uncommon.py",
+    "6.c.height_normalized_sum_common_uncommon.py",
+    "7.c.degree_normalized_sum_common_uncommon.py",
+]
+
+_PAIR_RE = re.compile(r"^Tree_(\d+)(?:_vs_|-)Tree_(\d+)\s+(\S+)\s+(\S+)\s+(\d+)\s+(\d+)\s*$")
+
+
+def _sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _pair_rows(path: Path, section: str = "") -> dict[tuple[int, int], tuple[str, str, int, int]]:
+    """
+    ``Tree_i_vs_Tree_j  common  uncommon  #common  #uncommon`` rows of a
+    report, from the part after the first title line containing ``section``.
+    """
+    rows = {}
+    inside = not section
+    for line in path.read_text().splitlines():
+        if line.rstrip().endswith(":") and not _PAIR_RE.match(line):
+            inside = section in line
+            continue
+        m = _PAIR_RE.match(line)
+        if m and inside:
+            i, j, com, unc, n_com, n_unc = m.groups()
+            rows[(int(i), int(j))] = (com, unc, int(n_com), int(n_unc))
+    return rows
+
+
+@unittest.skipUnless(INPUT.exists() and _sha256(INPUT) == INPUT_SHA256,
+                     "shipped simulated_data/weighted_newicks_60.txt not available")
+class StageOutputTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # the stages write next to their input, so run them on a copy
+        cls.tmp = Path(tempfile.mkdtemp())
+        shutil.copytree(SRC_DIR, cls.tmp / "src", ignore=shutil.ignore_patterns("__pycache__"))
+        (cls.tmp / "simulated_data").mkdir()
+        shutil.copy(INPUT, cls.tmp / "simulated_data" / INPUT.name)
+        cls.data = cls.tmp / "simulated_data"
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def run_stage(self, script: str) -> None:
+        subprocess.run([sys.executable, script], cwd=self.tmp / "src", check=True,
+                       stdout=subprocess.DEVNULL)
+
+    def test_name_based_stages_match_baseline(self):
+        for script, (report, digest) in BASELINE.items():
+            with self.subTest(script=script):
+                self.run_stage(script)
+                self.assertEqual(_sha256(self.data / report), digest)
+
+    def test_pipeline_matches_staged_reports(self):
+        for script in PIPELINE_STAGES:
+            self.run_stage(script)
+        self.run_stage("pipeline.py")
+        with open(self.data / "tree_metrics.csv", newline="") as f:
+            rows = {tuple(int(x) for x in re.findall(r"\d+", r["Tree_Pair"])): r
+                    for r in csv.DictReader(f)}
+
+        penalties = {}
+        for line in (self.data / "penalties.txt").read_text().splitlines():
+            i, j, p = re.match(r"Penalty\(Tree_(\d+), Tree_(\d+)\)= (\S+)", line).groups()
+            penalties[(int(i), int(j))] = p
+        reports = {
+            "Weight": _pair_rows(self.data / "node_comparison_normalized_results.txt", "Weight"),
+            "BL": _pair_rows(self.data / "node_comparison_normalized_results.txt", "Branch Length"),
+            "Height": _pair_rows(self.data / "height_sums_common_uncommon_normalized.txt"),
+            "Degree": _pair_rows(self.data / "degree_comparison_normalized_results.txt"),
+        }
+
+        self.assertEqual(set(rows), set(penalties))
+        for pair, row in rows.items():
+            self.assertEqual(row["Penalty"], penalties[pair], pair)
+            for feature, report in reports.items():
+                com, unc, n_com, n_unc = report[pair]
+                self.assertEqual(row[f"Normalized_Common_{feature}"], com, (pair, feature))
+                self.assertEqual(row[f"Normalized_Uncommon_{feature}"], unc, (pair, feature))
+                self.assertEqual((int(row["Common_Nodes"]), int(row["Uncommon_Nodes"])),
+                                 (n_com, n_unc), (pair, feature))
+
+
+class PlaceholderNodeTest(unittest.TestCase):
+    """Unnamed nodes with a branch length count in degree/height, not in names."""
+
+    def test_placeholder_is_structure_only(self):
+        t = tree_model.parse_tree("((seq1@1:1,(seq3@2:1,seq4@1:1):2)seq2@4:2)naive@13:1);")
+        self.assertEqual(t.names, ("naive", "seq2", "seq1", "seq3", "seq4"))
+        self.assertEqual(t.to_dict("degree"), {"naive": 1, "seq2": 2, "seq1": 0, "seq3": 0, "seq4": 0})
+        self.assertEqual(t.to_dict("height"), {"naive": 1, "seq2": 2, "seq1": 3, "seq3": 4, "seq4": 4})
+        self.assertIn(("seq2", "seq3"), t.edges())
+
+    def test_unlabelled_wrapper_is_transparent(self):
+        t = tree_model.parse_tree("(((seq1@1:1,seq2@1:1),seq3@1:1)naive@1:1);")
+        self.assertEqual(t.to_dict("degree"), {"naive": 3, "seq1": 0, "seq2": 0, "seq3": 0})
+        self.assertEqual(t.to_dict("height"), {"naive": 1, "seq1": 2, "seq2": 2, "seq3": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()